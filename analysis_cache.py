@@ -0,0 +1,132 @@
+"""
+Tic-Tac-Chec analysis cache
+Transposition table in a memory-mapped file, shared by every process that
+opens it and kept between runs.
+
+The file has a header and a fixed number of buckets with two slots each,
+replaced like the slots of transposition.TranspositionTable (the first one
+keeps the deepest search, the second one the last entry). A slot is 16
+bytes: the key XOR the entry, then the entry, with the entry packed as in
+transposition.py. Writers do not take any lock: a reader only accepts a slot
+whose two words XOR to the key it looks for, so a slot that is being written
+by another process at the same time is just a miss.
+
+Bots with different evaluations must not share their scores, every bot opens
+the cache with its own namespace, which is mixed into the keys.
+
+Header (little-endian):
+
+    8 bytes  MAGIC
+    u64      number of buckets
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+from transposition import MAX_DEPTH, SCORE_OFFSET
+
+MAGIC = b'TTCACHE1'
+HEADER = struct.Struct('<8sQ')
+SLOT = struct.Struct('<QQ')
+SLOTS_PER_BUCKET = 2
+DEFAULT_SIZE_MB = 64
+
+CACHE_PATH = os.environ.get('TTC_ANALYSIS_CACHE',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'analysis_cache.bin'))
+
+# Only searches at least this deep are written, the rest are cheap to redo
+MIN_STORE_DEPTH = 2
+
+
+def namespaceKey(namespace):
+    return int.from_bytes(hashlib.blake2b(namespace.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class AnalysisCache:
+    # The file is created with sizeMB if it does not exist, otherwise it is
+    # opened with the size it already has
+    def __init__(self, path=CACHE_PATH, namespace='', sizeMB=DEFAULT_SIZE_MB, readOnly=False):
+        self.path = path
+        self.salt = namespaceKey(namespace)
+        self.readOnly = readOnly
+
+        if not readOnly and not os.path.exists(path):
+            self.__create(path, sizeMB)
+
+        with open(path, 'rb' if readOnly else 'r+b') as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ if readOnly else mmap.ACCESS_WRITE)
+
+        magic, self.bucketCount = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or len(self.data) < HEADER.size + self.bucketCount * SLOTS_PER_BUCKET * SLOT.size:
+            self.data.close()
+            raise ValueError('%s is not an analysis cache' % path)
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __create(self, path, sizeMB):
+        bucketCount = max(1, int(sizeMB * (1 << 20)) // (SLOT.size * SLOTS_PER_BUCKET))
+        # Another process can be creating it at the same time, the file is
+        # written under a temporary name and linked when it is complete, so
+        # the first one wins and nobody maps half a header
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporaryPath = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporaryPath, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, bucketCount))
+            fp.truncate(HEADER.size + bucketCount * SLOTS_PER_BUCKET * SLOT.size)
+        try:
+            os.link(temporaryPath, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporaryPath)
+
+    def __offset(self, key):
+        return HEADER.size + (key % self.bucketCount) * SLOTS_PER_BUCKET * SLOT.size
+
+    def probe(self, key):
+        # Returns (depth, score, bound, move) of the position or None
+        self.probes += 1
+        key ^= self.salt
+        offset = self.__offset(key)
+        for slotOffset in (offset, offset + SLOT.size):
+            check, entry = SLOT.unpack_from(self.data, slotOffset)
+            if entry and check ^ entry == key:
+                self.hits += 1
+                return ((entry >> 3) & 0xFF, ((entry >> 19) & 0xFFFF) - SCORE_OFFSET,
+                        (entry >> 1) & 3, (entry >> 11) & 0xFF)
+
+        return None
+
+    def store(self, key, depth, score, bound, move=0):
+        if self.readOnly or depth < MIN_STORE_DEPTH:
+            return
+
+        self.stores += 1
+        key ^= self.salt
+        entry = (1 | (bound << 1) | (min(depth, MAX_DEPTH) << 3) | ((move or 0) << 11)
+                 | ((score + SCORE_OFFSET) << 19))
+
+        offset = self.__offset(key)
+        check, stored = SLOT.unpack_from(self.data, offset)
+        if stored and check ^ stored != key and depth < (stored >> 3) & 0xFF:
+            offset += SLOT.size
+
+        SLOT.pack_into(self.data, offset, key ^ entry, entry)
+
+    def flush(self):
+        if not self.readOnly:
+            self.data.flush()
+
+    def close(self):
+        if not self.data.closed:
+            self.flush()
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,185 @@
+"""
+Precomputed attack tables for the 4x4 board.
+
+Squares and masks follow the layout of bitboard.py (square = row * 4 + col).
+
+    - KNIGHT_ATTACKS[square]
+    - PAWN_PUSHES[directionIndex][square] and PAWN_ATTACKS[directionIndex][square],
+      where directionIndex is 0 for a pawn going up (-1) and 1 for a pawn going down (1)
+    - BISHOP_ATTACKS[(square << 16) | occupancy] and ROOK_ATTACKS[(square << 16) | occupancy]
+
+The slider tables are indexed by the full 16-bit occupancy of the board, so
+65,536 x 16 entries of 2 bytes each (2 MB per piece). The attack masks include
+the first blocker of every ray; callers remove the squares of their own pieces.
+
+Building the slider tables takes a moment, so the first import writes them to
+a cache file and the following imports memory-map that file.
+"""
+from array import array
+import mmap
+import os
+import sys
+
+TABLES_VERSION = 1
+HEADER = b'TTCATK' + bytes([TABLES_VERSION]) + (b'L' if sys.byteorder == 'little' else b'B') + bytes(8)
+HEADER_SIZE = len(HEADER)
+
+OCCUPANCIES = 1 << 16
+SLIDER_TABLE_SIZE = 16 * OCCUPANCIES
+
+CACHE_PATH = os.environ.get('TTC_ATTACK_TABLES',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'attack_tables.bin'))
+
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+ROOK_DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+KNIGHT_MOVEMENTS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                    (1, -2), (1, 2), (2, -1), (2, 1)]
+
+
+def _isInsideBoard(row, col):
+    return (row >= 0 and row < 4 and col >= 0 and col < 4)
+
+
+def _bit(row, col):
+    return 1 << (row * 4 + col)
+
+
+def _buildKnightAttacks():
+    attacks = []
+    for square in range(16):
+        row, col = square >> 2, square & 3
+        mask = 0
+        for deltaRow, deltaCol in KNIGHT_MOVEMENTS:
+            if _isInsideBoard(row + deltaRow, col + deltaCol):
+                mask |= _bit(row + deltaRow, col + deltaCol)
+        attacks.append(mask)
+
+    return tuple(attacks)
+
+
+def _buildPawnTables():
+    pushes = ([], [])
+    attacks = ([], [])
+    for index, direction in enumerate((-1, 1)):
+        for square in range(16):
+            row, col = square >> 2, square & 3
+            newRow = row + direction
+            push = 0
+            attack = 0
+            if _isInsideBoard(newRow, col):
+                push = _bit(newRow, col)
+                if col > 0:
+                    attack |= _bit(newRow, col - 1)
+                if col < 3:
+                    attack |= _bit(newRow, col + 1)
+            pushes[index].append(push)
+            attacks[index].append(attack)
+
+    return tuple(map(tuple, pushes)), tuple(map(tuple, attacks))
+
+
+def _rays(square, directions):
+    row, col = square >> 2, square & 3
+    rays = []
+    for deltaRow, deltaCol in directions:
+        ray = []
+        newRow, newCol = row + deltaRow, col + deltaCol
+        while _isInsideBoard(newRow, newCol):
+            ray.append(_bit(newRow, newCol))
+            newRow += deltaRow
+            newCol += deltaCol
+        rays.append(ray)
+
+    return rays
+
+
+def _slidingAttacks(rays, occupancy):
+    mask = 0
+    for ray in rays:
+        for bit in ray:
+            mask |= bit
+            # The first piece found blocks the rest of the ray
+            if occupancy & bit:
+                break
+
+    return mask
+
+
+def _buildSliderTable(directions, table):
+    for square in range(16):
+        rays = _rays(square, directions)
+        rayMask = 0
+        for ray in rays:
+            for bit in ray:
+                rayMask |= bit
+
+        # Only the squares on the rays change the result, so every distinct
+        # relevant occupancy is solved once and then spread to the full table.
+        relevant = {}
+        subset = 0
+        while True:
+            relevant[subset] = _slidingAttacks(rays, subset)
+            subset = (subset - rayMask) & rayMask
+            if subset == 0:
+                break
+
+        offset = square * OCCUPANCIES
+        table[offset:offset + OCCUPANCIES] = array('H', [relevant[occupancy & rayMask] for occupancy in range(OCCUPANCIES)])
+
+
+def buildSliderTables():
+    bishop = array('H', bytes(2 * SLIDER_TABLE_SIZE))
+    rook = array('H', bytes(2 * SLIDER_TABLE_SIZE))
+    _buildSliderTable(BISHOP_DIRECTIONS, bishop)
+    _buildSliderTable(ROOK_DIRECTIONS, rook)
+    return bishop, rook
+
+
+def _writeCache(path, bishop, rook):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so a concurrent reader never maps half a table
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'wb') as fp:
+        fp.write(HEADER)
+        bishop.tofile(fp)
+        rook.tofile(fp)
+    os.replace(tmpPath, path)
+
+
+def _mapCache(path):
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size != HEADER_SIZE + 4 * SLIDER_TABLE_SIZE:
+            return None
+        if fp.read(HEADER_SIZE) != HEADER:
+            return None
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)[HEADER_SIZE:].cast('H')
+    return view[:SLIDER_TABLE_SIZE], view[SLIDER_TABLE_SIZE:]
+
+
+def loadSliderTables(path=CACHE_PATH):
+    # Returns the (bishop, rook) tables, memory-mapped from the cache when possible
+    try:
+        tables = _mapCache(path)
+        if tables is not None:
+            return tables
+    except (OSError, ValueError):
+        pass
+
+    bishop, rook = buildSliderTables()
+    try:
+        _writeCache(path, bishop, rook)
+        tables = _mapCache(path)
+        if tables is not None:
+            return tables
+    except (OSError, ValueError):
+        # The cache is only an optimization, keep the tables in memory
+        pass
+
+    return bishop, rook
+
+
+KNIGHT_ATTACKS = _buildKnightAttacks()
+PAWN_PUSHES, PAWN_ATTACKS = _buildPawnTables()
+BISHOP_ATTACKS, ROOK_ATTACKS = loadSliderTables()
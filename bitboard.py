@@ -0,0 +1,416 @@
+"""
+Tic-Tac-Chec bitboard core
+Shared board representation used by the referee and by every bot.
+
+The 4x4 board fits in a 16-bit integer, one bit per square:
+
+    square = row * 4 + col
+    bit    = 1 << square
+
+A position keeps one mask per piece and colour plus one occupancy mask per
+colour. Piece codes follow the same convention used everywhere else:
+
+    - pawn = 1 for white, -1 for black
+    - bishop =  2 for white, -2 for black
+    - knight =  3 for white, -3 for black
+    - rook =  4 for white, -4 for black
+
+A move is packed in a single integer as (piece << 4) | targetSquare. The
+origin square is not stored because every piece exists only once: if the
+piece is on the board the move is a movement, otherwise it is a drop.
+"""
+from attack_tables import KNIGHT_ATTACKS, PAWN_PUSHES, PAWN_ATTACKS, BISHOP_ATTACKS, ROOK_ATTACKS
+
+WHITE = 1
+BLACK = -1
+
+PAWN = 1
+BISHOP = 2
+KNIGHT = 3
+ROOK = 4
+
+PIECES = (PAWN, BISHOP, KNIGHT, ROOK)
+
+FULL_BOARD = 0xFFFF
+
+ROW_MASKS = tuple(0xF << (4 * row) for row in range(4))
+COL_MASKS = tuple(0x1111 << col for col in range(4))
+DIAGONAL_MASKS = (
+    sum(1 << (i * 4 + i) for i in range(4)),
+    sum(1 << (i * 4 + 3 - i) for i in range(4)),
+)
+
+# Rows, columns and both diagonals. A colour has exactly four pieces, so it
+# wins when its occupancy mask is equal to one of these masks.
+LINE_MASKS = ROW_MASKS + COL_MASKS + DIAGONAL_MASKS
+WIN_MASKS = frozenset(LINE_MASKS)
+# Indexes in LINE_MASKS of the 2 or 3 lines through every square
+SQUARE_LINES = tuple(tuple(line for line, mask in enumerate(LINE_MASKS) if mask >> square & 1) for square in range(16))
+
+# Square of a piece that is not on the board
+OFF_BOARD = -1
+
+
+POPCOUNT = bytes(bin(mask).count('1') for mask in range(1 << 16))
+
+
+def maxAligned(occupancy):
+    # Maximum number of pieces of a color that share a line
+    return max(POPCOUNT[occupancy & line] for line in LINE_MASKS)
+
+
+def bestLine(occupancy):
+    # First line with the maximum number of pieces of a color, scanning rows,
+    # then columns and then both diagonals
+    bestCount = -1
+    bestMask = 0
+    for line in LINE_MASKS:
+        count = POPCOUNT[occupancy & line]
+        if count > bestCount:
+            bestCount = count
+            bestMask = line
+
+    return bestCount, bestMask
+
+
+def colorIndex(color):
+    return 0 if color > 0 else 1
+
+
+def squareOf(row, col):
+    return row * 4 + col
+
+
+def positionOf(square):
+    return (square >> 2, square & 3)
+
+
+def encodeMove(piece, square):
+    return (piece << 4) | square
+
+
+def movePiece(move):
+    return move >> 4
+
+
+def moveTarget(move):
+    return move & 15
+
+
+def squaresOf(mask):
+    # Iterate the squares of a mask from the lowest bit to the highest
+    squares = []
+    while mask:
+        lowBit = mask & -mask
+        squares.append(lowBit.bit_length() - 1)
+        mask ^= lowBit
+
+    return squares
+
+
+def movementMask(piece, square, pawnDirection, ownOccupancy, enemyOccupancy):
+    # Squares reachable by the piece, including captures of enemy pieces
+    allOccupancy = ownOccupancy | enemyOccupancy
+    if piece == PAWN:
+        index = 0 if pawnDirection < 0 else 1
+        # Move 1 to the front if it is empty, attack diagonally only enemy pieces
+        return ((PAWN_PUSHES[index][square] & ~allOccupancy)
+                | (PAWN_ATTACKS[index][square] & enemyOccupancy))
+    elif piece == BISHOP:
+        mask = BISHOP_ATTACKS[(square << 16) | allOccupancy]
+    elif piece == KNIGHT:
+        mask = KNIGHT_ATTACKS[square]
+    elif piece == ROOK:
+        mask = ROOK_ATTACKS[(square << 16) | allOccupancy]
+    else:
+        return 0
+
+    return mask & ~ownOccupancy
+
+
+class Bitboard:
+    def __init__(self):
+        # pieces[colorIndex][piece] -> mask of the piece, index 0 is unused
+        self.pieces = [[0] * 5, [0] * 5]
+        self.occupancy = [0, 0]
+
+    @classmethod
+    def fromBoard(cls, board):
+        bitboard = cls()
+        for row in range(4):
+            for col in range(4):
+                pieceCode = board[row][col]
+                if pieceCode != 0:
+                    bitboard.setPiece(pieceCode, squareOf(row, col))
+
+        return bitboard
+
+    def toBoard(self):
+        board = [[0] * 4 for _ in range(4)]
+        for index, color in ((0, WHITE), (1, BLACK)):
+            for piece in PIECES:
+                mask = self.pieces[index][piece]
+                if mask:
+                    row, col = positionOf(mask.bit_length() - 1)
+                    board[row][col] = piece * color
+
+        return board
+
+    def copy(self):
+        other = Bitboard()
+        other.pieces = [self.pieces[0][:], self.pieces[1][:]]
+        other.occupancy = self.occupancy[:]
+        return other
+
+    def setPiece(self, pieceCode, square):
+        index = colorIndex(pieceCode)
+        bit = 1 << square
+        self.pieces[index][abs(pieceCode)] |= bit
+        self.occupancy[index] |= bit
+
+    def removePiece(self, pieceCode, square):
+        index = colorIndex(pieceCode)
+        bit = ~(1 << square)
+        self.pieces[index][abs(pieceCode)] &= bit
+        self.occupancy[index] &= bit
+
+    def pieceAt(self, square):
+        bit = 1 << square
+        for index, color in ((0, WHITE), (1, BLACK)):
+            if self.occupancy[index] & bit:
+                pieces = self.pieces[index]
+                for piece in PIECES:
+                    if pieces[piece] & bit:
+                        return piece * color
+
+        return 0
+
+    def pieceSquare(self, color, piece):
+        mask = self.pieces[colorIndex(color)][piece]
+        return mask.bit_length() - 1 if mask else OFF_BOARD
+
+    def isWin(self, color):
+        return self.occupancy[colorIndex(color)] in WIN_MASKS
+
+    def movementMask(self, color, piece, square, pawnDirection):
+        index = colorIndex(color)
+        return movementMask(piece, square, pawnDirection,
+                            self.occupancy[index], self.occupancy[1 - index])
+
+    def generateMoves(self, color, pawnDirection, allowMovements=True, allowCaptures=True):
+        index = colorIndex(color)
+        ownOccupancy = self.occupancy[index]
+        enemyOccupancy = self.occupancy[1 - index]
+        emptySquares = FULL_BOARD & ~(ownOccupancy | enemyOccupancy)
+        pieces = self.pieces[index]
+
+        moves = []
+        for piece in PIECES:
+            mask = pieces[piece]
+            if not mask:
+                # The piece is not on the board, it can be dropped on any empty square
+                targets = emptySquares
+            elif allowMovements:
+                square = mask.bit_length() - 1
+                targets = movementMask(piece, square, pawnDirection, ownOccupancy, enemyOccupancy)
+                if not allowCaptures:
+                    targets &= ~enemyOccupancy
+            else:
+                continue
+
+            for target in squaresOf(targets):
+                moves.append((piece << 4) | target)
+
+        return moves
+
+    def applyMove(self, color, move):
+        # Returns the code of the captured piece, 0 if there was no capture
+        piece = move >> 4
+        target = move & 15
+        index = colorIndex(color)
+        targetBit = 1 << target
+
+        captured = 0
+        enemyIndex = 1 - index
+        if self.occupancy[enemyIndex] & targetBit:
+            enemyPieces = self.pieces[enemyIndex]
+            for enemyPiece in PIECES:
+                if enemyPieces[enemyPiece] & targetBit:
+                    enemyPieces[enemyPiece] ^= targetBit
+                    captured = -enemyPiece * color
+                    break
+            self.occupancy[enemyIndex] ^= targetBit
+
+        pieces = self.pieces[index]
+        originMask = pieces[piece]
+        pieces[piece] = targetBit
+        self.occupancy[index] = (self.occupancy[index] & ~originMask) | targetBit
+
+        return captured
+
+
+# Helpers to work directly over the list of lists boards that the referee
+# hands to the bots.
+
+def occupancyOf(board):
+    white = 0
+    black = 0
+    bit = 1
+    for row in board:
+        for pieceCode in row:
+            if pieceCode > 0:
+                white |= bit
+            elif pieceCode < 0:
+                black |= bit
+            bit <<= 1
+
+    return white, black
+
+
+def getValidMovements(pieceCode, position, board, pawnDirection):
+    white, black = occupancyOf(board)
+    if pieceCode > 0:
+        ownOccupancy, enemyOccupancy = white, black
+    else:
+        ownOccupancy, enemyOccupancy = black, white
+
+    square = squareOf(position[0], position[1])
+    mask = movementMask(abs(pieceCode), square, pawnDirection, ownOccupancy, enemyOccupancy)
+
+    return [positionOf(target) for target in squaresOf(mask)]
+
+
+# Kinds of move decoded from the difference between two boards
+DROP = 1
+MOVEMENT = 2
+CAPTURE = 3
+
+
+def decodeMove(oldBoard, newBoard, color, pawnDirection):
+    # Decodes the move of the color from the difference between two boards in
+    # a single pass and checks it against the attack tables. Returns
+    # (kind, piece, origin, target) with origin -1 for a drop, or None if the
+    # new board is not the old one after one legal move of the color.
+    ownOccupancy = 0
+    enemyOccupancy = 0
+    # Bit per piece of the color that is on the old board
+    ownPieces = 0
+    changes = []
+
+    square = 0
+    for oldRow, newRow in zip(oldBoard, newBoard):
+        for oldCode, newCode in zip(oldRow, newRow):
+            if oldCode * color > 0:
+                ownOccupancy |= 1 << square
+                ownPieces |= 1 << abs(oldCode)
+            elif oldCode:
+                enemyOccupancy |= 1 << square
+
+            if oldCode != newCode:
+                # A move changes 1 square (drop) or 2 squares (movement or capture)
+                if len(changes) == 2:
+                    return None
+                changes.append((square, oldCode, newCode))
+            square += 1
+
+    if len(changes) == 1:
+        target, oldCode, newCode = changes[0]
+        piece = abs(newCode)
+        # Only a piece that is not on the board can be dropped, on an empty square
+        if oldCode == 0 and newCode * color > 0 and piece in PIECES and not ownPieces & (1 << piece):
+            return (DROP, piece, -1, target)
+        return None
+
+    if len(changes) != 2:
+        return None
+
+    # The origin is the square that was left empty
+    if changes[0][2] == 0:
+        (origin, pieceCode, left), (target, oldCode, newCode) = changes
+    else:
+        (target, oldCode, newCode), (origin, pieceCode, left) = changes
+
+    if left != 0 or pieceCode * color <= 0 or newCode != pieceCode or oldCode * color > 0:
+        return None
+
+    piece = abs(pieceCode)
+    if not movementMask(piece, origin, pawnDirection, ownOccupancy, enemyOccupancy) & (1 << target):
+        return None
+
+    return (CAPTURE if oldCode else MOVEMENT, piece, origin, target)
+
+
+def isWinningPosition(board, color):
+    white, black = occupancyOf(board)
+    return (white if color > 0 else black) in WIN_MASKS
+
+
+# Line patterns. A square holds one of 9 values, the piece code modulo 9:
+# 0 when it is empty, 1-4 for the white pieces and 5-8 for the black ones.
+# The 4 squares of a line, from the lowest to the highest, are the digits of
+# a number in base 9, so every line of every board is one of 9^4 codes.
+
+LINE_CODES = 9 ** 4
+# Squares of every line of LINE_MASKS, from the lowest digit to the highest
+LINE_SQUARES = tuple(tuple(squaresOf(line)) for line in LINE_MASKS)
+
+
+def _linePattern(code, color):
+    ownCount = 0
+    opponentCount = 0
+    # Bit piece - 1 for every piece of the color that is not in the line
+    missingMask = 0xF
+    # Bit digit for every square of the line with a piece of the color
+    ownSquares = 0
+    for digit in range(4):
+        value = code // 9 ** digit % 9
+        if value == 0:
+            continue
+        pieceCode = value if value <= 4 else value - 9
+        if pieceCode * color > 0:
+            ownCount += 1
+            missingMask &= ~(1 << (abs(pieceCode) - 1))
+            ownSquares |= 1 << digit
+        else:
+            opponentCount += 1
+
+    return ownCount, opponentCount, missingMask, ownCount == 4, ownSquares
+
+
+# LINE_PATTERNS[colorIndex(color)][code] is (own count, opponent count,
+# missing pieces mask, is win, own squares mask) of the line for that color
+LINE_PATTERNS = tuple(tuple(_linePattern(code, color) for code in range(LINE_CODES)) for color in (WHITE, BLACK))
+
+
+def lineCodes(board):
+    # Code of every line of LINE_MASKS
+    digits = [pieceCode % 9 for row in board for pieceCode in row]
+    return [digits[a] + 9 * digits[b] + 81 * digits[c] + 729 * digits[d] for a, b, c, d in LINE_SQUARES]
+
+
+def alignment(board, color):
+    # Line with the most pieces of a color, the first one of the rows, then
+    # the columns and then the diagonals. Returns the number of pieces, the
+    # codes of the pieces in the line and of the ones that are not, the
+    # positions of the line without a piece of the color and the ones with
+    patterns = LINE_PATTERNS[colorIndex(color)]
+    codes = lineCodes(board)
+    counts = [patterns[code][0] for code in codes]
+    bestCount = max(counts)
+
+    targetNumbers = {1, 2, 3, 4} if color == WHITE else {-1, -2, -3, -4}
+    if bestCount == 0:
+        return 0, set(), set(targetNumbers), set(), set()
+
+    bestLine = counts.index(bestCount)
+    _, _, missingMask, _, ownSquares = patterns[codes[bestLine]]
+    alignedNumbers = {color * piece for piece in PIECES if not missingMask & (1 << (piece - 1))}
+    missingPositions = set()
+    alignedPositions = set()
+    for digit, square in enumerate(LINE_SQUARES[bestLine]):
+        if ownSquares & (1 << digit):
+            alignedPositions.add(positionOf(square))
+        else:
+            missingPositions.add(positionOf(square))
+
+    return bestCount, alignedNumbers, targetNumbers - alignedNumbers, missingPositions, alignedPositions
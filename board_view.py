@@ -0,0 +1,51 @@
+"""
+Tic-Tac-Chec board view
+The referee keeps one board in the frame of the white player and serves it to
+each player already oriented, instead of rotating the board 180 degrees
+before every half-move.
+
+The board is an immutable tuple of the 16 piece codes (square = row * 4 + col).
+Rotating the board 180 degrees moves square s to 15 - s, so the frame of the
+black player is the same tuple reversed, which is kept once per position.
+
+Nothing the referee keeps can be changed by a bot: the bots get new lists
+built from the tuple (most of them write their move into the board they
+receive) and the referee compares their answer with read-only rows.
+"""
+from bitboard import WHITE
+
+EMPTY_SQUARES = (0,) * 16
+
+
+class BoardView:
+    def __init__(self, squares=EMPTY_SQUARES):
+        # Piece codes in the frame of the white player
+        self.squares = squares
+        self.__blackSquares = None
+
+    @classmethod
+    def fromRows(cls, board, color=WHITE):
+        # board is seen by the player of the color
+        squares = tuple(board[0]) + tuple(board[1]) + tuple(board[2]) + tuple(board[3])
+        return cls(squares if color == WHITE else squares[::-1])
+
+    def frame(self, color):
+        # The 16 piece codes in the frame of the player of the color
+        if color == WHITE:
+            return self.squares
+        if self.__blackSquares is None:
+            self.__blackSquares = self.squares[::-1]
+        return self.__blackSquares
+
+    def rows(self, color):
+        # A new board the player of the color can write into
+        squares = self.frame(color)
+        return [list(squares[0:4]), list(squares[4:8]), list(squares[8:12]), list(squares[12:16])]
+
+    def frozenRows(self, color):
+        squares = self.frame(color)
+        return (squares[0:4], squares[4:8], squares[8:12], squares[12:16])
+
+    def afterMove(self, board, color):
+        # The view of the board the player of the color returned
+        return BoardView.fromRows(board, color)
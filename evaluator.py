@@ -27,8 +27,16 @@ The set of rules that this evaluator checks are as follows:
 
 """
 from player import TTCPlayer
-import copy
-import sys
+from bitboard import PAWN, BISHOP, KNIGHT, ROOK, PIECES, squareOf
+import bitboard
+from board_view import BoardView
+from game_state import GameState
+from event_log import ConsoleSink, isBoard, setActiveSink
+import game_record
+from latency import LatencyHistogram, MOVEMENT, PLACEMENT
+from tablebase import DRAW, loadTablebase
+from time_control import Clock, MoveTimeout, RemoteError, RemotePlayer
+import time
 import traceback
     
 class PlayerWrapper:
@@ -47,6 +55,10 @@ class PlayerWrapper:
             'invalid_moves': 0,
             'early_movements': 0,
             'exceed_max_captures': 0,
+            'timeouts': 0,
+            # Time of every call to play, by phase of the game (see latency.py)
+            'placement_latency': LatencyHistogram(),
+            'movement_latency': LatencyHistogram(),
         }
 
     def resetValues(self, color):
@@ -59,35 +71,40 @@ class PlayerWrapper:
 
 
 class TTCEvaluator:
-    def __init__(self):
+    # sink receives everything the referee and the bots report during a run,
+    # by default it is printed like always (see event_log.py).
+    # recorder receives a game_record.GameRecord at the end of every game.
+    # With a time_control.TimeControl the bots play in their own processes
+    # and lose the game when they run out of time.
+    # With tablebasePath the games that get to a position of the tablebase
+    # (see tablebase.py) end with its result, if it comes before the last turn
+    def __init__(self, sink=None, recorder=None, timeControl=None, tablebasePath=None):
+        self.sink = sink if sink is not None else ConsoleSink()
+        self.recorder = recorder
+        self.timeControl = timeControl
+        self.tablebasePath = tablebasePath
+        self.clock = None
         self.whitePlayer = None
         self.blackPlayer = None
 
         self.currentTurn = 0
         self.maxCaptures = 0
         self.maxTurns = 0
-        self.board = None
+        # The board in the frame of the white player, see board_view.py
+        self.view = BoardView()
+        self.gameNumber = 0
+        self.seed = None
+        # Moves of the game in progress and how it ended, for the recorder
+        self.moves = bytearray()
+        self.endReason = game_record.END_DRAW
 
         self.WIN = 1
         self.LOSE = -1
         self.CONTINUE = 0
 
-    def __printBoard(self, board):
-        print('-------')
-        for i in range(len(board)):
-            for j in range(len(board)):
-                if board[i][j] >= 0:
-                    print(' ', end='')
-                print(board[i][j], end='')
-            print()
-        print('-------')
-
     def __sameSign(self, a, b):
         return ((a < 0 and b < 0) or (a > 0  and b > 0))
     
-    def __isInsideBoard(self, row, col):
-        return (row >= 0 and row < 4 and col >= 0 and col < 4)
-
     def __updatePawnDirection(self, board, player):
         # If the pawn is in the limit of the board, it should reverse
         if player.piecesColor in board[0]:
@@ -97,316 +114,150 @@ class TTCEvaluator:
         if player.piecesColor in board[3]:
             player.pawnDirection = -1
 
-    def __getPawnValidMovements(self, position, board, pawnDirection):
-        validMovements = []
-        
-        row = position[0]
-        col = position[1]
-
-        # Move 1 to the front
-        newRow = row + pawnDirection
-        if self.__isInsideBoard(newRow, col) and board[newRow][col] == 0:
-            validMovements.append((newRow, col))
-
-        # Attack to the left
-        newCol = col - 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        # Attack to the right
-        newCol = col + 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
+    # Movement generation is delegated to the shared bitboard core, the
+    # per-piece methods are kept so every piece can still be queried alone.
+    def __getPieceValidMovements(self, piece, position, board, pawnDirection=-1):
+        # The color is taken from the piece that stands on the square
+        color = -1 if board[position[0]][position[1]] < 0 else 1
+        return bitboard.getValidMovements(piece * color, position, board, pawnDirection)
 
-        return validMovements
+    def __getPawnValidMovements(self, position, board, pawnDirection):
+        return self.__getPieceValidMovements(PAWN, position, board, pawnDirection)
     
     def __getBishopValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # To check whether I already encountered a piece in this diagonal or not
-        # 0 -> Up-Left Diagonal
-        # 1 -> Up-Right Diagonal
-        # 2 -> Down-Left Diagonal
-        # 3 -> Down-Right Diagonal
-        diagEncounteredPiece = [False] * 4
-
-        # Describe the direction of the movement for the bishop in the same
-        # order as described above
-        movDirection = [[-1, -1],
-                     [-1, 1],
-                     [1, -1],
-                     [1, 1]]
-
-        # A bishop can move at most 3 squares
-        for i in range(1,4):
-            # Check 4 directions of movement
-            for j in range(4):
-                newCol = col + i * movDirection[j][0]
-                newRow = row + i * movDirection[j][1]
-
-                # If I haven't found a piece yet in this direction and its inside the board
-                if not diagEncounteredPiece[j] and self.__isInsideBoard(newRow, newCol):
-                    # If the proposed square its occupied
-                    if board[newRow][newCol] != 0:
-                        # If the piece that occupies the square its from the opponent, then its a valid movement
-                        if not self.__sameSign(board[row][col], board[newRow][newCol]):
-                            validMovements.append((newRow, newCol))
-                        diagEncounteredPiece[j] = True
-                    else: # If not, just append the movement
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
+        return self.__getPieceValidMovements(BISHOP, position, board)
 
     def __getKnightValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-
-        # Describe the movements of the knight
-        movements = [[-2, 1],
-                     [-1, 2],
-                     [1, 2],
-                     [2, 1],
-                     [2, -1],
-                     [1, -2],
-                     [-1, -2],
-                     [-2, -1]]
-        
-        # Loop through all possible movements
-        for move in movements:
-            newRow = row + move[0]
-            newCol = col + move[1]
-
-            # For the knight we just need to check if the new square is valid and it is not occupied by a piece of the same color
-            if self.__isInsideBoard(newRow, newCol) and not self.__sameSign(board[row][col], board[newRow][newCol]):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
+        return self.__getPieceValidMovements(KNIGHT, position, board)
 
     def __getRookValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Checks whether or not I have found a piece in this direction
-        # 0 - Up
-        # 1 - Right
-        # 2 - Down
-        # 3 - Left
-        dirPieceEncountered = [False] * 4
-
-        # Describe the direction of movement for the rook
-        # The order is the same as described above
-        movDirection = [[-1, 0],
-                        [0, 1],
-                        [1, 0],
-                        [0, -1]]
-        
-        # The rook can move maximum 3 squares
-        for i in range(1, 4):
-            # Loop through all possible movements
-            for j in range(4):
-                newRow = row + i * movDirection[j][0]
-                newCol = col + i * movDirection[j][1]
-
-                if not dirPieceEncountered[j] and self.__isInsideBoard(newRow, newCol):
-                    if board[newRow][newCol] != 0:
-                        if not self.__sameSign(board[newRow][newCol], board[row][col]):
-                            validMovements.append((newRow, newCol))
-                        dirPieceEncountered[j] = True
-                    else:
-                        validMovements.append((newRow, newCol))
-
-        return validMovements        
+        return self.__getPieceValidMovements(ROOK, position, board)
 
     def __getValidMovements(self, pieceCode, position, board, player):
-        if abs(pieceCode) == 1:
-            return self.__getPawnValidMovements(position, board, player.pawnDirection)
-        elif abs(pieceCode) == 2:
-            return self.__getBishopValidMovements(position, board)
-        elif abs(pieceCode) == 3:
-            return self.__getKnightValidMovements(position, board)
-        elif abs(pieceCode) == 4:
-            return self.__getRookValidMovements(position, board)
+        if abs(pieceCode) in PIECES:
+            return bitboard.getValidMovements(pieceCode, position, board, player.pawnDirection)
         else:
             print("Piece ", pieceCode, " not recognized")
             return []
 
+    # The move is decoded from the difference between the boards in a single
+    # pass, then only that move is checked against the attack tables.
+    # Returns (kind, piece, origin, target) or None if it was not a legal move.
+    def __decodeMove(self, oldBoard, newBoard, player):
+        if not isBoard(newBoard):
+            return None
+
+        move = bitboard.decodeMove(oldBoard, newBoard, player.piecesColor, player.pawnDirection)
+        # We have to reset the direction info of the new pawns
+        if move is not None and move[0] == bitboard.DROP and move[1] == PAWN:
+            player.pawnDirection = -1
+
+        return move
+
     def __compareWithBoardsWithNewPiece(self, pieceCode, oldBoard, newBoard):
-        for i in range(4):
-            for j in range(4):
-                if oldBoard[i][j] == 0:
-                    oldBoard[i][j] = pieceCode
-
-                    if oldBoard == newBoard:
-                        oldBoard[i][j] = 0
-                        return True
-                    
-                    oldBoard[i][j] = 0
-
-        return False
+        move = bitboard.decodeMove(oldBoard, newBoard, pieceCode, -1)
+        return move is not None and move[0] == bitboard.DROP and move[1] == abs(pieceCode)
     
     def __compareWithBoardsWithMovement(self, pieceCode, position, oldBoard, newBoard, player):
-        validMovementsSquares = self.__getValidMovements(pieceCode, position, oldBoard, player)
-        row = position[0]
-        col = position[1]
-
-        oldBoard[row][col] = 0
-        for newSquare in validMovementsSquares:
-            # No se si esto haga una copia o solo sea una referencia
-            prevPiece = oldBoard[newSquare[0]][newSquare[1]]
-            oldBoard[newSquare[0]][newSquare[1]] = pieceCode
-            if oldBoard == newBoard:
-                oldBoard[newSquare[0]][newSquare[1]] = prevPiece
-                oldBoard[row][col] = pieceCode
-                return True
-            
-            oldBoard[newSquare[0]][newSquare[1]] = prevPiece
-
-        oldBoard[row][col] = pieceCode
-        return False
+        move = bitboard.decodeMove(oldBoard, newBoard, pieceCode, player.pawnDirection)
+        return (move is not None and move[0] != bitboard.DROP and move[1] == abs(pieceCode)
+                and move[2] == squareOf(position[0], position[1]))
 
-    # I think we can remove the __wasPieceMovement method by modifying 
-    # this method to return more information
-    # TODO: Refactor the code to delete __wasPieceMovement method.
     def __wasValidMove(self, oldBoard, newBoard, player):
-        pieces = [None] * 5
-
-        # No puede haber errores porque es el tablero antiguo
-        for i in range(4):
-            for j in range(4):
-                if self.__sameSign(oldBoard[i][j], player.piecesColor):
-                    pieces[abs(oldBoard[i][j])] = (i, j)
-
-        wasBoardFound = False
-        for i in range(1, len(pieces)):
-            if pieces[i] is not None:
-                wasBoardFound = self.__compareWithBoardsWithMovement(i * player.piecesColor, pieces[i], oldBoard, newBoard, player)
-            else:
-                wasBoardFound = self.__compareWithBoardsWithNewPiece(i * player.piecesColor, oldBoard, newBoard)
-                # This patch helps detect if a new pawn was put over the board
-                # We do this because we have to reset the direction info of the new pawns
-                # TODO: Fix this in a more elegant way along with the refactoring of the code.
-                if wasBoardFound and i == 1:
-                    player.pawnDirection = -1
-
-            if wasBoardFound:
-                return True
-            
-        return False
-
-    # Function to check whether a movement was a movement or not
-    # If it was a movement, it also checks if it was a capture or not.
-    # For a movement to be classified as a capture, 2 conditions have to occur
-    # 1. Only 2 squares changed value
-    # 2. One square has to change from used to empty and the other from used to used with different color    
-    def __wasPieceMovement(self, oldBoard, newBoard):
-        changedSquares = []
-
-        for i in range(4):
-            for j in range(4):
-                if oldBoard[i][j] != newBoard[i][j]:
-                    changedSquares.append((i, j))
-
-        if len(changedSquares) != 2:
-            return False, False
-        
-        def areChangesFromCapture(row1, col1, row2, col2):
-            return (newBoard[row1][col1] == 0
-                    and oldBoard[row2][col2] != 0 
-                    and newBoard[row2][col2] == oldBoard[row1][col1])
-        
-        def areChangesFromMovement(row1, col1, row2, col2):
-            return (newBoard[row1][col1] == 0
-                    and newBoard[row2][col2] == oldBoard[row1][col1])
-        
-        wasMovement = (areChangesFromMovement(changedSquares[0][0], changedSquares[0][1], changedSquares[1][0], changedSquares[1][1]) 
-                or areChangesFromMovement(changedSquares[1][0], changedSquares[1][1], changedSquares[0][0], changedSquares[0][1]))
-        
-        wasCapture = (areChangesFromCapture(changedSquares[0][0], changedSquares[0][1], changedSquares[1][0], changedSquares[1][1]) 
-                or areChangesFromCapture(changedSquares[1][0], changedSquares[1][1], changedSquares[0][0], changedSquares[0][1]))
-
-        return (wasMovement, wasCapture)
+        return self.__decodeMove(oldBoard, newBoard, player) is not None
 
     # Check if the position on the board is a winning position.
     # It checks all the rows, columns and both diagonals looking for 4-pieces in a row.
     def __isWinningPosition(self, board, color):
-        lrDiagSum = 0
-        rlDiagSum = 0
-        for i in range(4):
-            # Check diagonal left-right, up-down
-            if self.__sameSign(board[i][i], color):
-                lrDiagSum += 1
-
-            # Check diagonal right-left, up-down
-            if self.__sameSign(board[i][3-i], color):
-                rlDiagSum += 1
-
-            rowSum = 0
-            colSum = 0
-            # Loop to check all squares in a row or column
-            for j in range(4):
-                # Check row i
-                if self.__sameSign(board[i][j], color):
-                    rowSum += 1
-
-                # Check column i
-                if self.__sameSign(board[j][i], color):
-                    colSum += 1
-
-            # If the sum is 4, we have 4-pieces in a row
-            if rowSum == 4 or colSum == 4:
-                return True
-            
-        # If the sum is 4, we have 4-pieces in a row   
-        if lrDiagSum == 4 or rlDiagSum == 4:
-            return True
-        
-        return False
-
-    # Rotate board 180 degrees
-    def __rotateBoard(self, board):
-        N = len(board)
-        # rotate the matrix by 180 degrees
-        for i in range(N // 2):
-            for j in range(N):
-                temp = board[i][j]
-                board[i][j] = board[N - i - 1][N - j - 1]
-                board[N - i - 1][N - j - 1] = temp
-        
-        return board
+        return bitboard.isWinningPosition(board, color)
+
+    def __recordLatency(self, player, nanoseconds):
+        phase = PLACEMENT if self.currentTurn < 3 else MOVEMENT
+        player.statistics[phase + '_latency'].record(nanoseconds)
+
+    # The bot can manage its time with these (see time_control.py)
+    def __tellClock(self, player):
+        bot = player.player
+        bot.turnsLeft = self.maxTurns - self.currentTurn
+        if self.clock is None:
+            bot.timeLeft = None
+            bot.clockLeft = None
+        else:
+            bot.timeLeft = self.clock.timeLeft(player.piecesColor)
+            bot.clockLeft = self.clock.clockLeft(player.piecesColor)
+
+    def __adjudicate(self, player):
+        # Result of the game for the player that just moved
+        tablebase = loadTablebase(self.tablebasePath)
+        if tablebase is None:
+            return self.CONTINUE
+
+        # The referee keeps the pawn directions in the frame of each player
+        state = GameState.fromBoard(
+            self.view.rows(1), -player.piecesColor,
+            capturesLeft=(self.maxCaptures - self.whitePlayer.captures, self.maxCaptures - self.blackPlayer.captures),
+            pawnDirections=(self.whitePlayer.pawnDirection, -self.blackPlayer.pawnDirection), bottomColor=1)
+        distance = tablebase.probe(state)
+        if distance is None or distance == DRAW:
+            return self.CONTINUE
+
+        # Plies left in the game, the first one is the opponent's
+        pliesLeft = 2 * (self.maxTurns - self.currentTurn) - (1 if player.piecesColor == 1 else 2)
+        if distance > pliesLeft:
+            return self.CONTINUE
+
+        # Odd distances are won by the side to move
+        winner = player if distance % 2 == 0 else (self.blackPlayer if player is self.whitePlayer else self.whitePlayer)
+        self.sink.emit('adjudication', winner.player.name, distance)
+        self.endReason = game_record.END_ADJUDICATED
+        return self.WIN if winner is player else self.LOSE
 
     def __playTurn(self, player):
-        print("-----", player.player.name, "with pieces", player.piecesColor, "turn:", self.currentTurn, "-----")
-        newBoard = copy.deepcopy(self.board)
+        self.sink.emit('turn', player.player.name, player.piecesColor, self.currentTurn)
+        # The player gets the board from its side, the referee keeps the
+        # read-only rows to compare them with the answer
+        oldBoard = self.view.frozenRows(player.piecesColor)
+        newBoard = self.view.rows(player.piecesColor)
+        self.__tellClock(player)
+        start = time.perf_counter_ns()
         try:
             newBoard = player.player.play(newBoard)
-        except:
-            print(player.player.name, "raised an exception. Loses automatically")
+        except MoveTimeout:
+            self.__recordLatency(player, time.perf_counter_ns() - start)
+            player.statistics['timeouts'] += 1
+            self.sink.emit('timeout', player.player.name, self.clock.timeLeft(player.piecesColor))
+            self.endReason = game_record.END_TIMEOUT
+
+            return self.LOSE
+        except RemoteError as error:
+            self.__recordLatency(player, time.perf_counter_ns() - start)
             player.statistics['raised_errors'] += 1
-            
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_exception(exc_type, exc_value, exc_traceback)
-            
+            self.sink.emit('exception', player.player.name, str(error))
+            self.endReason = game_record.END_EXCEPTION
 
+            return self.LOSE
+        except:
+            self.__recordLatency(player, time.perf_counter_ns() - start)
+            player.statistics['raised_errors'] += 1
+            self.sink.emit('exception', player.player.name, traceback.format_exc())
+            self.endReason = game_record.END_EXCEPTION
 
             return self.LOSE
+        elapsed = time.perf_counter_ns() - start
+        self.__recordLatency(player, elapsed)
+        if self.clock is not None:
+            self.clock.spend(player.piecesColor, elapsed / 1e9)
     
-        if self.__wasValidMove(self.board, newBoard, player):
-            wasMovement, wasCapture = self.__wasPieceMovement(self.board, newBoard)
+        move = self.__decodeMove(oldBoard, newBoard, player)
+        if move is not None:
+            wasMovement = move[0] != bitboard.DROP
+            wasCapture = move[0] == bitboard.CAPTURE
             if wasMovement:
                 # Check if player made a movement on the first 3 moves
                 if self.currentTurn < 3:
-                    print(player.player.name, "made a movement on the first 3 moves. Loses automatically")
                     player.statistics['early_movements'] += 1
-                    self.__printBoard(self.board)
-                    self.__printBoard(newBoard)
+                    self.sink.emit('early_movement', player.player.name, self.view.rows(player.piecesColor), newBoard)
+                    self.endReason = game_record.END_EARLY_MOVEMENT
                     return self.LOSE
             
             if wasCapture:
@@ -415,28 +266,32 @@ class TTCEvaluator:
                 # Check if player has exceeded the maximum number of captures allowed
                 if player.captures > self.maxCaptures:
                     player.statistics['exceed_max_captures'] += 1
-                    print(player.player.name, "exceeded the limit of captures. Loses automatically")
-                    self.__printBoard(self.board)
-                    self.__printBoard(newBoard)
+                    self.sink.emit('exceed_max_captures', player.player.name, self.view.rows(player.piecesColor), newBoard)
+                    self.endReason = game_record.END_EXCEED_MAX_CAPTURES
                     return self.LOSE
 
+            # The record keeps the target in the frame of the white player,
+            # the board is rotated on the turns of the black player
+            target = move[3] if player.piecesColor == 1 else 15 - move[3]
+            self.moves.append((move[1] << 4) | target)
+
             if self.__isWinningPosition(newBoard, player.piecesColor):
-                print(player.player.name, " wins!")
-                self.__printBoard(newBoard)
+                self.sink.emit('win', player.player.name, newBoard)
+                self.endReason = game_record.END_WIN
                 return self.WIN
 
             # This only covers the case when the pawn moved
             self.__updatePawnDirection(newBoard, player)
             # Update board
-            self.board = newBoard
+            self.view = self.view.afterMove(newBoard, player.piecesColor)
+            if self.tablebasePath is not None:
+                return self.__adjudicate(player)
             return self.CONTINUE
 
         else:
-            print("Referee Pawn Direction:", player.pawnDirection)
-            print(player.player.name, "made an illegal move. Loses automatically")
             player.statistics['invalid_moves'] += 1
-            self.__printBoard(self.board)
-            self.__printBoard(newBoard)
+            self.sink.emit('illegal_move', player.player.name, player.pawnDirection, self.view.rows(player.piecesColor), newBoard)
+            self.endReason = game_record.END_ILLEGAL_MOVE
 
             return self.LOSE
 
@@ -447,35 +302,49 @@ class TTCEvaluator:
             if resultWhite == self.WIN:
                 self.whitePlayer.statistics['wins'] += 1
                 self.blackPlayer.statistics['loses'] += 1
+                self.__recordGame(1)
                 return
             elif resultWhite == self.LOSE:
                 self.blackPlayer.statistics['wins'] += 1
                 self.whitePlayer.statistics['loses'] += 1
+                self.__recordGame(-1)
                 return
-            
-            # Rotate board so the player has the correct face.
-            self.board = self.__rotateBoard(self.board)
+
             resultBlack = self.__playTurn(self.blackPlayer)
 
             if resultBlack == self.WIN:
                 self.blackPlayer.statistics['wins'] += 1
                 self.whitePlayer.statistics['loses'] += 1
+                self.__recordGame(-1)
                 return
             elif resultBlack == self.LOSE:
                 self.whitePlayer.statistics['wins'] += 1
                 self.blackPlayer.statistics['loses'] += 1
+                self.__recordGame(1)
                 return
             
             self.currentTurn += 1
-            # Rotate board so the player has the correct face.
-            self.board = self.__rotateBoard(self.board)
 
         self.blackPlayer.statistics['draws'] += 1
         self.whitePlayer.statistics['draws'] += 1
+        self.sink.emit('draw', self.gameNumber)
+        self.endReason = game_record.END_DRAW
+        self.__recordGame(0)
+
+    def __recordGame(self, winner):
+        if self.recorder is None:
+            return
+
+        self.recorder.writeGame(game_record.GameRecord(
+            self.whitePlayer.player.name, self.blackPlayer.player.name, self.seed,
+            self.maxCaptures, self.maxTurns, winner, self.endReason, self.moves))
 
     def __initializeGame(self):
-        self.board = [[0] * 4 for _ in range(4)]
+        self.view = BoardView()
         self.currentTurn = 0
+        self.moves = bytearray()
+        if self.timeControl is not None:
+            self.clock = Clock(self.timeControl)
 
         # Swap all the info of the players
         self.whitePlayer, self.blackPlayer = self.blackPlayer, self.whitePlayer
@@ -484,18 +353,41 @@ class TTCEvaluator:
         self.whitePlayer.resetValues(1)
         self.blackPlayer.resetValues(-1)
 
-    def runAnalysis(self, player1, player2, noGames, maxCaptures, maxTurns):
+    # seed is only kept in the records of the games, the caller seeds random
+    def runAnalysis(self, player1, player2, noGames, maxCaptures, maxTurns, firstGame=0, seed=None):
         self.maxCaptures = maxCaptures
         self.maxTurns = maxTurns
+        self.seed = seed
+
+        if self.timeControl is not None:
+            player1 = RemotePlayer(player1)
+            player2 = RemotePlayer(player2)
 
         # We put them this way because initializeGame is going to swap them
         self.blackPlayer = PlayerWrapper(player1, -1)
         self.whitePlayer = PlayerWrapper(player2, 1)
 
-        for i in range(noGames):
-            self.__initializeGame()
-            print("----- STARTING GAME", i, "-----")
-            self.__startGame()
+        # The colors change every game, so a run that starts in an odd game
+        # (one game of a match played on its own) starts with them swapped
+        if firstGame % 2 == 1:
+            self.whitePlayer, self.blackPlayer = self.blackPlayer, self.whitePlayer
+
+        # The bots report through the sink of the run too
+        previousSink = setActiveSink(self.sink)
+        try:
+            for i in range(firstGame, firstGame + noGames):
+                self.__initializeGame()
+                self.gameNumber = i
+                self.sink.emit('game_start', i)
+                self.__startGame()
+        finally:
+            if self.timeControl is not None:
+                player1.close()
+                player2.close()
+            setActiveSink(previousSink)
+            self.sink.flush()
+            if self.recorder is not None:
+                self.recorder.flush()
 
         return self.whitePlayer.statistics, self.blackPlayer.statistics
 
@@ -0,0 +1,253 @@
+"""
+Tic-Tac-Chec event log
+Everything the referee and the bots report goes through an event sink, so a
+run can choose how much output it wants and where it goes.
+
+Verbosity levels:
+
+    - QUIET = 0: nothing is reported
+    - RESULTS = 1: how every game ended (wins, illegal moves, exceptions, ...)
+    - VERBOSE = 2: also the start of every game, every turn, the time of every move
+      and the boards the bots print
+
+Sinks:
+
+    - ConsoleSink prints the events as the evaluator always did
+    - NDJSONSink writes one JSON object per line
+    - BinarySink writes compact binary records (see below)
+    - NullSink drops everything
+
+The file sinks serialize every event as soon as it arrives (boards change
+after the event) and keep it in memory until batchSize events are buffered,
+then write the whole batch at once. Call close() or use them in a with
+statement to write the last batch.
+
+Binary record: kind code (1 byte) followed by the fields of the kind in the
+order of EVENTS. Integers are 4 bytes, floats 8 bytes, strings a 2 byte
+length plus UTF-8 bytes and boards the 8 byte packed encoding of
+game_state.encodeBoard. Everything is little-endian.
+"""
+import json
+import struct
+import sys
+
+from game_state import encodeBoard
+
+QUIET = 0
+RESULTS = 1
+VERBOSE = 2
+
+DEFAULT_BATCH_SIZE = 4096
+
+# kind -> (code, level, fields), field types: s string, i int, f float, b board
+EVENTS = {
+    'game_start': (1, VERBOSE, (('game', 'i'),)),
+    'turn': (2, VERBOSE, (('player', 's'), ('color', 'i'), ('turn', 'i'))),
+    'move_time': (3, VERBOSE, (('player', 's'), ('seconds', 'f'))),
+    'win': (4, RESULTS, (('player', 's'), ('board', 'b'))),
+    'exception': (5, RESULTS, (('player', 's'), ('traceback', 's'))),
+    'early_movement': (6, RESULTS, (('player', 's'), ('oldBoard', 'b'), ('newBoard', 'b'))),
+    'exceed_max_captures': (7, RESULTS, (('player', 's'), ('oldBoard', 'b'), ('newBoard', 'b'))),
+    'illegal_move': (8, RESULTS, (('player', 's'), ('pawnDirection', 'i'), ('oldBoard', 'b'), ('newBoard', 'b'))),
+    'draw': (9, RESULTS, (('game', 'i'),)),
+    'player_board': (10, VERBOSE, (('player', 's'), ('board', 'b'))),
+    'timeout': (11, RESULTS, (('player', 's'), ('limit', 'f'))),
+    'adjudication': (12, RESULTS, (('player', 's'), ('plies', 'i'))),
+}
+KINDS_BY_CODE = {code: kind for kind, (code, _, _) in EVENTS.items()}
+
+
+# Packed value written for something returned by a bot that is not a board
+INVALID_BOARD = (1 << 64) - 1
+
+
+def isBoard(board):
+    # A 4x4 grid of piece codes, anything else does not fit in a packed board
+    return (isinstance(board, list) and len(board) == 4
+            and all(isinstance(row, list) and len(row) == 4
+                    and all(isinstance(pieceCode, int) and -4 <= pieceCode <= 4 for pieceCode in row) for row in board))
+
+
+def boardLines(board):
+    # Board as the evaluator prints it
+    if not isBoard(board):
+        return str(board)
+
+    lines = ['-------']
+    for row in board:
+        lines.append(''.join((' ' if pieceCode >= 0 else '') + str(pieceCode) for pieceCode in row))
+    lines.append('-------')
+    return '\n'.join(lines)
+
+
+class NullSink:
+    level = QUIET
+
+    def emit(self, kind, *fields):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ConsoleSink(NullSink):
+    def __init__(self, level=VERBOSE, stream=None):
+        self.level = level
+        self.stream = stream
+
+    def emit(self, kind, *fields):
+        if EVENTS[kind][1] > self.level:
+            return
+
+        stream = self.stream if self.stream is not None else sys.stdout
+        if kind == 'game_start':
+            print("----- STARTING GAME", fields[0], "-----", file=stream)
+        elif kind == 'turn':
+            print("-----", fields[0], "with pieces", fields[1], "turn:", fields[2], "-----", file=stream)
+        elif kind == 'move_time':
+            print("Time taken:", fields[1], file=stream)
+        elif kind == 'win':
+            print(fields[0], " wins!", file=stream)
+            print(boardLines(fields[1]), file=stream)
+        elif kind == 'exception':
+            print(fields[0], "raised an exception. Loses automatically", file=stream)
+            print(fields[1], end='', file=self.stream if self.stream is not None else sys.stderr)
+        elif kind == 'early_movement':
+            print(fields[0], "made a movement on the first 3 moves. Loses automatically", file=stream)
+            print(boardLines(fields[1]), file=stream)
+            print(boardLines(fields[2]), file=stream)
+        elif kind == 'exceed_max_captures':
+            print(fields[0], "exceeded the limit of captures. Loses automatically", file=stream)
+            print(boardLines(fields[1]), file=stream)
+            print(boardLines(fields[2]), file=stream)
+        elif kind == 'illegal_move':
+            print("Referee Pawn Direction:", fields[1], file=stream)
+            print(fields[0], "made an illegal move. Loses automatically", file=stream)
+            print(boardLines(fields[2]), file=stream)
+            print(boardLines(fields[3]), file=stream)
+        elif kind == 'timeout':
+            print(fields[0], "ran out of time (%.3fs). Loses automatically" % fields[1], file=stream)
+        elif kind == 'adjudication':
+            print(fields[0], "wins by adjudication, the tablebase wins in", fields[1], "plies", file=stream)
+        elif kind == 'player_board':
+            # The board returned by a bot, seen from the other side
+            for row in reversed(fields[1]):
+                print(row[::-1], file=stream)
+
+
+class _BufferedFileSink(NullSink):
+    def __init__(self, path, level=RESULTS, batchSize=DEFAULT_BATCH_SIZE, mode='w'):
+        self.level = level
+        self.batchSize = batchSize
+        self.file = open(path, mode)
+        self.buffer = []
+
+    def emit(self, kind, *fields):
+        code, level, _ = EVENTS[kind]
+        if level > self.level:
+            return
+
+        self.buffer.append(self._serialize(kind, code, fields))
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self._join(self.buffer))
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class NDJSONSink(_BufferedFileSink):
+    def __init__(self, path, level=RESULTS, batchSize=DEFAULT_BATCH_SIZE):
+        _BufferedFileSink.__init__(self, path, level, batchSize, 'w')
+
+    def _serialize(self, kind, code, fields):
+        event = {'event': kind}
+        for (name, _), value in zip(EVENTS[kind][2], fields):
+            event[name] = value
+        return json.dumps(event, separators=(',', ':'), default=str)
+
+    def _join(self, buffer):
+        return '\n'.join(buffer) + '\n'
+
+
+class BinarySink(_BufferedFileSink):
+    def __init__(self, path, level=RESULTS, batchSize=DEFAULT_BATCH_SIZE):
+        _BufferedFileSink.__init__(self, path, level, batchSize, 'wb')
+
+    def _serialize(self, kind, code, fields):
+        parts = [bytes((code,))]
+        for (_, fieldType), value in zip(EVENTS[kind][2], fields):
+            if fieldType == 'i':
+                parts.append(struct.pack('<i', value))
+            elif fieldType == 'f':
+                parts.append(struct.pack('<d', value))
+            elif fieldType == 'b':
+                parts.append(struct.pack('<Q', encodeBoard(value) if isBoard(value) else INVALID_BOARD))
+            else:
+                text = str(value).encode('utf-8')[:0xFFFF]
+                parts.append(struct.pack('<H', len(text)) + text)
+        return b''.join(parts)
+
+    def _join(self, buffer):
+        return b''.join(buffer)
+
+
+def readBinaryEvents(path):
+    # Yields (kind, fields) for every record of a file written by BinarySink.
+    # Boards are returned as their packed encoding
+    with open(path, 'rb') as fp:
+        data = fp.read()
+
+    offset = 0
+    while offset < len(data):
+        kind = KINDS_BY_CODE[data[offset]]
+        offset += 1
+        fields = []
+        for _, fieldType in EVENTS[kind][2]:
+            if fieldType == 'i':
+                fields.append(struct.unpack_from('<i', data, offset)[0])
+                offset += 4
+            elif fieldType == 'f':
+                fields.append(struct.unpack_from('<d', data, offset)[0])
+                offset += 8
+            elif fieldType == 'b':
+                fields.append(struct.unpack_from('<Q', data, offset)[0])
+                offset += 8
+            else:
+                length = struct.unpack_from('<H', data, offset)[0]
+                fields.append(data[offset + 2:offset + 2 + length].decode('utf-8', errors='replace'))
+                offset += 2 + length
+        yield kind, tuple(fields)
+
+
+# Sink of the run in progress. The bots report through emit, the evaluator
+# replaces the sink while a run is going on
+_activeSink = ConsoleSink()
+
+
+def setActiveSink(sink):
+    # Returns the previous sink so it can be restored
+    global _activeSink
+    previous = _activeSink
+    _activeSink = sink
+    return previous
+
+
+def emit(kind, *fields):
+    _activeSink.emit(kind, *fields)
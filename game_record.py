@@ -0,0 +1,242 @@
+"""
+Tic-Tac-Chec game records
+Compact binary format to keep every game played by the evaluator, and a
+replayer to verify or analyse them later without running the bots again.
+
+A records file starts with FILE_HEADER and then has one record per game,
+appended as the games end. Every record is:
+
+    u32  length of the rest of the record
+    u8   length + UTF-8 name of the white player
+    u8   length + UTF-8 name of the black player
+    u8   length + UTF-8 seed of the game (empty if there was none)
+    u8   maximum number of captures
+    u16  maximum number of turns
+    i8   winner color (1 white, -1 black, 0 draw)
+    u8   how the game ended (END_*)
+    u16  number of moves
+    one byte per move, (piece << 4) | target
+
+The color of the piece of a move is given by its position (white moves
+first) and the target square is in the frame of the white player, the board
+the referee starts with. A move that lost the game (illegal, early movement,
+too many captures, out of time) is not stored, the end of the game tells what happened.
+Everything is little-endian.
+
+Next to the records file there is an index (path + '.idx') with the offset
+of every record as a u64, so any game can be read without going through the
+ones before it.
+"""
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+from bitboard import BLACK, WHITE
+from game_state import GameState
+
+FILE_HEADER = b'TTCGAME\x01'
+INDEX_SUFFIX = '.idx'
+
+END_WIN = 1
+END_DRAW = 2
+END_ILLEGAL_MOVE = 3
+END_EXCEPTION = 4
+END_EARLY_MOVEMENT = 5
+END_EXCEED_MAX_CAPTURES = 6
+END_TIMEOUT = 7
+# The referee ended the game with the result of the tablebase
+END_ADJUDICATED = 8
+
+_LENGTH = struct.Struct('<I')
+_RULES = struct.Struct('<BHbBH')
+
+
+def _packText(text):
+    data = text.encode('utf-8')[:255]
+    return bytes((len(data),)) + data
+
+
+def _unpackText(data, offset):
+    length = data[offset]
+    return bytes(data[offset + 1:offset + 1 + length]).decode('utf-8', errors='replace'), offset + 1 + length
+
+
+class GameRecord:
+    def __init__(self, whiteName, blackName, seed, maxCaptures, maxTurns, winner=0, endReason=END_DRAW, moves=b''):
+        self.whiteName = whiteName
+        self.blackName = blackName
+        self.seed = seed
+        self.maxCaptures = maxCaptures
+        self.maxTurns = maxTurns
+        self.winner = winner
+        self.endReason = endReason
+        self.moves = bytes(moves)
+
+    def __eq__(self, other):
+        return isinstance(other, GameRecord) and self.encode() == other.encode()
+
+    def encode(self):
+        body = b''.join((
+            _packText(self.whiteName),
+            _packText(self.blackName),
+            _packText('' if self.seed is None else str(self.seed)),
+            _RULES.pack(self.maxCaptures, self.maxTurns, self.winner, self.endReason, len(self.moves)),
+            self.moves,
+        ))
+        return _LENGTH.pack(len(body)) + body
+
+    @classmethod
+    def decode(cls, data, offset=0):
+        # Returns the record that starts at offset and the offset of the next one
+        length = _LENGTH.unpack_from(data, offset)[0]
+        end = offset + _LENGTH.size + length
+        offset += _LENGTH.size
+        whiteName, offset = _unpackText(data, offset)
+        blackName, offset = _unpackText(data, offset)
+        seed, offset = _unpackText(data, offset)
+        maxCaptures, maxTurns, winner, endReason, moveCount = _RULES.unpack_from(data, offset)
+        offset += _RULES.size
+        moves = bytes(data[offset:offset + moveCount])
+
+        return cls(whiteName, blackName, seed, maxCaptures, maxTurns, winner, endReason, moves), end
+
+
+class GameRecordWriter:
+    # Appends records to the file as the games end
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER)
+        self.index = open(path + INDEX_SUFFIX, 'ab')
+
+    def writeGame(self, record):
+        return self.writeEncoded(record.encode())
+
+    def writeEncoded(self, data):
+        # Returns the offset of the record
+        offset = self.file.tell()
+        self.file.write(data)
+        self.index.write(struct.pack('<Q', offset))
+        return offset
+
+    def flush(self):
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GameRecordList:
+    # Keeps the encoded records in memory, used by the worker processes of a
+    # tournament so only the main process writes to the file
+    def __init__(self):
+        self.records = []
+
+    def writeGame(self, record):
+        self.records.append(record.encode())
+
+    def flush(self):
+        pass
+
+
+def readIndex(path):
+    offsets = array('Q')
+    with open(path + INDEX_SUFFIX, 'rb') as fp:
+        offsets.frombytes(fp.read())
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+
+    return offsets
+
+
+def _mapFile(path):
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size <= len(FILE_HEADER):
+            return None
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if data[:len(FILE_HEADER)] != FILE_HEADER:
+        data.close()
+        raise ValueError('%s is not a file of game records' % path)
+
+    return data
+
+
+def readGame(path, number, offsets=None):
+    # Reads the game with the given number through the index
+    if offsets is None:
+        offsets = readIndex(path)
+
+    data = _mapFile(path)
+    try:
+        return GameRecord.decode(data, offsets[number])[0]
+    finally:
+        data.close()
+
+
+def iterGames(path):
+    # Yields every record of the file in order
+    data = _mapFile(path)
+    if data is None:
+        return
+
+    try:
+        offset = len(FILE_HEADER)
+        while offset < len(data):
+            record, offset = GameRecord.decode(data, offset)
+            yield record
+    finally:
+        data.close()
+
+
+def replay(record):
+    # Yields (state, move) before every move of the game, with the state in
+    # the frame of the white player. The state is the same object every time,
+    # copy it to keep it
+    state = GameState(WHITE)
+    state.setCapturesLeft(WHITE, record.maxCaptures)
+    state.setCapturesLeft(BLACK, record.maxCaptures)
+    for move in record.moves:
+        yield state, move
+        state.makeMove(move)
+
+
+def verifyGame(record):
+    # Plays the moves again and checks that every one was legal and that the
+    # game ended the way the record says
+    state = GameState(WHITE)
+    for state, move in replay(record):
+        if state.isWin(WHITE) or state.isWin(BLACK) or move not in state.legalMoves():
+            return False
+    # The replay plays the last move when the loop asks for the next one
+
+    if record.endReason == END_WIN:
+        # The last player that moved won
+        return state.isWin(record.winner) and -state.sideToMove == record.winner
+    if state.isWin(WHITE) or state.isWin(BLACK):
+        return False
+    if record.endReason == END_DRAW:
+        return record.winner == 0 and len(record.moves) == 2 * record.maxTurns
+    if record.endReason == END_ADJUDICATED:
+        # Only the tablebase can tell which side wins
+        return record.winner != 0
+
+    # The player that had to move lost the game
+    return record.winner == -state.sideToMove
+
+
+def verifyFile(path):
+    # Returns the numbers of the games of the file that do not verify
+    return [number for number, record in enumerate(iterGames(path)) if not verifyGame(record)]
@@ -0,0 +1,444 @@
+"""
+Tic-Tac-Chec game state
+Whole game state on top of the bitboard core, with a canonical packed
+encoding and an incrementally updated Zobrist hash.
+
+The state is kept in the frame of the board it was built from: bottomColor
+is the color whose pieces start at row 3 (the referee hands every bot the
+board with its own pieces at the bottom). In that frame a pawn going up has
+direction -1 and a pawn going down has direction 1, for both colors.
+
+Packed encoding (one Python int):
+
+    bits  0..63  16 squares x 4 bits: 0 empty, 1..4 white piece, 9..12 black piece
+    bit   64     white pawn goes down (direction 1)
+    bit   65     black pawn goes down (direction 1)
+    bits 66..69  captures left for white (0..15)
+    bits 70..73  captures left for black (0..15)
+    bit   74     black to move
+    bits 75..77  plies played during the placement phase (0..6)
+    bit   78     black starts at the bottom of the board
+
+The direction of a pawn that is not on the board is always the default one
+for its color, so two states that play the same are encoded the same.
+
+Besides the bitboards the state keeps, for every color, the number of its
+pieces in each of the 10 lines, packed in one int with 4 bits per line, and
+the square of each of its pieces (OFF_BOARD when it is not on the board).
+makeMove and unmakeMove only add or subtract the lines through the squares
+that change, so the evaluations read the alignments without scanning the
+board.
+"""
+import random
+
+from bitboard import Bitboard, LINE_MASKS, OFF_BOARD, SQUARE_LINES, WHITE, BLACK, PAWN, PIECES, colorIndex
+
+# Number of plies in which only drops are allowed (3 turns per player)
+PLACEMENT_PLIES = 6
+MAX_CAPTURES_CODE = 15
+
+_random = random.Random(0x77C)
+
+# PIECE_KEYS[colorIndex][piece][square], index 0 of the pieces is unused
+PIECE_KEYS = [[[_random.getrandbits(64) for _ in range(16)] for _ in range(5)] for _ in range(2)]
+PAWN_DOWN_KEYS = [_random.getrandbits(64) for _ in range(2)]
+CAPTURES_KEYS = [[_random.getrandbits(64) for _ in range(MAX_CAPTURES_CODE + 1)] for _ in range(2)]
+PHASE_KEYS = [_random.getrandbits(64) for _ in range(PLACEMENT_PLIES + 1)]
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+BLACK_AT_BOTTOM_KEY = _random.getrandbits(64)
+
+LINE_BITS = 4
+# Adding SQUARE_LINE_UNITS[square] to the line counts of a color adds a piece
+# to every line through the square
+SQUARE_LINE_UNITS = tuple(sum(1 << (LINE_BITS * line) for line in SQUARE_LINES[square]) for square in range(16))
+# (counts + AT_LEAST[n]) & LINE_HIGH_BITS has the high bit of every line
+# with n pieces or more set, a line never holds more than 4
+LINE_HIGH_BITS = sum(8 << (LINE_BITS * line) for line in range(len(LINE_MASKS)))
+AT_LEAST = [sum((8 - n) << (LINE_BITS * line) for line in range(len(LINE_MASKS))) for n in range(5)]
+
+
+def defaultPawnDirection(color, bottomColor):
+    # A new pawn always moves towards the opponent's side
+    return -1 if color == bottomColor else 1
+
+
+class GameState:
+    def __init__(self, bottomColor=WHITE):
+        self.board = Bitboard()
+        self.bottomColor = bottomColor
+        # Indexed by colorIndex, in the frame of this state
+        self.pawnDirections = [defaultPawnDirection(WHITE, bottomColor),
+                               defaultPawnDirection(BLACK, bottomColor)]
+        self.capturesLeft = [0, 0]
+        self.sideToMove = WHITE
+        self.ply = 0
+
+        self.computeIndexes()
+        self.hash = self.computeHash()
+
+    @classmethod
+    def fromBoard(cls, board, sideToMove, ply=PLACEMENT_PLIES, capturesLeft=(0, 0),
+                  pawnDirections=None, bottomColor=None):
+        # bottomColor defaults to the side to move, which is what a bot sees
+        state = cls(sideToMove if bottomColor is None else bottomColor)
+        state.board = Bitboard.fromBoard(board)
+        state.sideToMove = sideToMove
+        state.ply = ply
+        state.capturesLeft = list(capturesLeft)
+        if pawnDirections is not None:
+            state.pawnDirections = list(pawnDirections)
+        state.__normalizePawnDirections()
+
+        state.computeIndexes()
+        state.hash = state.computeHash()
+        return state
+
+    @classmethod
+    def fromPlayerView(cls, board, piecesColor, currentTurn, pawnDirection, enemyPawnDirection,
+                       availableCaptures, enemyAvailableCaptures):
+        # Builds the state of the board a bot receives on its turn
+        directions = [0, 0]
+        directions[colorIndex(piecesColor)] = pawnDirection
+        directions[colorIndex(-piecesColor)] = enemyPawnDirection
+        captures = [0, 0]
+        captures[colorIndex(piecesColor)] = availableCaptures
+        captures[colorIndex(-piecesColor)] = enemyAvailableCaptures
+
+        # White moves first in every turn
+        ply = 2 * currentTurn + (0 if piecesColor == WHITE else 1)
+        return cls.fromBoard(board, piecesColor, ply, captures, directions, piecesColor)
+
+    def toBoard(self):
+        return self.board.toBoard()
+
+    def copy(self):
+        other = GameState.__new__(GameState)
+        other.board = self.board.copy()
+        other.bottomColor = self.bottomColor
+        other.pawnDirections = self.pawnDirections[:]
+        other.capturesLeft = self.capturesLeft[:]
+        other.sideToMove = self.sideToMove
+        other.ply = self.ply
+        other.lineCounts = self.lineCounts[:]
+        other.pieceSquares = [self.pieceSquares[0][:], self.pieceSquares[1][:]]
+        other.hash = self.hash
+        return other
+
+    def __normalizePawnDirections(self):
+        for color in (WHITE, BLACK):
+            if not self.board.pieces[colorIndex(color)][PAWN]:
+                self.pawnDirections[colorIndex(color)] = defaultPawnDirection(color, self.bottomColor)
+
+    def isPlacementPhase(self):
+        return self.ply < PLACEMENT_PLIES
+
+    def __eq__(self, other):
+        return isinstance(other, GameState) and self.encode() == other.encode()
+
+    def __hash__(self):
+        return self.hash
+
+    # Incremental updates. Every change of the state goes through these
+    # methods so the Zobrist hash never has to be computed from scratch.
+
+    def setPiece(self, pieceCode, square):
+        index = colorIndex(pieceCode)
+        self.board.setPiece(pieceCode, square)
+        self.hash ^= PIECE_KEYS[index][abs(pieceCode)][square]
+        self.pieceSquares[index][abs(pieceCode)] = square
+        self.lineCounts[index] += SQUARE_LINE_UNITS[square]
+
+    def removePiece(self, pieceCode, square):
+        index = colorIndex(pieceCode)
+        self.board.removePiece(pieceCode, square)
+        self.hash ^= PIECE_KEYS[index][abs(pieceCode)][square]
+        self.pieceSquares[index][abs(pieceCode)] = OFF_BOARD
+        self.lineCounts[index] -= SQUARE_LINE_UNITS[square]
+
+    def setPawnDirection(self, color, direction):
+        index = colorIndex(color)
+        if self.pawnDirections[index] != direction:
+            self.pawnDirections[index] = direction
+            self.hash ^= PAWN_DOWN_KEYS[index]
+
+    def setCapturesLeft(self, color, captures):
+        index = colorIndex(color)
+        self.hash ^= CAPTURES_KEYS[index][min(self.capturesLeft[index], MAX_CAPTURES_CODE)]
+        self.capturesLeft[index] = captures
+        self.hash ^= CAPTURES_KEYS[index][min(captures, MAX_CAPTURES_CODE)]
+
+    def setPly(self, ply):
+        self.hash ^= PHASE_KEYS[min(self.ply, PLACEMENT_PLIES)]
+        self.ply = ply
+        self.hash ^= PHASE_KEYS[min(ply, PLACEMENT_PLIES)]
+
+    def setSideToMove(self, color):
+        if self.sideToMove != color:
+            self.sideToMove = color
+            self.hash ^= BLACK_TO_MOVE_KEY
+
+    def legalMoves(self):
+        color = self.sideToMove
+        index = colorIndex(color)
+        return self.board.generateMoves(color, self.pawnDirections[index],
+                                        allowMovements=self.ply >= PLACEMENT_PLIES,
+                                        allowCaptures=self.capturesLeft[index] > 0)
+
+    def isWin(self, color):
+        return self.board.isWin(color)
+
+    def pieceSquare(self, color, piece):
+        return self.pieceSquares[colorIndex(color)][piece]
+
+    def lineCount(self, color, line):
+        return (self.lineCounts[colorIndex(color)] >> (LINE_BITS * line)) & 15
+
+    def maxAligned(self, color):
+        # Maximum number of pieces of a color that share a line
+        counts = self.lineCounts[colorIndex(color)]
+        for count in (4, 3, 2, 1):
+            if (counts + AT_LEAST[count]) & LINE_HIGH_BITS:
+                return count
+        return 0
+
+    def bestLine(self, color):
+        # Number of pieces and mask of the first line with the most pieces of
+        # a color, in the order of LINE_MASKS
+        counts = self.lineCounts[colorIndex(color)]
+        for count in (4, 3, 2, 1):
+            lines = (counts + AT_LEAST[count]) & LINE_HIGH_BITS
+            if lines:
+                return count, LINE_MASKS[((lines & -lines).bit_length() - 1) // LINE_BITS]
+        return 0, LINE_MASKS[0]
+
+    def makeMove(self, move):
+        # Plays the move of the side to move in place and returns the undo
+        # record needed by unmakeMove. The hash is updated incrementally.
+        color = self.sideToMove
+        index = colorIndex(color)
+        enemyIndex = 1 - index
+        piece = move >> 4
+        target = move & 15
+        targetBit = 1 << target
+
+        board = self.board
+        pieces = board.pieces[index]
+        occupancy = board.occupancy
+        lineCounts = self.lineCounts
+        pieceSquares = self.pieceSquares
+        origin = pieces[piece]
+        oldDirections = self.pawnDirections[:]
+        oldCaptures = self.capturesLeft[index]
+        oldHash = value = self.hash
+
+        captured = 0
+        if occupancy[enemyIndex] & targetBit:
+            enemyPieces = board.pieces[enemyIndex]
+            for captured in PIECES:
+                if enemyPieces[captured] & targetBit:
+                    break
+            enemyPieces[captured] = 0
+            occupancy[enemyIndex] ^= targetBit
+            value ^= PIECE_KEYS[enemyIndex][captured][target]
+            pieceSquares[enemyIndex][captured] = OFF_BOARD
+            lineCounts[enemyIndex] -= SQUARE_LINE_UNITS[target]
+
+            captures = self.capturesLeft[index]
+            value ^= CAPTURES_KEYS[index][min(captures, MAX_CAPTURES_CODE)] ^ CAPTURES_KEYS[index][min(captures - 1, MAX_CAPTURES_CODE)]
+            self.capturesLeft[index] = captures - 1
+
+            # A captured pawn goes back to the default direction of its owner
+            if captured == PAWN:
+                direction = defaultPawnDirection(-color, self.bottomColor)
+                if self.pawnDirections[enemyIndex] != direction:
+                    self.pawnDirections[enemyIndex] = direction
+                    value ^= PAWN_DOWN_KEYS[enemyIndex]
+
+        keys = PIECE_KEYS[index][piece]
+        if origin:
+            originSquare = origin.bit_length() - 1
+            value ^= keys[originSquare]
+            lineCounts[index] -= SQUARE_LINE_UNITS[originSquare]
+        value ^= keys[target]
+        lineCounts[index] += SQUARE_LINE_UNITS[target]
+        pieces[piece] = targetBit
+        pieceSquares[index][piece] = target
+        occupancy[index] = (occupancy[index] & ~origin) | targetBit
+
+        if piece == PAWN:
+            if not origin:
+                direction = defaultPawnDirection(color, self.bottomColor)
+            else:
+                direction = self.pawnDirections[index]
+            # The pawn reverses when it reaches a limit of the board
+            if target < 4:
+                direction = 1
+            elif target >= 12:
+                direction = -1
+            if self.pawnDirections[index] != direction:
+                self.pawnDirections[index] = direction
+                value ^= PAWN_DOWN_KEYS[index]
+
+        if self.ply < PLACEMENT_PLIES:
+            value ^= PHASE_KEYS[self.ply] ^ PHASE_KEYS[self.ply + 1]
+        self.ply += 1
+        self.sideToMove = -color
+        self.hash = value ^ BLACK_TO_MOVE_KEY
+
+        return (move, origin, captured, oldDirections, oldCaptures, oldHash)
+
+    def unmakeMove(self, undo):
+        move, origin, captured, directions, captures, value = undo
+        color = -self.sideToMove
+        index = colorIndex(color)
+        piece = move >> 4
+        target = move & 15
+        targetBit = 1 << target
+
+        board = self.board
+        occupancy = board.occupancy
+        board.pieces[index][piece] = origin
+        occupancy[index] = (occupancy[index] & ~targetBit) | origin
+
+        lineCounts = self.lineCounts
+        lineCounts[index] -= SQUARE_LINE_UNITS[target]
+        if origin:
+            originSquare = origin.bit_length() - 1
+            lineCounts[index] += SQUARE_LINE_UNITS[originSquare]
+            self.pieceSquares[index][piece] = originSquare
+        else:
+            self.pieceSquares[index][piece] = OFF_BOARD
+
+        if captured:
+            board.pieces[1 - index][captured] = targetBit
+            occupancy[1 - index] |= targetBit
+            self.pieceSquares[1 - index][captured] = target
+            lineCounts[1 - index] += SQUARE_LINE_UNITS[target]
+
+        self.pawnDirections = directions
+        self.capturesLeft[index] = captures
+        self.ply -= 1
+        self.sideToMove = color
+        self.hash = value
+
+    def computeIndexes(self):
+        # Line counts and piece squares from the bitboards
+        self.lineCounts = [0, 0]
+        self.pieceSquares = [[OFF_BOARD] * 5, [OFF_BOARD] * 5]
+        for index in range(2):
+            for piece in PIECES:
+                mask = self.board.pieces[index][piece]
+                if mask:
+                    square = mask.bit_length() - 1
+                    self.pieceSquares[index][piece] = square
+                    self.lineCounts[index] += SQUARE_LINE_UNITS[square]
+
+    def computeHash(self):
+        value = 0
+        for index in range(2):
+            for piece in PIECES:
+                mask = self.board.pieces[index][piece]
+                if mask:
+                    value ^= PIECE_KEYS[index][piece][mask.bit_length() - 1]
+            if self.pawnDirections[index] > 0:
+                value ^= PAWN_DOWN_KEYS[index]
+            value ^= CAPTURES_KEYS[index][min(self.capturesLeft[index], MAX_CAPTURES_CODE)]
+
+        value ^= PHASE_KEYS[min(self.ply, PLACEMENT_PLIES)]
+        if self.sideToMove == BLACK:
+            value ^= BLACK_TO_MOVE_KEY
+        if self.bottomColor == BLACK:
+            value ^= BLACK_AT_BOTTOM_KEY
+
+        return value
+
+    def encode(self):
+        code = 0
+        for index, colorBits in ((0, 0), (1, 8)):
+            for piece in PIECES:
+                mask = self.board.pieces[index][piece]
+                if mask:
+                    code |= (colorBits | piece) << (4 * (mask.bit_length() - 1))
+
+        if self.pawnDirections[0] > 0:
+            code |= 1 << 64
+        if self.pawnDirections[1] > 0:
+            code |= 1 << 65
+        code |= min(self.capturesLeft[0], MAX_CAPTURES_CODE) << 66
+        code |= min(self.capturesLeft[1], MAX_CAPTURES_CODE) << 70
+        if self.sideToMove == BLACK:
+            code |= 1 << 74
+        code |= min(self.ply, PLACEMENT_PLIES) << 75
+        if self.bottomColor == BLACK:
+            code |= 1 << 78
+
+        return code
+
+    @classmethod
+    def decode(cls, code):
+        state = cls(BLACK if (code >> 78) & 1 else WHITE)
+        for square in range(16):
+            nibble = (code >> (4 * square)) & 15
+            if nibble:
+                piece = nibble & 7
+                state.board.setPiece(-piece if nibble & 8 else piece, square)
+
+        state.pawnDirections = [1 if (code >> 64) & 1 else -1, 1 if (code >> 65) & 1 else -1]
+        state.capturesLeft = [(code >> 66) & 15, (code >> 70) & 15]
+        state.sideToMove = BLACK if (code >> 74) & 1 else WHITE
+        state.ply = (code >> 75) & 7
+
+        state.computeIndexes()
+        state.hash = state.computeHash()
+        return state
+
+
+class OpponentTracker:
+    # What a bot can infer about its opponent from the boards it receives.
+    # The boards are in the frame of the bot, so the opponent's pawn starts
+    # going down (direction 1).
+    def __init__(self, piecesColor, maxCaptures):
+        self.piecesColor = piecesColor
+        self.pawnDirection = 1
+        self.availableCaptures = maxCaptures
+        self.lastBoard = [[0] * 4 for _ in range(4)]
+
+    def __countPieces(self, board, color):
+        return sum(1 for row in board for piece in row if piece * color > 0)
+
+    def update(self, board):
+        # Called with the board received at the start of the bot's turn
+        enemyPawn = -self.piecesColor
+        if enemyPawn in board[3]:
+            self.pawnDirection = -1
+        elif enemyPawn in board[0] or not any(enemyPawn in row for row in self.lastBoard):
+            # A pawn that was not on the board before is a new one
+            self.pawnDirection = 1
+
+        # If one of my pieces disappeared, the opponent used a capture
+        if (self.__countPieces(board, self.piecesColor) < self.__countPieces(self.lastBoard, self.piecesColor)
+                and self.availableCaptures > 0):
+            self.availableCaptures -= 1
+
+    def setLastBoard(self, board):
+        # Called with the board the bot returns
+        self.lastBoard = [row[:] for row in board]
+
+
+def pieceNibble(pieceCode):
+    # 4 bit code of a square in the packed encoding
+    return pieceCode if pieceCode >= 0 else 8 - pieceCode
+
+
+def encodeBoard(board):
+    # Packs only the squares of a list of lists board, useful as a dict key
+    # or for a fast equality check between two boards.
+    code = 0
+    shift = 0
+    for row in board:
+        for pieceCode in row:
+            if pieceCode:
+                code |= pieceNibble(pieceCode) << shift
+            shift += 4
+
+    return code
@@ -0,0 +1,85 @@
+"""
+Tic-Tac-Chec move latency
+Histograms of how long the bots take in every call to play(), kept by the
+evaluator per player and per phase of the game.
+
+The times are in nanoseconds (time.perf_counter_ns) and go into logarithmic
+buckets: values below 16 ns are exact and every power of two above is split
+in 8 buckets, so a percentile is never more than 12.5% above the real value.
+The maximum is kept exactly. Histograms of different games or processes are
+added up with merge().
+"""
+PLACEMENT = 'placement'
+MOVEMENT = 'movement'
+PHASES = (PLACEMENT, MOVEMENT)
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# A value of 64 bits goes at most to bucket (64 - SUB_BUCKET_BITS - 1) *
+# SUB_BUCKETS + 2 * SUB_BUCKETS - 1 = 495, longer ones go to that last bucket
+BUCKETS = (64 - SUB_BUCKET_BITS + 1) * SUB_BUCKETS
+
+PERCENTILES = (50, 90, 99)
+
+
+def bucketOf(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(shift * SUB_BUCKETS + (value >> shift), BUCKETS - 1)
+
+
+def bucketLimit(bucket):
+    # Largest value that goes into the bucket
+    if bucket < 2 * SUB_BUCKETS:
+        return bucket
+    shift = bucket // SUB_BUCKETS - 1
+    return ((bucket - shift * SUB_BUCKETS + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, nanoseconds):
+        self.counts[bucketOf(nanoseconds)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.counts):
+            if count:
+                self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        # Upper limit of the bucket of the value below which percent% of the
+        # times fall, never more than the maximum
+        if not self.count:
+            return 0
+
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucketLimit(bucket), self.max)
+        return self.max
+
+    def summary(self):
+        # Milliseconds, as written in the results of a tournament
+        summary = {'moves': self.count}
+        for percent in PERCENTILES:
+            summary['p%d_ms' % percent] = round(self.percentile(percent) / 1e6, 3)
+        summary['max_ms'] = round(self.max / 1e6, 3)
+        return summary
+
+    def __repr__(self):
+        return 'LatencyHistogram(%s)' % self.summary()
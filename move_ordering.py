@@ -0,0 +1,105 @@
+"""
+Tic-Tac-Chec move ordering
+Sorts the moves of a node so the alpha-beta search finds its cutoffs early.
+
+The moves are tried in this order:
+
+    1. the hash move, the best move stored in the transposition table
+    2. moves that complete a line of four (wins)
+    3. captures
+    4. killer moves, quiet moves that caused a cutoff at the same ply
+    5. the rest, by the history table indexed by piece and target square
+
+The counters cutoffs and firstMoveCutoffs measure how often the first move
+tried was already good enough to cut the node, which is the rate that good
+ordering pushes towards 1.
+"""
+from operator import itemgetter
+
+from bitboard import WIN_MASKS, colorIndex
+
+HASH_MOVE_SCORE = 1 << 30
+WIN_MOVE_SCORE = 1 << 29
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 27
+# History scores are halved when one gets here, so they stay below the killers
+MAX_HISTORY = 1 << 24
+
+KILLERS_PER_PLY = 2
+MAX_PLY = 128
+
+
+class MoveOrdering:
+    def __init__(self, maxPly=MAX_PLY):
+        self.maxPly = maxPly
+        # killers[ply] holds the last quiet moves that caused a cutoff at that ply
+        self.killers = [[0] * KILLERS_PER_PLY for _ in range(maxPly + 1)]
+        # history[piece][target], index 0 of the pieces is unused
+        self.history = [[0] * 16 for _ in range(5)]
+
+        self.cutoffs = 0
+        self.firstMoveCutoffs = 0
+
+    def newSearch(self):
+        # Called before the search of a new move. Killers belong to the old
+        # positions, the history is kept but loses half of its weight
+        self.killers = [[0] * KILLERS_PER_PLY for _ in range(self.maxPly + 1)]
+        self.__ageHistory()
+
+    def __ageHistory(self):
+        for scores in self.history:
+            for target in range(16):
+                scores[target] >>= 1
+
+    def orderMoves(self, state, moves, ply, hashMove=0):
+        board = state.board
+        index = colorIndex(state.sideToMove)
+        ownOccupancy = board.occupancy[index]
+        enemyOccupancy = board.occupancy[1 - index]
+        pieces = board.pieces[index]
+        killers = self.killers[min(ply, self.maxPly)]
+
+        scores = []
+        for move in moves:
+            piece = move >> 4
+            targetBit = 1 << (move & 15)
+            if move == hashMove:
+                score = HASH_MOVE_SCORE
+            elif ((ownOccupancy & ~pieces[piece]) | targetBit) in WIN_MASKS:
+                score = WIN_MOVE_SCORE
+            elif enemyOccupancy & targetBit:
+                score = CAPTURE_SCORE
+            elif move in killers:
+                # The newest killer goes first
+                score = KILLER_SCORE + KILLERS_PER_PLY - killers.index(move)
+            else:
+                score = self.history[piece][move & 15]
+            scores.append(score)
+
+        # sorted is stable, moves with the same score keep the generation order
+        return [move for _, move in sorted(zip(scores, moves), key=itemgetter(0), reverse=True)]
+
+    def recordCutoff(self, state, move, ply, depth, moveIndex):
+        # Called with the state before the move that caused the cutoff.
+        # depth is the remaining depth of the node
+        self.cutoffs += 1
+        if moveIndex == 0:
+            self.firstMoveCutoffs += 1
+
+        enemyOccupancy = state.board.occupancy[1 - colorIndex(state.sideToMove)]
+        if enemyOccupancy & (1 << (move & 15)):
+            # Captures are already tried early
+            return
+
+        killers = self.killers[min(ply, self.maxPly)]
+        if killers[0] != move:
+            killers.pop()
+            killers.insert(0, move)
+
+        scores = self.history[move >> 4]
+        scores[move & 15] += depth * depth
+        if scores[move & 15] >= MAX_HISTORY:
+            self.__ageHistory()
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.cutoffs if self.cutoffs else 0.0
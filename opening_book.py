@@ -0,0 +1,247 @@
+"""
+Tic-Tac-Chec opening book
+Best drops of the placement phase, searched offline and looked up by the bots
+during their first turns.
+
+The book is built for both colors in the frame of the bot (its pieces at the
+bottom). It has one move for every position the bot can reach while it
+follows the book: all the replies of the opponent are expanded, only the book
+move of the bot is. Every position is searched with an alpha-beta negamax to
+DEFAULT_DEPTH plies, which reaches the movement phase, and the positions of
+the same ply are shared between the processes of a pool.
+
+The captures left do not change the drops, so the keys are the Zobrist hashes
+of the states without the captures and one book serves any capture limit.
+
+File layout (native byte order, recorded in the header):
+
+    16 bytes  HEADER: MAGIC, byte order, depth, plies, unused, u32 count
+    u64       count keys, sorted
+    u8        count moves, in the order of the keys
+
+Build it with:
+
+    python opening_book.py
+"""
+from array import array
+from bisect import bisect_left
+import multiprocessing
+import mmap
+import os
+import struct
+import sys
+
+from bitboard import BLACK, WHITE
+from game_state import CAPTURES_KEYS, MAX_CAPTURES_CODE, PLACEMENT_PLIES, GameState
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, boundOf
+
+MAGIC = b'TTCBOOK1'
+HEADER = struct.Struct('<8scBBBI')
+
+BOOK_PATH = os.environ.get('TTC_OPENING_BOOK',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'opening_book.bin'))
+
+DEFAULT_DEPTH = 5
+# Captures left of both players in the positions that are searched
+SEARCH_CAPTURES = 5
+WIN_SCORE = 100
+TABLE_SIZE_MB = 64
+
+
+def bookKey(state):
+    key = state.hash
+    for index in (0, 1):
+        key ^= CAPTURES_KEYS[index][min(state.capturesLeft[index], MAX_CAPTURES_CODE)]
+    return key
+
+
+class OpeningBook:
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byteOrder, self.depth, self.plies, _, self.count = HEADER.unpack_from(self.data, 0)
+        if (magic != MAGIC or byteOrder != sys.byteorder[0].encode()
+                or len(self.data) != HEADER.size + 9 * self.count):
+            self.data.close()
+            raise ValueError('%s is not an opening book' % path)
+
+        view = memoryview(self.data)
+        self.keys = view[HEADER.size:HEADER.size + 8 * self.count].cast('Q')
+        self.moves = view[HEADER.size + 8 * self.count:]
+
+    def __len__(self):
+        return self.count
+
+    def probe(self, key):
+        # Returns the move of the position or None
+        index = bisect_left(self.keys, key)
+        if index < self.count and self.keys[index] == key:
+            return self.moves[index]
+        return None
+
+    def lookup(self, state):
+        # Book move of a state in the frame of the bot to move, None if the
+        # position is not in the book
+        if not state.isPlacementPhase() or state.sideToMove != state.bottomColor:
+            return None
+
+        move = self.probe(bookKey(state))
+        if move is None or move not in state.legalMoves():
+            return None
+        return move
+
+    def close(self):
+        self.keys.release()
+        self.moves.release()
+        self.data.close()
+
+
+_books = {}
+
+
+def loadBook(path=BOOK_PATH):
+    # Book of the path shared by the bots of the process, None if there is no
+    # book there (the bots play the opening without it)
+    if path not in _books:
+        try:
+            _books[path] = OpeningBook(path)
+        except (OSError, ValueError):
+            _books[path] = None
+
+    return _books[path]
+
+
+def _evaluate(state):
+    # Score for the side to move
+    return state.maxAligned(state.sideToMove) - state.maxAligned(-state.sideToMove)
+
+
+def _negamax(state, depth, alpha, beta, table):
+    # The side that just moved is the only one that can have won
+    if state.isWin(-state.sideToMove):
+        # A win with more depth left was found sooner
+        return -(WIN_SCORE + depth)
+    if depth == 0:
+        return _evaluate(state)
+
+    # The scores of the wins depend on the depth left, so only a search of
+    # the same depth can be reused
+    hashMove = 0
+    entry = table.probe(state.hash)
+    if entry is not None:
+        entryDepth, score, bound, hashMove = entry
+        if entryDepth == depth and (bound == EXACT or (bound == LOWER_BOUND and score >= beta)
+                                    or (bound == UPPER_BOUND and score <= alpha)):
+            return score
+
+    moves = state.legalMoves()
+    if not moves:
+        return _evaluate(state)
+    if hashMove in moves:
+        moves.remove(hashMove)
+        moves.insert(0, hashMove)
+
+    originalAlpha = alpha
+    bestScore = -WIN_SCORE * 2
+    bestMove = 0
+    for move in moves:
+        undo = state.makeMove(move)
+        score = -_negamax(state, depth - 1, -beta, -alpha, table)
+        state.unmakeMove(undo)
+
+        if score > bestScore:
+            bestScore = score
+            bestMove = move
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+
+    table.store(state.hash, depth, bestScore, boundOf(bestScore, originalAlpha, beta), bestMove)
+    return bestScore
+
+
+def searchMove(state, depth=DEFAULT_DEPTH, table=None):
+    # Best move of the side to move. The shallower iterations fill the table
+    # with the best moves, which are searched first by the next ones
+    if table is None:
+        table = TranspositionTable(TABLE_SIZE_MB)
+
+    for iteration in range(1, depth + 1):
+        _negamax(state, iteration, -WIN_SCORE * 2, WIN_SCORE * 2, table)
+
+    entry = table.probe(state.hash)
+    return entry[3] if entry is not None else None
+
+
+_table = None
+_depth = DEFAULT_DEPTH
+
+
+def _initWorker(depth):
+    global _table, _depth
+    _table = TranspositionTable(TABLE_SIZE_MB)
+    _depth = depth
+
+
+def _searchPosition(code):
+    return searchMove(GameState.decode(code), _depth, _table)
+
+
+def _replies(state):
+    # States after every move of the side to move
+    states = []
+    for move in state.legalMoves():
+        child = state.copy()
+        child.makeMove(move)
+        states.append(child)
+    return states
+
+
+def buildBook(path=BOOK_PATH, depth=DEFAULT_DEPTH, plies=PLACEMENT_PLIES, processes=None):
+    # Searches the book positions of the first plies and writes the file,
+    # returns the number of positions
+    book = {}
+    with multiprocessing.Pool(processes, initializer=_initWorker, initargs=(depth,)) as pool:
+        for bottomColor in (WHITE, BLACK):
+            root = GameState(bottomColor)
+            root.setCapturesLeft(WHITE, SEARCH_CAPTURES)
+            root.setCapturesLeft(BLACK, SEARCH_CAPTURES)
+            # White always starts, the bot plays black from the replies to the first drop
+            positions = [root] if bottomColor == WHITE else _replies(root)
+
+            while positions and positions[0].ply < plies:
+                moves = pool.map(_searchPosition, [state.encode() for state in positions], chunksize=16)
+
+                nextPositions = {}
+                for state, move in zip(positions, moves):
+                    if move is None:
+                        continue
+                    book[bookKey(state)] = move
+                    state.makeMove(move)
+                    if state.isWin(bottomColor):
+                        continue
+                    for reply in _replies(state):
+                        nextPositions.setdefault(reply.hash, reply)
+                positions = list(nextPositions.values())
+
+    writeBook(path, book, depth, plies)
+    return len(book)
+
+
+def writeBook(path, book, depth, plies):
+    keys = sorted(book)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file first so a bot never maps half a book
+    temporaryPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(temporaryPath, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, sys.byteorder[0].encode(), depth, plies, 0, len(keys)))
+        array('Q', keys).tofile(fp)
+        fp.write(bytes(book[key] for key in keys))
+    os.replace(temporaryPath, path)
+
+
+if __name__ == '__main__':
+    print('%d positions written to %s' % (buildBook(), BOOK_PATH))
@@ -13,18 +13,58 @@ import copy
 import random
 import time
 
+from analysis_cache import AnalysisCache
+from bitboard import OFF_BOARD, PIECES, positionOf
+from game_state import GameState, OpponentTracker
+from move_ordering import MoveOrdering
+from proof_search import PROVEN, ProofSearch
+from search import Deadline, iterativeDeepening
+from time_control import moveBudget
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, boundOf, childWindow, fromChild
+import bitboard
+import event_log
+
 #HACER FUNCION QUE CHECQUE SI LA PIECE FALTANTE PUEDE LLEGAR AL LUGAR
 
+# Time budget of every move, in seconds
+MOVE_TIME = 1.0
+# Part of the time of the move the proof of a forced win can take
+PROOF_TIME_SHARE = 0.3
+
+
 class TTCPlayer:
     # valuesCode is a list containing the value code that you must use to represent your pieces over the board. 
     # The sign of the value code will tell you if you are playing as white or black pieces.
     # The values are in the order: pawn, bishop, knight, rook
-    def __init__(self, name):
+    def __init__(self, name, moveTime=MOVE_TIME, keepTable=False, cachePath=None):
         self.name = name
+        # Seconds that every call to play can take
+        self.moveTime = moveTime
+        # Seconds the referee gives for the current move, None without a time control
+        self.timeLeft = None
         self.pawnDirection = -1
         self.currentTurn = -1
 
         self.piecesOnBoard = [0] * 5
+        # Square of every piece of the bot in the board of the turn, index 0 is unused
+        self.pieceSquares = [OFF_BOARD] * 5
+        # State of the board of the turn, built once by play()
+        self.state = None
+        # Positions already searched, kept between moves. With keepTable it
+        # is also kept between games
+        self.keepTable = keepTable
+        self.table = TranspositionTable()
+        # Positions searched by any process and any run, see analysis_cache.py
+        self.cachePath = cachePath
+        self.cache = None
+        # Killer moves and history of the cutoffs, to try the best moves first
+        self.ordering = MoveOrdering()
+        # Depth of the current iteration and the clock of the current move
+        self.searchDepth = 3
+        self.deadline = Deadline(math.inf)
+        self.rootMove = None
+        # Looks for forced wins when 3 pieces are aligned, see proof_search.py
+        self.prover = ProofSearch()
 
     def print_matrix_mirror(self, matrix):
         for row in reversed(matrix):
@@ -34,6 +74,8 @@ class TTCPlayer:
         self.piecesCode = [0, 1, 2, 3, 4]
         self.piecesCode = [x*piecesColor for x in self.piecesCode]
         self.piecesColor = piecesColor
+        # The opponent's captures are not known, assume the same limit as ours
+        self.opponent = OpponentTracker(piecesColor, 5)
 
     def __updatePawnDirection(self, board):
         # If the pawn is in the limit of the board, it should reverse
@@ -47,9 +89,6 @@ class TTCPlayer:
     def __sameSign(self, a, b):
         return ((a < 0 and b < 0) or (a > 0  and b > 0))
     
-    def __isInsideBoard(self, row, col):
-        return (row >= 0 and row < 4 and col >= 0 and col < 4)
-
         # Function to check whether a movement was a movement or not
     # If it was a movement, it also checks if it was a capture or not.
     # For a movement to be classified as a capture, 2 conditions have to occur
@@ -83,126 +122,13 @@ class TTCPlayer:
 
         return (wasMovement, wasCapture)
 
-    def __getPawnValidMovements(self, position, board, pawnDirection):
-        validMovements = []
-        
-        row, col = position
-
-        newRow = row + pawnDirection
-        if self.__isInsideBoard(newRow, col) and board[newRow][col] == 0:
-            validMovements.append((newRow, col))
-
-        for offset in [-1, 1]:
-            newCol = col + offset
-            if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
-    
-    def __getBishopValidMovements(self, position, board):
-        validMovements = []
-
-        row, col = position
-
-        # Define the four diagonal directions
-        directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-
-        for direction in directions:
-            deltaRow, deltaCol = direction
-            newRow, newCol = row + deltaRow, col + deltaCol
-
-            while self.__isInsideBoard(newRow, newCol):
-                if board[newRow][newCol] == 0:
-                    validMovements.append((newRow, newCol))
-                elif not self.__sameSign(board[newRow][newCol], board[row][col]):
-                    validMovements.append((newRow, newCol))
-                    break
-                else:
-                    break
-
-                newRow += deltaRow
-                newCol += deltaCol
-
-        return validMovements
-
-
-    def __getKnightValidMovements(self, position, board):
-        validMovements = []
-
-        row, col = position
-
-        movements = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-
-        for movement in movements:
-            deltaRow, deltaCol = movement
-            newRow, newCol = row + deltaRow, col + deltaCol
-            if self.__isInsideBoard(newRow, newCol) and (board[newRow][newCol] == 0 or not self.__sameSign(board[newRow][newCol], board[row][col])):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getRookValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Checks whether or not I have found a piece in this direction
-        # 0 - Up
-        # 1 - Right
-        # 2 - Down
-        # 3 - Left
-        dirPieceEncountered = [False] * 4
-
-        # Describe the direction of movement for the rook
-        # The order is the same as described above
-        movDirection = [[-1, 0],
-                        [0, 1],
-                        [1, 0],
-                        [0, -1]]
-        
-        # The rook can move maximum 3 squares
-        for i in range(1, 4):
-            # Loop through all possible movements
-            for j in range(4):
-                newRow = row + i * movDirection[j][0]
-                newCol = col + i * movDirection[j][1]
-
-                if not dirPieceEncountered[j] and self.__isInsideBoard(newRow, newCol):
-                    if board[newRow][newCol] != 0:
-                        if not self.__sameSign(board[newRow][newCol], board[row][col]):
-                            validMovements.append((newRow, newCol))
-                        dirPieceEncountered[j] = True
-                    else:
-                        validMovements.append((newRow, newCol))
-
-        return validMovements        
-
     def __getValidMovements(self, pieceCode, position, board):
-        if abs(pieceCode) == 1:
-            return self.__getPawnValidMovements(position, board, self.pawnDirection)
-        elif abs(pieceCode) == 2:
-            return self.__getBishopValidMovements(position, board)
-        elif abs(pieceCode) == 3:
-            return self.__getKnightValidMovements(position, board)
-        elif abs(pieceCode) == 4:
-            return self.__getRookValidMovements(position, board)
+        if abs(pieceCode) in PIECES:
+            return bitboard.getValidMovements(pieceCode, position, board, self.pawnDirection)
         else:
             print("Piece ", pieceCode, " not recognized")
             return []
 
-    def __getCurrentValidMovements(self, board, piecesColor):
-        pieces = [1, 2, 3, 4] if piecesColor == 1 else [-1, -2, -3, -4]
-        validMovements = []
-        
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                if board[i][j]-1 in pieces:
-                    pieceCode = pieces[board[i][j]-1]
-                    #piecesOnBoard.append(board[i][j])
-                    validMovements.append((self.__getValidMovements(pieceCode, (i, j), board), pieceCode))
-
-        return validMovements
     def __moveRandomPiece(self, board):
         #print(self.name, "::moveRandomPiece")
         piece = 0
@@ -211,17 +137,7 @@ class TTCPlayer:
             piece = random.randint(1, 4)
         
         pieceCode = self.piecesCode[piece]
-        row = -1
-        col = -1
-
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                if board[i][j] == pieceCode:
-                    row = i
-                    col = j
-
-                    i = len(board)
-                    break
+        row, col = positionOf(self.pieceSquares[piece])
 
         validMovements = self.__getValidMovements(pieceCode, (row, col), board)
         if len(validMovements) == 0:
@@ -234,94 +150,87 @@ class TTCPlayer:
 
         return board
     
-    def __movePiece(self, currentBoard):
-        #print(self.name, "::moveRandomPiece")
-        row = -1
-        col = -1
-
-        #Copy the board
+    def __movePiece(self, currentBoard, dropsOnly=False):
+        # Copy the board
         board = [row[:] for row in currentBoard]
-        #Set bestScore to a very small value
-        bestScore = -math.inf
-
-        move = None
-        bestPiece = None
-        #For every possible move
-        pieces = self.getMissingPieces(board, self.piecesColor)
-        
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                # si es una casilla vacia probamos con las piezas que no estan en el tablero
-                if board[i][j] == 0:
-                    for k in pieces:
-                        #Put 'O' in the available position
-                        board[i][j] = k
-
-                        #Call minimax to see how good the move is
-                        #isMaximizing is false because it would be the human's turn
-                        #Set alpha to a very small value and beta to a very large one
-                        score = self.minimaxAB(board, 0, -math.inf, math.inf, True)
-
-                        #Undo the change to the board
-                        board[i][j] = 0
-
-                        #If the score is bigger than the current best score
-                        if score > bestScore:
-                            #Set bestScore to score and save the move
-                            bestScore = score
-                            lastPosition = [i, j]
-                            move = [i, j]
-                            bestPiece = k
-                # si es una de mis piezas
-                elif board[i][j] in self.piecesCode:
-                    kValidMoves = self.__getValidMovements(board[i][j], (i,j), board)
-                    for coor in kValidMoves:
-                        #print(coor)
-                        a, b = coor
-
-                        #guardamos cual es la pieza
-                        pastPiece = board[a][b]
-                        #ponemos la pieza en la nueva posición 
-                        board[a][b] = board[i][j]
-
-                        #Call minimax to see how good the move is
-                        #isMaxismizing is false because it would be the human's turn
-                        #Set alpha to a very small value and beta to a very large one
-                        score = self.minimaxAB(board, 0, -math.inf, math.inf, True)
-
-                        #Undo the change to the board
-                        board[a][b] = pastPiece
-
-                        #If the score is bigger than the current best score
-                        if score > bestScore:
-                            #Set bestScore to score and save the move
-                            bestScore = score
-                            lastPosition = [i, j]
-                            move = [a, b]
-                            bestPiece = board[i][j]
-
-
-        #After we checked every move, return the best one
-        #print("a", move)
-
-        #if move is not None:
-        newRow, newCol = move
-        row, col = lastPosition
+        # The board is the one of the turn, the move is played over a copy of its state
+        state = self.state.copy()
+        # With 3 pieces aligned a forced win can end the move before the search
+        if not dropsOnly and (state.maxAligned(self.piecesColor) == 3 or state.maxAligned(-self.piecesColor) == 3):
+            provenMove = self.__provenWin(state)
+            if provenMove is not None:
+                state.makeMove(provenMove)
+                return state.toBoard()
+
+        self.table.newSearch()
+        self.ordering.newSearch()
+        self.rootMove = None
+
+        # Deepen 1, 2, 3, ... until the time of the move is over. The search
+        # can stop in the middle of a move, so it runs over a copy of the state.
+        # Only wins are scored, so any other score than 0 is already decided
+        searchState = state.copy()
+        bestMove, _, _ = iterativeDeepening(
+            lambda searchDepth: self.__searchRoot(searchState, searchDepth, dropsOnly), self.deadline,
+            isDecisive=lambda score: score != 0)
+
+        # After we checked every move, return the best one
+        if bestMove is None:
+            return board
 
-        board[row][col] = 0
-        board[newRow][newCol] = bestPiece
+        state.makeMove(bestMove)
+        return state.toBoard()
 
-        return board
-        
-        #return self.__moveRandomPiece(currentBoard)
+    def __provenWin(self, state):
+        # The first move of a forced win of the bot, None if it is not proven
+        deadline = Deadline(self.deadline.remaining() * PROOF_TIME_SHARE)
+        result, move = self.prover.prove(state, self.piecesColor, deadline)
+        return move if result == PROVEN else None
 
-    def __updatePiecesOnBoard(self, board):
-        self.piecesOnBoard = [0] * 5
-
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                if self.__sameSign(board[i][j], self.piecesColor):
-                    self.piecesOnBoard[abs(board[i][j])] = 1
+    def __searchRoot(self, state, searchDepth, dropsOnly=False):
+        self.searchDepth = searchDepth
+        # Set bestScore to a very small value
+        bestScore = -math.inf
+        bestMove = None
+
+        moves = state.legalMoves()
+        if dropsOnly:
+            # Drops are the moves of pieces that are not on the board
+            myPieces = state.board.pieces[bitboard.colorIndex(self.piecesColor)]
+            moves = [move for move in moves if not myPieces[move >> 4]]
+        # The best move of the previous depth is searched first
+        moves = self.ordering.orderMoves(state, moves, 0, self.rootMove)
+
+        # For every possible move, call minimax to see how good the move is
+        for candidate in moves:
+            undo = state.makeMove(candidate)
+
+            # isMaximizing is false because it would be the opponent's turn
+            # Only moves better than the best one so far are interesting, so alpha is bestScore
+            score = fromChild(self.minimaxAB(state, 1, *childWindow(bestScore, math.inf), False))
+
+            # Undo the move
+            state.unmakeMove(undo)
+
+            # If the score is bigger than the current best score
+            if score > bestScore:
+                # Set bestScore to score and save the move
+                bestScore = score
+                bestMove = candidate
+
+        self.rootMove = bestMove
+        return bestMove, bestScore
+
+    def __getState(self, board):
+        return GameState.fromPlayerView(board, self.piecesColor, self.currentTurn,
+                                        self.pawnDirection, self.opponent.pawnDirection,
+                                        self.availableCaptures, self.opponent.availableCaptures)
+
+    def __updatePiecesOnBoard(self, state):
+        # The squares of the pieces come from the state of the board of the turn
+        for piece in PIECES:
+            self.pieceSquares[piece] = state.pieceSquare(self.piecesColor, piece)
+            self.piecesOnBoard[piece] = int(self.pieceSquares[piece] != OFF_BOARD)
 
     def __putRandomPiece(self, currentBoard):
         #Copy the board
@@ -341,59 +250,26 @@ class TTCPlayer:
                         board[row][col] = self.piecesCode[2]
                         return board
         else:
-            #myAlignedValue, myAlignedPieces, myMissingPieces, myMissingPositions= self.maxAlignedValue(board, self.piecesColor)
-            pieces = self.getMissingPieces(board, self.piecesColor)
-            
-            row = -1
-            col = -1
-            #Set bestScore to a very small value
-            bestScore = -math.inf
-
-            move = None
-            bestPiece = None
-
-            for i in range(len(board)):
-                for j in range(len(board[0])):
-                    if board[i][j] == 0:
-                        for k in pieces:
-                            #Put 'O' in the available position
-                            board[i][j] = k
-
-                            #Call minimax to see how good the move is
-                            #isMaximizing is false because it would be the human's turn
-                            #Set alpha to a very small value and beta to a very large one
-                            score = self.minimaxAB(board, 0, -math.inf, math.inf, True)
-
-                            #Undo the change to the board
-                            board[i][j] = 0
-
-                            #If the score is bigger than the current best score
-                            if score > bestScore:
-                                #Set bestScore to score and save the move
-                                bestScore = score
-                                lastPosition = [i, j]
-                                #move = [i, j]
-                                bestPiece = k
-
-            #newRow, newCol = move
-            row, col = lastPosition
-
-            board[row][col] = bestPiece
-            #board[newRow][newCol] = bestPiece
+            # Search the best square for the pieces that are not on the board
+            board = self.__movePiece(board, dropsOnly=True)
 
         return board
 
     def play(self, board):
         start = time.time()
+        self.deadline = Deadline(moveBudget(self.moveTime, self.timeLeft))
+        self.__openCache()
         self.currentTurn += 1
-        self.__updatePiecesOnBoard(board)
+        self.opponent.update(board)
+        self.state = self.__getState(board)
+        self.__updatePiecesOnBoard(self.state)
 
         originalBoard = copy.deepcopy(board)
 
         # We put a limit since there can be a really rare case when the only valid movement is a capture
         # And if in that moment it happens that you can no longer make any capture, it will cicle. That's why we put a limit.
         for n,_ in enumerate(range(100)):
-            if n<5 and (time.time() - start)<3:
+            if n<5 and not self.deadline.expired():
                 #print("heuristic")
                 if self.currentTurn < 3: # or sum(self.piecesOnBoard) == 0:
                     newBoard = self.__putRandomPiece(board)
@@ -416,7 +292,8 @@ class TTCPlayer:
                 break
         
         self.__updatePawnDirection(newBoard)
-        print("Time taken: ", time.time() - start)
+        self.opponent.setLastBoard(newBoard)
+        event_log.emit('move_time', self.name, time.time() - start)
         
         #self.print_matrix_mirror(newBoard)
         #print(newBoard, flush=True)
@@ -424,87 +301,106 @@ class TTCPlayer:
         #return utils.updateSyncBoard(syncBoard, newBoard)
         return newBoard
 
-    #Minimax with Alpha-Beta pruning
-    def minimaxAB(self, currentBoard, depth, alpha, beta, isMaximizing):
-        #Copy the board
-        board = [row[:] for row in currentBoard]
-
-        #Evaluate the current position
-        result = self.evaluatePosition(board)
-
-        #If someone won
-        if result == 10 or result == -10 or depth == 3:
-            #Set eval to the value of the result in the dictionary
-            
-            #If the bot won, return the evaluation minus the depth, we want the fastest way to win
-            #If the human won, return the evaluation plus the depth, the human would want the fastest win
-            return result - depth if result > 0 else result + depth
-
-        #Truno de nuestro bot
+    # Minimax with Alpha-Beta pruning
+    # Moves are played and undone over the same state, no board is copied
+    def minimaxAB(self, state, depth, alpha, beta, isMaximizing):
+        # Stops the search if the time of the move is over
+        self.deadline.tick()
+
+        # Evaluate the current position
+        result = self.evaluatePosition(state)
+
+        # If someone won or we got to the depth of this iteration
+        if result == 10 or result == -10 or depth >= self.searchDepth:
+            return result
+
+        # If this position was already searched deep enough, use that result
+        remainingDepth = self.searchDepth - depth
+        hashMove = 0
+        entry = self.table.probe(state.hash)
+        if entry is None and self.cache is not None:
+            entry = self.cache.probe(state.hash)
+        if entry is not None:
+            entryDepth, score, bound, hashMove = entry
+            if entryDepth >= remainingDepth:
+                if (bound == EXACT or (bound == LOWER_BOUND and score >= beta)
+                        or (bound == UPPER_BOUND and score <= alpha)):
+                    return score
+
+        moves = state.legalMoves()
+        if not moves:
+            return result
+        # Try first the moves that are more likely to cause a cutoff
+        moves = self.ordering.orderMoves(state, moves, depth, hashMove)
+
+        originalAlpha, originalBeta = alpha, beta
+        bestMove = 0
+
+        # Turno de nuestro bot
         if isMaximizing:
-            #Set maxEval to a very small value
+            # Set maxEval to a very small value
             maxEval = -math.inf
 
-            #For every possible position in the board
-            validMovements = self.__getCurrentValidMovements(board, self.piecesColor)  
-            for coorx, piece in validMovements:
-                #Put 'O' in the position
-                for coor in coorx:
-                    #print(coor)
-                    i,j = coor
-                    board[i][j] = piece
-
-                    #New call to the minimax function with the new position
-                    #Add one to the depth to know how many moves have been done
-                    #isMaximizing is false because it would be the human's turn   
-                    eval = self.minimaxAB(board, depth + 1, alpha, beta, False)
-
-                    #Undo the move
-                    board[i][j] = 0
-
-                    #Set maxEval to the maximum between the current maxEval and the eval minimax returned
-                    maxEval = max(maxEval, eval)
-                    #Set alpha to the maximum between the current alpha and the eval minimax returned
-                    alpha = max(alpha, eval)
-                    #If beta is less or equal to alpha, we dont need to continue trying moves, so we break the loop
-                    if beta <= alpha:
-                        break
-
-            #After all the moves, return the maxEval
-            return maxEval    
-
-        # turno del bot contrincante
+            # For every possible move of the side to move
+            for index, move in enumerate(moves):
+                undo = state.makeMove(move)
+
+                # New call to the minimax function with the new position
+                # Add one to the depth to know how many moves have been done
+                # isMaximizing is false because it would be the opponent's turn
+                eval = fromChild(self.minimaxAB(state, depth + 1, *childWindow(alpha, beta), False))
+
+                # Undo the move
+                state.unmakeMove(undo)
+
+                # Set maxEval to the maximum between the current maxEval and the eval minimax returned
+                if eval > maxEval:
+                    maxEval = eval
+                    bestMove = move
+                # Set alpha to the maximum between the current alpha and the eval minimax returned
+                alpha = max(alpha, eval)
+                # If beta is less or equal to alpha, we dont need to continue trying moves, so we break the loop
+                if beta <= alpha:
+                    self.ordering.recordCutoff(state, move, depth, remainingDepth, index)
+                    break
+
+            bestEval = maxEval
+
+        # Turno del bot contrincante
         else:
-            #Set minEval to a very large value
+            # Set minEval to a very large value
             minEval = math.inf
 
-            #For every possible position in the board
-            validMovements = self.__getCurrentValidMovements(board, self.piecesColor*-1)  
-            for coorx, piece in validMovements:
-                #Put 'O' in the position
-                for coor in coorx:
-                    i,j = coor
-                    board[i][j] = piece
-
-                    #New call to the minimax function with the new position
-                    #Add one to the depth to know how many moves have been done
-                    #isMaximizing is true because it would be the bot's turn    
-                    eval = self.minimaxAB(board, depth + 1, alpha, beta, True)
-
-                    #Undo the move
-                    board[i][j] = 0
-
-                    #Set minEval to the minimum between the current minEval and the eval minimax returned
-                    minEval = min(minEval, eval)
-                    #Set beta to the minimum between the current beta and the eval minimax returned
-                    beta = min(beta, eval)
-                    #If beta is less or equal to alpha, we dont need to continue trying moves, so we break the loop
-                    if beta <= alpha:
-                        break
-
-            #After all the moves, return the minEval
-            return minEval
-    
+            for index, move in enumerate(moves):
+                undo = state.makeMove(move)
+
+                # isMaximizing is true because it would be the bot's turn
+                eval = fromChild(self.minimaxAB(state, depth + 1, *childWindow(alpha, beta), True))
+
+                # Undo the move
+                state.unmakeMove(undo)
+
+                # Set minEval to the minimum between the current minEval and the eval minimax returned
+                if eval < minEval:
+                    minEval = eval
+                    bestMove = move
+                # Set beta to the minimum between the current beta and the eval minimax returned
+                beta = min(beta, eval)
+                # If beta is less or equal to alpha, we dont need to continue trying moves, so we break the loop
+                if beta <= alpha:
+                    self.ordering.recordCutoff(state, move, depth, remainingDepth, index)
+                    break
+
+            bestEval = minEval
+
+        # Save the result, it is exact only if it was inside the original window
+        self.table.store(state.hash, remainingDepth, bestEval,
+                         boundOf(bestEval, originalAlpha, originalBeta), bestMove)
+        if self.cache is not None:
+            self.cache.store(state.hash, remainingDepth, bestEval,
+                             boundOf(bestEval, originalAlpha, originalBeta), bestMove)
+        return bestEval
+
     def countCenterPieces(self, board, pieceColor):
         center = [(1, 1), (1, 2), (2, 1), (2, 2)]  # Coordinates of the center square
 
@@ -520,73 +416,21 @@ class TTCPlayer:
         return count
 
 
-    def evaluatePosition(self, board):
-        
-        '''
-        if self.checkVictory(board, self.piecesColor):
-            return 10
-        elif self.checkVictory(board, self.piecesColor*-1):
-            return -10
-        '''
-            
-        myAlignedValue, myAlignedPieces, myMissingPieces, myMissingPositions= self.maxAlignedValue(board, self.piecesColor)
-        oppAlignedValue, oppAlignedPieces, oppMissingPieces, oppMissingPositions = self.maxAlignedValue(board, self.piecesColor*-1)
-    
+    def evaluatePosition(self, state):
+        # The state keeps the pieces of every line, see game_state.py
+        myAlignedValue = state.maxAligned(self.piecesColor)
+        oppAlignedValue = state.maxAligned(-self.piecesColor)
 
-        '''
-        if myAlignedValue == 3:
-            if self.isValidMove(board, myMissingPieces, myMissingPositions):
-                return 8
-            return 7
-        elif(oppAlignedValue == 3): 
-            if (self.isValidMove(board, oppMissingPieces, oppMissingPositions)):
-                return -8
-            return -7
-        elif myAlignedValue == oppAlignedPieces:
-            if(self.piecesColor in myAlignedPieces and self.piecesColor*2 in myAlignedPieces):
-                return 6
-            elif (self.piecesColor in myAlignedPieces or self.piecesColor*2 in myAlignedPieces):
-                return 3
-            elif(self.piecesColor*-1 in myAlignedPieces and self.piecesColor*-2 in myAlignedPieces):
-                return -6
-            elif (self.piecesColor*-1 in myAlignedPieces or self.piecesColor*-2 in myAlignedPieces):
-                return -3
-            myAlignedValue = self.countCenterPieces(board, self.piecesColor)
-            oppAlignedValue = self.countCenterPieces(board, self.piecesColor*-1)
-            '''
         if myAlignedValue > oppAlignedValue:
             return 10
         elif myAlignedValue < oppAlignedValue:
             return -10
 
-            #return -1
         return 0
 
 
     def checkVictory(self, board, piecesColor):
-        target_numbers = {1, 2, 3, 4} if piecesColor == 1 else {-1, -2, -3, -4}
-
-        # Check horizontally
-        for row in board:
-            if set(row) - {0} == target_numbers:
-                return True
-
-        # Check vertically
-        for col in range(len(board[0])):
-            column_values = [board[row][col] for row in range(len(board))]
-            if set(column_values) - {0} == target_numbers:
-                return True
-
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board))]
-        if set(diagonal_values) - {0} == target_numbers:
-            return True
-
-        reverse_diagonal_values = [board[i][len(board)-1-i] for i in range(len(board))]
-        if set(reverse_diagonal_values) - {0} == target_numbers:
-            return True
-
-        return False
+        return bitboard.isWinningPosition(board, piecesColor)
 
     def getMissingPieces(self, board, pieceColor):
         numbers = {1, 2, 3, 4} if pieceColor == 1 else {-1, -2, -3, -4}
@@ -602,125 +446,26 @@ class TTCPlayer:
         return missing_numbers
 
     def maxAlignedValue(self, board, number_sign):
-        target_numbers = {1, 2, 3, 4} if number_sign == 1 else {-1, -2, -3, -4}
-        max_value = 0
-        aligned_numbers = set()
-        missing_numbers = set(target_numbers)
-        missing_positions = set()
-
-        # Check horizontally
-        for row in range(len(board)):
-            aligned_values = [board[row][col] for col in range(len(board[row])) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for col in range(len(board[row])) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-
-        # Check vertically
-        for col in range(len(board[0])):
-            aligned_values = [board[row][col] for row in range(len(board)) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for row in range(len(board)) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board)) if board[i][i] != 0 and board[i][i] in target_numbers]
-        #print(diagonal_values)
-        if len(diagonal_values) > max_value:
-            max_value = len(diagonal_values)
-            aligned_numbers = set(diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, i) for i in range(len(board)) if (board[i][i] == 0 or board[i][i] not in target_numbers)}
-
-        reverse_diagonal_values = [board[i][len(board)-1-i] for i in range(len(board)) if board[i][len(board)-1-i] != 0 and board[i][len(board)-1-i] in target_numbers]
-        #print(reverse_diagonal_values)
-        if len(reverse_diagonal_values) > max_value:
-            max_value = len(reverse_diagonal_values)
-            aligned_numbers = set(reverse_diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, len(board)-1-i) for i in range(len(board)) if (board[i][len(board)-1-i] == 0 or board[i][len(board)-1-i] not in target_numbers)}
-
+        # max_value, aligned_numbers, missing_numbers, missing_positions of the
+        # line with the most pieces, see bitboard.alignment
+        max_value, aligned_numbers, missing_numbers, missing_positions, _ = bitboard.alignment(board, number_sign)
         return max_value, aligned_numbers, missing_numbers, missing_positions
 
-
-    def can_pawn_move_vertically(self, board, current_position, target_position):
-        current_row, current_col = current_position
-        target_row, target_col = target_position
-
-        if abs(target_row-current_row) == abs(target_col-current_col) == 1 and board[target_row][target_col] != 0 and self.currentTurn>0:
-            return True
-
-        if current_col != target_col:
-            return False  # Pawns can only move vertically, not horizontally
-
-        if current_row < target_row:
-            # Check if there are any pieces blocking the pawn's vertical movement
-            for row in range(current_row + 1, target_row):
-                if board[row][current_col] != 0:
-                    return False  # There is a piece blocking the pawn's path
-
-        else:  # current_row > target_row
-            # Check if there are any pieces blocking the pawn's vertical movement
-            for row in range(target_row + 1, current_row):
-                if board[row][current_col] != 0:
-                    return False  # There is a piece blocking the pawn's path
-
-        return True  # The pawn can move vertically to the target position
-
-    def isValidMove(self, board, piece, target_position):
-        # Check if the piece is already aligned or missing
-        if piece == 0:
-            return True
-
-
-        for piece, position in zip(piece, target_position):
-            x, y = position
-
-            if(board[x][y] != 0 and self.currentTurn>0):
-                if piece == 1 or piece == -1:
-                    row = -1
-                    col = -1
-                    for i in range(4):
-                        for j in range(4):
-                            if board[i][j] == piece:
-                                row = i
-                                col = j
-                                break
-                    if(self.can_pawn_move_vertically(board, (row,col), (x,y))): 
-                        return True
-                    
-                elif piece == 2 or piece == -2:
-                    row = -1
-                    col = -1
-                    for i in range(4):
-                        for j in range(4):
-                            if board[i][j] == piece:
-                                row = i
-                                col = j
-                                break
-                    # Bishop can go to cells with the same parity as the initial position
-                    if (x + y) % 2 == (row + col) % 2:
-                        return True
-
-                elif piece == 3 or piece == -3:
-                    # Knight can go to any cell, no restrictions
-                    return True
-
-                elif piece == 4 or piece == -4:
-                    # Rook can go to any cell, no restrictions
-                    return True
-
-                # Invalid piece value
-                return False
-            
-            return False
-
+    def __openCache(self):
+        # The cache is opened when the bot plays, so the bot can still be sent
+        # to another process before that
+        if self.cachePath is not None and self.cache is None:
+            try:
+                self.cache = AnalysisCache(self.cachePath, namespace=__name__)
+            except (OSError, ValueError):
+                # The cache is only an optimization, play without it
+                self.cachePath = None
 
     def reset(self):
+        if not self.keepTable:
+            self.table.clear()
         self.pawnDirection = -1
         self.piecesOnBoard = [0] * 5
+        self.pieceSquares = [OFF_BOARD] * 5
         self.currentTurn = -1
         self.availableCaptures = 5
\ No newline at end of file
@@ -13,13 +13,21 @@ import copy
 import random
 import time
 
+from bitboard import PIECES
+from game_state import GameState
+from opening_book import BOOK_PATH, loadBook
+import bitboard
+import event_log
+
 
 class TTCPlayer:
     # valuesCode is a list containing the value code that you must use to represent your pieces over the board.
     # The sign of the value code will tell you if you are playing as white or black pieces.
     # The values are in the order: pawn, bishop, knight, rook
-    def __init__(self, name):
+    def __init__(self, name, bookPath=BOOK_PATH):
         self.name = name
+        # Drops of the first turns, see opening_book.py
+        self.bookPath = bookPath
         self.pawnDirection = -1
         self.currentTurn = -1
 
@@ -44,9 +52,6 @@ class TTCPlayer:
     def __sameSign(self, a, b):
         return ((a < 0 and b < 0) or (a > 0 and b > 0))
 
-    def __isInsideBoard(self, row, col):
-        return (row >= 0 and row < 4 and col >= 0 and col < 4)
-
         # Function to check whether a movement was a movement or not
     # If it was a movement, it also checks if it was a capture or not.
     # For a movement to be classified as a capture, 2 conditions have to occur
@@ -81,142 +86,9 @@ class TTCPlayer:
 
         return (wasMovement, wasCapture)
 
-    def __getPawnValidMovements(self, position, board, pawnDirection):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Move 1 to the front
-        newRow = row + pawnDirection
-        if self.__isInsideBoard(newRow, col) and board[newRow][col] == 0:
-            validMovements.append((newRow, col))
-
-        # Attack to the left
-        newCol = col - 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        # Attack to the right
-        newCol = col + 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getBishopValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # To check whether I already encountered a piece in this diagonal or not
-        # 0 -> Up-Left Diagonal
-        # 1 -> Up-Right Diagonal
-        # 2 -> Down-Left Diagonal
-        # 3 -> Down-Right Diagonal
-        diagEncounteredPiece = [False] * 4
-
-        # Describe the direction of the movement for the bishop in the same
-        # order as described above
-        movDirection = [[-1, -1],
-                        [-1, 1],
-                        [1, -1],
-                        [1, 1]]
-
-        # A bishop can move at most 3 squares
-        for i in range(1, 4):
-            # Check 4 directions of movement
-            for j in range(4):
-                newCol = col + i * movDirection[j][0]
-                newRow = row + i * movDirection[j][1]
-
-                # If I haven't found a piece yet in this direction and its inside the board
-                if not diagEncounteredPiece[j] and self.__isInsideBoard(newRow, newCol):
-                    # If the proposed square its occupied
-                    if board[newRow][newCol] != 0:
-                        # If the piece that occupies the square its from the opponent, then its a valid movement
-                        if not self.__sameSign(board[row][col], board[newRow][newCol]):
-                            validMovements.append((newRow, newCol))
-                        diagEncounteredPiece[j] = True
-                    else:  # If not, just append the movement
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getKnightValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Describe the movements of the knight
-        movements = [[-2, 1],
-                     [-1, 2],
-                     [1, 2],
-                     [2, 1],
-                     [2, -1],
-                     [1, -2],
-                     [-1, -2],
-                     [-2, -1]]
-
-        # Loop through all possible movements
-        for move in movements:
-            newRow = row + move[0]
-            newCol = col + move[1]
-
-            # For the knight we just need to check if the new square is valid and it is not occupied by a piece of the same color
-            if self.__isInsideBoard(newRow, newCol) and not self.__sameSign(board[row][col], board[newRow][newCol]):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getRookValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Checks whether or not I have found a piece in this direction
-        # 0 - Up
-        # 1 - Right
-        # 2 - Down
-        # 3 - Left
-        dirPieceEncountered = [False] * 4
-
-        # Describe the direction of movement for the rook
-        # The order is the same as described above
-        movDirection = [[-1, 0],
-                        [0, 1],
-                        [1, 0],
-                        [0, -1]]
-
-        # The rook can move maximum 3 squares
-        for i in range(1, 4):
-            # Loop through all possible movements
-            for j in range(4):
-                newRow = row + i * movDirection[j][0]
-                newCol = col + i * movDirection[j][1]
-
-                if not dirPieceEncountered[j] and self.__isInsideBoard(newRow, newCol):
-                    if board[newRow][newCol] != 0:
-                        if not self.__sameSign(board[newRow][newCol], board[row][col]):
-                            validMovements.append((newRow, newCol))
-                        dirPieceEncountered[j] = True
-                    else:
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
-
     def __getValidMovements(self, pieceCode, position, board):
-        if abs(pieceCode) == 1:
-            return self.__getPawnValidMovements(position, board, self.pawnDirection)
-        elif abs(pieceCode) == 2:
-            return self.__getBishopValidMovements(position, board)
-        elif abs(pieceCode) == 3:
-            return self.__getKnightValidMovements(position, board)
-        elif abs(pieceCode) == 4:
-            return self.__getRookValidMovements(position, board)
+        if abs(pieceCode) in PIECES:
+            return bitboard.getValidMovements(pieceCode, position, board, self.pawnDirection)
         else:
             print("Piece ", pieceCode, " not recognized")
             return []
@@ -264,6 +136,23 @@ class TTCPlayer:
                     #print(board[i][j], i, j)
                     self.enemyPiecesOnBoard[abs(board[i][j])] = 1
 
+    def __bookMove(self, board):
+        # Board after the drop of the opening book, None if the position is not in it
+        book = loadBook(self.bookPath)
+        if book is None:
+            return None
+
+        # During the placement a pawn only changes its direction when it is
+        # dropped on the last row
+        enemyPawnDirection = -1 if -self.piecesColor in board[3] else 1
+        state = GameState.fromPlayerView(board, self.piecesColor, self.currentTurn, self.pawnDirection,
+                                         enemyPawnDirection, self.availableCaptures, self.availableCaptures)
+        move = book.lookup(state)
+        if move is None:
+            return None
+        state.makeMove(move)
+        return state.toBoard()
+
     def __putRandomPiece(self, board):
         piece = -1
 
@@ -309,7 +198,7 @@ class TTCPlayer:
                     return board
             if self.piecesOnBoard[3] == 0:
                 for k in myMissingPositions:
-                    horseMoves = self.__getKnightValidMovements(k,board)
+                    horseMoves = bitboard.getValidMovements(self.piecesCode[3], k, board, self.pawnDirection)
                     for h in horseMoves:
                         a, b = h
                         if board[a][b]==0:
@@ -389,7 +278,7 @@ class TTCPlayer:
                     if (board[x][y] == 0 and self.piecesOnBoard[abs(k)] == 0):
                         board[x][y] = k
                         self.__updatePawnDirection(board)
-                        print("Time taken: ", time.time() - start)
+                        event_log.emit('move_time', self.name, time.time() - start)
                         return board
             for i in range(len(board)):
                 for j in range(len(board[0])):
@@ -401,13 +290,15 @@ class TTCPlayer:
                                 board[x][y] = board[i][j]
                                 board[i][j] = 0
                                 self.__updatePawnDirection(board)
-                                print("Time taken: ", time.time() - start)
+                                event_log.emit('move_time', self.name, time.time() - start)
                                 return board
 
         quienSoy = 0
         for n in range(1000):
             if self.currentTurn < 3 or sum(self.piecesOnBoard) < 4:
-                newBoard = self.__putRandomPiece(board)
+                newBoard = self.__bookMove(board) if n == 0 and self.currentTurn < 3 else None
+                if newBoard is None:
+                    newBoard = self.__putRandomPiece(board)
                 quienSoy = 1
             elif n > 0:  # All the pieces are on the board
                 newBoard = self.__moveRandomPiece(board)  # Make a random move
@@ -430,7 +321,7 @@ class TTCPlayer:
                 break
 
         self.__updatePawnDirection(newBoard)
-        print("Time taken: ", time.time() - start)
+        event_log.emit('move_time', self.name, time.time() - start)
 
         #for row in newBoard:
         #    print(row)
@@ -438,30 +329,7 @@ class TTCPlayer:
         return newBoard
 
     def __checkVictory(self, board, piecesColor):
-        target_numbers = {1, 2, 3, 4} if piecesColor == 1 else {-1, -2, -3, -4}
-
-        # Check horizontally
-        for row in board:
-            if set(row) == target_numbers:
-                return True
-
-        # Check vertically
-        for col in range(len(board[0])):
-            column_values = [board[row][col] for row in range(len(board))]
-            if set(column_values) == target_numbers:
-                return True
-
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board))]
-        if set(diagonal_values) == target_numbers:
-            return True
-
-        reverse_diagonal_values = [
-            board[i][len(board)-1-i] for i in range(len(board))]
-        if set(reverse_diagonal_values) == target_numbers:
-            return True
-
-        return False
+        return bitboard.isWinningPosition(board, piecesColor)
 
     def __evaluateBoard(self, board):
         # Evaluation function for the minimax algorithm
@@ -568,47 +436,9 @@ class TTCPlayer:
         return bestMove, bestScore
 
     def __maxAlignedValue(self, board, number_sign):
-        target_numbers = {1, 2, 3, 4} if number_sign == 1 else {-1, -2, -3, -4}
-        max_value = 0
-        aligned_numbers = set()
-        missing_numbers = set(target_numbers)
-        missing_positions = set()
-
-        # Check horizontally
-        for row in range(len(board)):
-            aligned_values = [board[row][col] for col in range(len(board[row])) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for col in range(len(board[row])) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-
-        # Check vertically
-        for col in range(len(board[0])):
-            aligned_values = [board[row][col] for row in range(len(board)) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for row in range(len(board)) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board)) if board[i][i] != 0 and board[i][i] in target_numbers]
-        #print(diagonal_values)
-        if len(diagonal_values) > max_value:
-            max_value = len(diagonal_values)
-            aligned_numbers = set(diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, i) for i in range(len(board)) if (board[i][i] == 0 or board[i][i] not in target_numbers)}
-
-        reverse_diagonal_values = [board[i][len(board)-1-i] for i in range(len(board)) if board[i][len(board)-1-i] != 0 and board[i][len(board)-1-i] in target_numbers]
-        #print(reverse_diagonal_values)
-        if len(reverse_diagonal_values) > max_value:
-            max_value = len(reverse_diagonal_values)
-            aligned_numbers = set(reverse_diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, len(board)-1-i) for i in range(len(board)) if (board[i][len(board)-1-i] == 0 or board[i][len(board)-1-i] not in target_numbers)}
-
+        # max_value, aligned_numbers, missing_numbers, missing_positions of the
+        # line with the most pieces, see bitboard.alignment
+        max_value, aligned_numbers, missing_numbers, missing_positions, _ = bitboard.alignment(board, number_sign)
         return max_value, aligned_numbers, list(missing_numbers), missing_positions
 
     def reset(self):
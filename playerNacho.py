@@ -9,28 +9,81 @@ Value code for each piece is as follows:
 
 """
 
-import copy
+import multiprocessing
 import random
 import time
 
+from analysis_cache import AnalysisCache
+from bitboard import OFF_BOARD, PIECES, positionOf, squareOf
+from game_state import GameState, OpponentTracker
+from opening_book import BOOK_PATH, loadBook
+from proof_search import PROVEN, ProofSearch
+from search import Deadline, SearchTimeout, iterativeDeepening
+from tablebase import DRAW, MAX_DISTANCE, TABLEBASE_PATH, loadTablebase
+from time_manager import TimeManager
+from transposition import TranspositionTable, EXACT
+import bitboard
+import event_log
+
+# Time budget of every move, in seconds
+MOVE_TIME = 1.0
+# Every node of the minimax evaluates all its children, so the clock is checked more often
+NODES_PER_CHECK = 32
+# Score of a win, wins found sooner score more
+WIN_SCORE = 16
+# Shallower searches are faster in a single process than sending the work to the pool
+PARALLEL_MIN_DEPTH = 3
+# Part of the time of the move the proof of a forced win can take
+PROOF_TIME_SHARE = 0.3
+
 
 class TTCPlayer:
     # valuesCode is a list containing the value code that you must use to represent your pieces over the board.
     # The sign of the value code will tell you if you are playing as white or black pieces.
     # The values are in the order: pawn, bishop, knight, rook
-    def __init__(self, name):
+    def __init__(self, name, moveTime=MOVE_TIME, workers=1, keepTable=False, cachePath=None, bookPath=BOOK_PATH,
+                 tablebasePath=TABLEBASE_PATH):
         self.name = name
+        # Seconds that every call to play can take
+        self.moveTime = moveTime
+        # Set by the referee before every move, see time_control.py
+        self.timeLeft = None
+        self.clockLeft = None
+        self.turnsLeft = None
+        self.timeManager = TimeManager(moveTime)
+        # Number of processes that search the root moves, 1 searches in this process
+        self.workers = workers
         self.pawnDirection = -1
         self.currentTurn = -1
 
         self.piecesOnBoard = [0] * 5
         self.enemyPiecesOnBoard = [0] * 5
+        # Square of every piece of the bot in the board of the turn, index 0 is unused
+        self.pieceSquares = [OFF_BOARD] * 5
+        # State of the board of the turn, built once by play()
+        self.state = None
+        self.deadline = Deadline(float('inf'))
+        # Minimax values of the positions already searched, kept between
+        # moves. With keepTable it is also kept between games
+        self.keepTable = keepTable
+        self.table = TranspositionTable()
+        # Positions searched by any process and any run, see analysis_cache.py
+        self.cachePath = cachePath
+        self.cache = None
+        # Drops of the first turns, see opening_book.py
+        self.bookPath = bookPath
+        # Results of the endgames without captures, see tablebase.py
+        self.tablebasePath = tablebasePath
+        # Looks for forced wins when 3 pieces are aligned, see proof_search.py
+        self.prover = ProofSearch()
 
 
     def setColor(self, piecesColor):
         self.piecesCode = [0, 1, 2, 3, 4]
         self.piecesCode = [x*piecesColor for x in self.piecesCode]
         self.piecesColor = piecesColor
+        # The opponent's captures are not known, assume the same limit as ours
+        self.opponent = OpponentTracker(piecesColor, 5)
 
     def __updatePawnDirection(self, board):
         # If the pawn is in the limit of the board, it should reverse
@@ -44,9 +97,6 @@ class TTCPlayer:
     def __sameSign(self, a, b):
         return ((a < 0 and b < 0) or (a > 0 and b > 0))
 
-    def __isInsideBoard(self, row, col):
-        return (row >= 0 and row < 4 and col >= 0 and col < 4)
-
         # Function to check whether a movement was a movement or not
     # If it was a movement, it also checks if it was a capture or not.
     # For a movement to be classified as a capture, 2 conditions have to occur
@@ -81,142 +131,9 @@ class TTCPlayer:
 
         return (wasMovement, wasCapture)
 
-    def __getPawnValidMovements(self, position, board, pawnDirection):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Move 1 to the front
-        newRow = row + pawnDirection
-        if self.__isInsideBoard(newRow, col) and board[newRow][col] == 0:
-            validMovements.append((newRow, col))
-
-        # Attack to the left
-        newCol = col - 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        # Attack to the right
-        newCol = col + 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getBishopValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # To check whether I already encountered a piece in this diagonal or not
-        # 0 -> Up-Left Diagonal
-        # 1 -> Up-Right Diagonal
-        # 2 -> Down-Left Diagonal
-        # 3 -> Down-Right Diagonal
-        diagEncounteredPiece = [False] * 4
-
-        # Describe the direction of the movement for the bishop in the same
-        # order as described above
-        movDirection = [[-1, -1],
-                        [-1, 1],
-                        [1, -1],
-                        [1, 1]]
-
-        # A bishop can move at most 3 squares
-        for i in range(1, 4):
-            # Check 4 directions of movement
-            for j in range(4):
-                newCol = col + i * movDirection[j][0]
-                newRow = row + i * movDirection[j][1]
-
-                # If I haven't found a piece yet in this direction and its inside the board
-                if not diagEncounteredPiece[j] and self.__isInsideBoard(newRow, newCol):
-                    # If the proposed square its occupied
-                    if board[newRow][newCol] != 0:
-                        # If the piece that occupies the square its from the opponent, then its a valid movement
-                        if not self.__sameSign(board[row][col], board[newRow][newCol]):
-                            validMovements.append((newRow, newCol))
-                        diagEncounteredPiece[j] = True
-                    else:  # If not, just append the movement
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getKnightValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Describe the movements of the knight
-        movements = [[-2, 1],
-                     [-1, 2],
-                     [1, 2],
-                     [2, 1],
-                     [2, -1],
-                     [1, -2],
-                     [-1, -2],
-                     [-2, -1]]
-
-        # Loop through all possible movements
-        for move in movements:
-            newRow = row + move[0]
-            newCol = col + move[1]
-
-            # For the knight we just need to check if the new square is valid and it is not occupied by a piece of the same color
-            if self.__isInsideBoard(newRow, newCol) and not self.__sameSign(board[row][col], board[newRow][newCol]):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getRookValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Checks whether or not I have found a piece in this direction
-        # 0 - Up
-        # 1 - Right
-        # 2 - Down
-        # 3 - Left
-        dirPieceEncountered = [False] * 4
-
-        # Describe the direction of movement for the rook
-        # The order is the same as described above
-        movDirection = [[-1, 0],
-                        [0, 1],
-                        [1, 0],
-                        [0, -1]]
-
-        # The rook can move maximum 3 squares
-        for i in range(1, 4):
-            # Loop through all possible movements
-            for j in range(4):
-                newRow = row + i * movDirection[j][0]
-                newCol = col + i * movDirection[j][1]
-
-                if not dirPieceEncountered[j] and self.__isInsideBoard(newRow, newCol):
-                    if board[newRow][newCol] != 0:
-                        if not self.__sameSign(board[newRow][newCol], board[row][col]):
-                            validMovements.append((newRow, newCol))
-                        dirPieceEncountered[j] = True
-                    else:
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
-
     def __getValidMovements(self, pieceCode, position, board):
-        if abs(pieceCode) == 1:
-            return self.__getPawnValidMovements(position, board, self.pawnDirection)
-        elif abs(pieceCode) == 2:
-            return self.__getBishopValidMovements(position, board)
-        elif abs(pieceCode) == 3:
-            return self.__getKnightValidMovements(position, board)
-        elif abs(pieceCode) == 4:
-            return self.__getRookValidMovements(position, board)
+        if abs(pieceCode) in PIECES:
+            return bitboard.getValidMovements(pieceCode, position, board, self.pawnDirection)
         else:
             print("Piece ", pieceCode, " not recognized")
             return []
@@ -228,17 +145,7 @@ class TTCPlayer:
             piece = random.randint(1, 4)
 
         pieceCode = self.piecesCode[piece]
-        row = -1
-        col = -1
-
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                if board[i][j] == pieceCode:
-                    row = i
-                    col = j
-
-                    i = len(board)
-                    break
+        row, col = positionOf(self.pieceSquares[piece])
 
         validMovements = self.__getValidMovements(pieceCode, (row, col), board)
         if len(validMovements) == 0:
@@ -252,15 +159,17 @@ class TTCPlayer:
 
         return board
 
-    def __updatePiecesOnBoard(self, board):
-        self.piecesOnBoard = [0] * 5
+    def __updatePiecesOnBoard(self, state):
+        # The squares of the pieces come from the state of the board of the turn
+        for piece in PIECES:
+            self.pieceSquares[piece] = state.pieceSquare(self.piecesColor, piece)
+            self.piecesOnBoard[piece] = int(self.pieceSquares[piece] != OFF_BOARD)
+            self.enemyPiecesOnBoard[piece] = int(state.pieceSquare(-self.piecesColor, piece) != OFF_BOARD)
 
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                if self.__sameSign(board[i][j], self.piecesColor):
-                    self.piecesOnBoard[abs(board[i][j])] = 1
-                elif self.__sameSign(board[i][j], -self.piecesColor):
-                    self.enemyPiecesOnBoard[abs(board[i][j])] = 1
+    def __setPieceSquare(self, pieceCode, row, col):
+        # A piece of the bot was put on the square, no need to scan the board again
+        self.piecesOnBoard[abs(pieceCode)] = 1
+        self.pieceSquares[abs(pieceCode)] = squareOf(row, col)
 
     def __putRandomPiece(self, board):
         piece = -1
@@ -287,7 +196,7 @@ class TTCPlayer:
                 for k in myMissingPieces:
                     if (board[x][y] == 0 and self.piecesOnBoard[abs(k)] == 0):
                         board[x][y] = k
-                        self.__updatePiecesOnBoard(board)
+                        self.__setPieceSquare(k, x, y)
                         return board
             if self.availableCaptures > 0:
                 for i in oppAllignedPositions:
@@ -299,7 +208,7 @@ class TTCPlayer:
                                 if i in validMoves:
                                     board[x][y] = board[a][b]
                                     board[a][b] = 0
-                                    self.__updatePiecesOnBoard(board)
+                                    self.__setPieceSquare(board[x][y], x, y)
                                     return board
 
         # Trying to allign in the bottom in order 2,1,4,3 just because it worked better than others orders than i tried
@@ -325,7 +234,7 @@ class TTCPlayer:
                     return board
             if self.piecesOnBoard[3] == 0:
                 for k in myMissingPositions:
-                    horseMoves = self.__getKnightValidMovements(k,board)
+                    horseMoves = bitboard.getValidMovements(self.piecesCode[3], k, board, self.pawnDirection)
                     for h in horseMoves:
                         a, b = h
                         if board[a][b]==0:
@@ -338,7 +247,7 @@ class TTCPlayer:
             for k in myMissingPieces:
                 if (board[x][y] == 0 and self.piecesOnBoard[abs(k)] == 0):
                     board[x][y] = k
-                    self.__updatePiecesOnBoard(board)
+                    self.__setPieceSquare(k, x, y)
                     return board
 
         # if nothing else worked put it randomly
@@ -387,7 +296,10 @@ class TTCPlayer:
     def play(self, board):
         start = time.time()
         self.currentTurn += 1
-        self.__updatePiecesOnBoard(board)
+        self.opponent.update(board)
+        self.state = self.__getState(board)
+        self.__updatePiecesOnBoard(self.state)
+        self.__openCache()
 
         originalBoard = [row[:] for row in board]
 
@@ -397,11 +309,18 @@ class TTCPlayer:
         myAlignedValue, _, myMissingPieces, _, _ = self.__maxAlignedValue(
             board, self.piecesColor)
 
+        # Positions where a line of 4 is one move away get more time
+        budget = self.timeManager.allocate(self.timeLeft, self.clockLeft, self.turnsLeft,
+                                           critical=oppAlignedValue == 3 or myAlignedValue == 3)
+        self.deadline = self.timeManager.startMove(budget, NODES_PER_CHECK)
+
         for n in range(1000):
             # put the first 4 pieces in semi-random order trying to allign
             # when there are pieces not in board, put those in the line with most piece
             if self.currentTurn < 3 or sum(self.piecesOnBoard) < 4:
-                newBoard = self.__putRandomPiece(board)
+                newBoard = self.__bookMove() if n == 0 and self.currentTurn < 3 else None
+                if newBoard is None:
+                    newBoard = self.__putRandomPiece(board)
             # when the opponent is about to allign and im not, block him or eat one of his pieces
             elif oppAlignedValue == 3 and myAlignedValue != 3 and self.availableCaptures > 0:
                 newBoard = self.__blockOpponent(board, myMissingPieces, oppMissingPositions, oppAlignedPositions)
@@ -411,7 +330,26 @@ class TTCPlayer:
                     newBoard = self.__moveRandomPiece(board)
                 # if its the first attempt calculate the bestMove with minimax
                 else:
-                    newBoard, _ = self.__getBestMove(board, 1, self.piecesColor)
+                    state = self.state.copy()
+                    # The tablebase already knows the best move of its positions
+                    move = self.__tablebaseMove(state)
+                    # With 3 pieces aligned a forced win can end the move before the search
+                    if move is None and (myAlignedValue == 3 or oppAlignedValue == 3):
+                        move = self.__provenWin(state)
+                    if move is None:
+                        self.table.newSearch()
+                        # Deepen the minimax until the time of the move is over, a
+                        # search that is stopped leaves its state halfway so it uses a copy
+                        searchState = state.copy()
+                        move, _, _ = iterativeDeepening(
+                            lambda depth: self.__getBestRootMove(searchState, depth), self.deadline,
+                            isDecisive=lambda score: abs(score) >= WIN_SCORE,
+                            shouldStop=self.timeManager.shouldStop)
+                    if move is not None:
+                        state.makeMove(move)
+                        newBoard = state.toBoard()
+                    else:
+                        newBoard = board
             
             # Check if the move was a capture
             _, wasCapture = self.__wasPieceMovement(originalBoard, newBoard)
@@ -426,7 +364,8 @@ class TTCPlayer:
                 break
         
         self.__updatePawnDirection(newBoard)
-        print("Time taken:", time.time() - start)
+        self.opponent.setLastBoard(newBoard)
+        event_log.emit('move_time', self.name, time.time() - start)
 
         # To print thr board
         #for row in newBoard:
@@ -436,182 +375,267 @@ class TTCPlayer:
 
 
     def __checkVictory(self, board, piecesColor):
-        target_numbers = {1, 2, 3, 4} if piecesColor == 1 else {-1, -2, -3, -4}
-
-        # Check horizontally
-        for row in board:
-            if all(piece in target_numbers for piece in row):
-                return True
+        return bitboard.isWinningPosition(board, piecesColor)
 
-        # Check vertically
-        for col in range(len(board[0])):
-            column_values = [board[row][col] for row in range(len(board))]
-            if all(piece in target_numbers for piece in column_values):
-                return True
 
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board))]
-        if all(piece in target_numbers for piece in diagonal_values):
-            return True
-
-        reverse_diagonal_values = [board[i][len(board) - 1 - i] for i in range(len(board))]
-        if all(piece in target_numbers for piece in reverse_diagonal_values):
-            return True
-
-        return False
-
-
-    def __evaluateBoard(self, board):
+    def __evaluateState(self, state):
         # Evaluation function for the minimax algorithm
         # It gives a value to a given board state
         # Positive values are good for my bot, negative for the opponent
 
         # If i have won
-        if self.__checkVictory(board, self.piecesColor):
-            return 16 
+        if state.isWin(self.piecesColor):
+            return WIN_SCORE
         # If the opponent have won
-        elif self.__checkVictory(board, -self.piecesColor):
-            return -16
+        elif state.isWin(-self.piecesColor):
+            return -WIN_SCORE
 
-        myAlignedValue, _, _, _, _ = self.__maxAlignedValue(
-            board, self.piecesColor)
-
-        oppAlignedValue, _, _, _, _ = self.__maxAlignedValue(
-            board, -self.piecesColor)
-        
         # Return who has more pieces allgined
-        return myAlignedValue - oppAlignedValue
+        return state.maxAligned(self.piecesColor) - state.maxAligned(-self.piecesColor)
+
+    def __getBestMove(self, state, depth, isMaximizingPlayer):
+        # Moves are played and undone over the same state, no board is copied
+
+        # Stops the search if the time of the move is over
+        self.deadline.tick()
 
-    def __getBestMove(self, board, depth, isMaximizingPlayer):
         bestMove = None
         bestScore = float('-inf') if isMaximizingPlayer else float('inf')
-        hasChanges = False  # Flag to track changes
 
-        if depth == 0 or self.__checkVictory(board, 1) or self.__checkVictory(board, -1):
-            return board, self.__evaluateBoard(board)
+        if depth == 0 or state.isWin(1) or state.isWin(-1):
+            score = self.__evaluateState(state)
+            # A win with more depth left was found sooner
+            if score >= WIN_SCORE:
+                score += depth
+            elif score <= -WIN_SCORE:
+                score -= depth
+            return None, score
+
+        score = self.__tablebaseScore(state, depth)
+        if score is not None:
+            return None, score
+
+        # The scores of the wins depend on the depth left, so only a search
+        # of the same depth can be reused
+        entry = self.table.probe(state.hash)
+        if entry is None and self.cache is not None:
+            entry = self.cache.probe(state.hash)
+        if entry is not None and entry[0] == depth:
+            return entry[3] or None, entry[1]
+
+        for move in state.legalMoves():
+            undo = state.makeMove(move)
+
+            if depth > 1:
+                _, score = self.__getBestMove(state, depth - 1, not isMaximizingPlayer)
+            else:
+                score = self.__evaluateState(state)
 
-        for i in range(len(board)):
-            for j in range(len(board[0])):
-                localHasChanges = False  # Flag to track changes for each iteration
-                # Check for empty cells putting the pieces not in board
-                if board[i][j] == 0:
-                    for pieceCode in range(1, 5):
-                        piecesOnBoard = self.piecesOnBoard if isMaximizingPlayer else self.enemyPiecesOnBoard
-                        piecesCode = self.piecesCode if isMaximizingPlayer else []
-                        if piecesOnBoard[pieceCode] == 0 and pieceCode in piecesCode:
-                            newBoard = [row[:] for row in board]
-                            newPiecesOnBoard = copy.deepcopy(self.piecesOnBoard)
-                            newEnemyPiecesOnBoard = copy.deepcopy(self.enemyPiecesOnBoard)
-
-                            if isMaximizingPlayer:
-                                newBoard[i][j] = pieceCode
-                                newPiecesOnBoard[pieceCode] = 1
-                            else:
-                                newBoard[i][j] = -pieceCode
-                                newEnemyPiecesOnBoard[pieceCode] = 1
-
-                            if depth > 1:
-                                _, score = self.__getBestMove(newBoard, depth - 1, not isMaximizingPlayer)
-                            else:
-                                score = self.__evaluateBoard(newBoard)
-
-                            if (isMaximizingPlayer and score > bestScore) or (not isMaximizingPlayer and score < bestScore):
-                                bestScore = score
-                                bestMove = [row[:] for row in newBoard]
-                                localHasChanges = True  # Changes occurred for this move
-                # Check for my pieces all the movements
-                elif board[i][j] in self.piecesCode:
-                    piecesOnBoard = self.piecesOnBoard if isMaximizingPlayer else self.enemyPiecesOnBoard
-                    if piecesOnBoard[board[i][j]] == 1:
-                        validMovements = self.__getValidMovements(board[i][j], (i, j), board)
-                        for move in validMovements:
-                            newBoard = [row[:] for row in board]
-                            newPiecesOnBoard = copy.deepcopy(self.piecesOnBoard)
-                            newEnemyPiecesOnBoard = copy.deepcopy(self.enemyPiecesOnBoard)
-
-                            if isMaximizingPlayer:
-                                newPiecesOnBoard[board[i][j]] = 0
-                            else:
-                                newEnemyPiecesOnBoard[board[i][j]] = 0
-
-                            newBoard[i][j] = 0
-                            newRow, newCol = move
-                            newBoard[newRow][newCol] = board[i][j]
-
-                            if depth > 1:
-                                _, score = self.__getBestMove(newBoard, depth - 1, not isMaximizingPlayer)
-                            else:
-                                score = self.__evaluateBoard(newBoard)
-
-                            if score is not None and ((isMaximizingPlayer and score > bestScore) or (not isMaximizingPlayer and score < bestScore)):
-                                bestScore = score
-                                bestMove = [row[:] for row in newBoard]
-                                localHasChanges = True  # Changes occurred for this move
-
-                hasChanges |= localHasChanges  # Update the overall flag based on this iteration
-
-        # If no changes occurred, return an error value
-        if not hasChanges:
+            state.unmakeMove(undo)
+
+            if score is not None and ((isMaximizingPlayer and score > bestScore) or (not isMaximizingPlayer and score < bestScore)):
+                bestScore = score
+                bestMove = move
+
+        # If there were no moves, return an error value
+        if bestMove is None:
             return None, None
 
+        self.table.store(state.hash, depth, bestScore, EXACT, bestMove)
+        if self.cache is not None:
+            self.cache.store(state.hash, depth, bestScore, EXACT, bestMove)
         return bestMove, bestScore
 
-    def __maxAlignedValue(self, board, number_sign):
-        target_numbers = {1, 2, 3, 4} if number_sign == 1 else {-1, -2, -3, -4}
-        max_value = 0
-        aligned_numbers = set()
-        missing_numbers = set(target_numbers)
-        missing_positions = set()
-        aligned_positions = set()
-
-        # Check horizontally
-        for row in range(len(board)):
-            aligned_values = [board[row][col] for col in range(len(board[row])) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for col in range(len(board[row])) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-                aligned_positions = {(row, col) for col in range(len(board[row])) if board[row][col] in aligned_numbers}
-
-        # Check vertically
-        for col in range(len(board[0])):
-            aligned_values = [board[row][col] for row in range(len(board)) if board[row][col] != 0 and board[row][col] in target_numbers]
-            if len(aligned_values) > max_value:
-                max_value = len(aligned_values)
-                aligned_numbers = set(aligned_values)
-                missing_numbers = target_numbers - aligned_numbers
-                missing_positions = {(row, col) for row in range(len(board)) if (board[row][col] == 0 or board[row][col] not in target_numbers)}
-                aligned_positions = {(row, col) for row in range(len(board)) if board[row][col] in aligned_numbers}
-
-        # Check diagonals
-        diagonal_values = [board[i][i] for i in range(len(board)) if board[i][i] != 0 and board[i][i] in target_numbers]
-        if len(diagonal_values) > max_value:
-            max_value = len(diagonal_values)
-            aligned_numbers = set(diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, i) for i in range(len(board)) if (board[i][i] == 0 or board[i][i] not in target_numbers)}
-            aligned_positions = {(i, i) for i in range(len(board)) if board[i][i] in aligned_numbers}
-
-        reverse_diagonal_values = [board[i][len(board)-1-i] for i in range(len(board)) if board[i][len(board)-1-i] != 0 and board[i][len(board)-1-i] in target_numbers]
-        if len(reverse_diagonal_values) > max_value:
-            max_value = len(reverse_diagonal_values)
-            aligned_numbers = set(reverse_diagonal_values)
-            missing_numbers = target_numbers - aligned_numbers
-            missing_positions = {(i, len(board)-1-i) for i in range(len(board)) if (board[i][len(board)-1-i] == 0 or board[i][len(board)-1-i] not in target_numbers)}
-            aligned_positions = {(i, len(board)-1-i) for i in range(len(board)) if board[i][len(board)-1-i] in aligned_numbers}
+    def __provenWin(self, state):
+        # The first move of a forced win of the bot, None if it is not proven
+        deadline = Deadline(self.deadline.remaining() * PROOF_TIME_SHARE, NODES_PER_CHECK)
+        result, move = self.prover.prove(state, self.piecesColor, deadline)
+        return move if result == PROVEN else None
+
+    def __tablebaseScore(self, state, depth):
+        # Score of a position of the tablebase like the ones of the minimax,
+        # None if it is not in the tablebase
+        tablebase = loadTablebase(self.tablebasePath)
+        distance = tablebase.probe(state) if tablebase is not None else None
+        if distance is None:
+            return None
+        if distance == DRAW:
+            return 0
+
+        # Odd distances are won by the side to move. The wins beyond the
+        # depth left count like the ones found at the last depth
+        winner = state.sideToMove if distance % 2 == 1 else -state.sideToMove
+        score = WIN_SCORE + max(0, depth - distance)
+        return score if winner == self.piecesColor else -score
+
+    def __tablebaseMove(self, state):
+        # The fastest win, a draw or the slowest loss, None if the position
+        # is not in the tablebase
+        tablebase = loadTablebase(self.tablebasePath)
+        if tablebase is None or tablebase.probe(state) is None:
+            return None
+
+        bestMove = None
+        bestScore = float('-inf')
+        for move in state.legalMoves():
+            undo = state.makeMove(move)
+            distance = tablebase.probe(state)
+            state.unmakeMove(undo)
+            if distance is None:
+                continue
+
+            # The opponent moves next, even distances are its losses
+            if distance == DRAW:
+                score = 0
+            elif distance % 2 == 0:
+                score = MAX_DISTANCE + 1 - distance
+            else:
+                score = distance - MAX_DISTANCE - 1
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+
+        return bestMove
+
+    def __getBestRootMove(self, state, depth):
+        # Root of the minimax. With more than one worker every root move is
+        # searched in the process pool and the results are merged in the order
+        # of the moves, so the chosen move is the same as in a single process
+        if self.workers <= 1 or depth < PARALLEL_MIN_DEPTH:
+            return self.__getBestMove(state, depth, True)
+
+        moves = state.legalMoves()
+        if not moves:
+            return None, None
+
+        code = state.encode()
+        # The workers get the end of the move and not the time left, a move
+        # that waits in the queue must not get the whole time again
+        end = self.deadline.end
+        tasks = [(self.piecesColor, code, move, depth, end, self.cachePath, self.tablebasePath) for move in moves]
+        try:
+            results = getPool(self.workers).map_async(_searchRootMove, tasks).get(self.deadline.remaining() + 1)
+        except multiprocessing.TimeoutError:
+            raise SearchTimeout()
+
+        bestMove = None
+        bestScore = float('-inf')
+        for move, (finished, score) in zip(moves, results):
+            # If any root move did not finish the iteration is not complete
+            if not finished:
+                raise SearchTimeout()
+            if score is not None and score > bestScore:
+                bestScore = score
+                bestMove = move
+
+        if bestMove is None:
+            return None, None
+
+        return bestMove, bestScore
 
+    def searchRootMove(self, piecesColor, code, move, depth, end, cachePath=None, tablebasePath=TABLEBASE_PATH):
+        # Score of one root move, run by the worker processes. end is the
+        # time.perf_counter() at which the move is over. Returns (finished,
+        # score), finished is False if the time was over
+        if time.perf_counter() >= end:
+            # The iteration already timed out, leave the pool free for the next one
+            return False, None
+        self.piecesColor = piecesColor
+        self.tablebasePath = tablebasePath
+        if cachePath != self.cachePath:
+            if self.cache is not None:
+                self.cache.close()
+            self.cachePath = cachePath
+            self.cache = None
+        self.__openCache()
+        self.deadline = Deadline.until(end, NODES_PER_CHECK)
+        state = GameState.decode(code)
+        state.makeMove(move)
+        try:
+            if depth > 1:
+                _, score = self.__getBestMove(state, depth - 1, False)
+            else:
+                score = self.__evaluateState(state)
+        except SearchTimeout:
+            return False, None
+
+        return True, score
+
+    def __bookMove(self):
+        # Board after the drop of the opening book, None if the position is not in it
+        book = loadBook(self.bookPath)
+        if book is None:
+            return None
+
+        move = book.lookup(self.state)
+        if move is None:
+            return None
+        state = self.state.copy()
+        state.makeMove(move)
+        return state.toBoard()
+
+    def __getState(self, board):
+        return GameState.fromPlayerView(board, self.piecesColor, self.currentTurn,
+                                        self.pawnDirection, self.opponent.pawnDirection,
+                                        self.availableCaptures, self.opponent.availableCaptures)
+
+    def __maxAlignedValue(self, board, number_sign):
         # max_value: number of max alligned pieces for the player
         # aligned_numbers: pieceCode of the numbers that are aligned
         # missing_numbers: pieceCode of the numbers that are NOT aligned
         # aligned_positions:  coordenates of the missing_numbers
         # missing_positions: coordenates of the aligned_numbers
+        max_value, aligned_numbers, missing_numbers, missing_positions, aligned_positions = bitboard.alignment(board, number_sign)
         return max_value, aligned_numbers, list(missing_numbers), missing_positions, aligned_positions
 
 
+    def __openCache(self):
+        # The cache is opened when the bot plays, so the bot can still be sent
+        # to another process before that
+        if self.cachePath is not None and self.cache is None:
+            try:
+                self.cache = AnalysisCache(self.cachePath, namespace=__name__)
+            except (OSError, ValueError):
+                # The cache is only an optimization, play without it
+                self.cachePath = None
+
     def reset(self):
+        if not self.keepTable:
+            self.table.clear()
         self.pawnDirection = -1
         self.piecesOnBoard = [0] * 5
         self.enemyPiecesOnBoard = [0] * 5
+        self.pieceSquares = [OFF_BOARD] * 5
         self.currentTurn = -1
         self.availableCaptures = 5
+
+
+# Worker processes of the parallel root search. The pools are kept alive
+# between moves and games, and every worker builds its player only once
+_pools = {}
+_worker = None
+
+
+def _initWorker():
+    global _worker
+    _worker = TTCPlayer('worker')
+
+
+def _searchRootMove(task):
+    return _worker.searchRootMove(*task)
+
+
+def getPool(workers):
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = multiprocessing.Pool(workers, initializer=_initWorker)
+        _pools[workers] = pool
+
+    return pool
+
+
+def closePools():
+    for pool in _pools.values():
+        pool.terminate()
+        pool.join()
+    _pools.clear()
@@ -13,6 +13,10 @@ import copy
 import random
 import time
 
+from bitboard import PIECES
+import bitboard
+import event_log
+
 class TTCPlayer:
     # valuesCode is a list containing the value code that you must use to represent your pieces over the board. 
     # The sign of the value code will tell you if you are playing as white or black pieces.
@@ -41,9 +45,6 @@ class TTCPlayer:
     def __sameSign(self, a, b):
         return ((a < 0 and b < 0) or (a > 0  and b > 0))
     
-    def __isInsideBoard(self, row, col):
-        return (row >= 0 and row < 4 and col >= 0 and col < 4)
-
         # Function to check whether a movement was a movement or not
     # If it was a movement, it also checks if it was a capture or not.
     # For a movement to be classified as a capture, 2 conditions have to occur
@@ -77,143 +78,9 @@ class TTCPlayer:
 
         return (wasMovement, wasCapture)
 
-    def __getPawnValidMovements(self, position, board, pawnDirection):
-        validMovements = []
-        
-        row = position[0]
-        col = position[1]
-
-        # Move 1 to the front
-        newRow = row + pawnDirection
-        if self.__isInsideBoard(newRow, col) and board[newRow][col] == 0:
-            validMovements.append((newRow, col))
-
-        # Attack to the left
-        newCol = col - 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        # Attack to the right
-        newCol = col + 1
-        if self.__isInsideBoard(newRow, newCol) and board[newRow][newCol] != 0 and not self.__sameSign(board[newRow][newCol], board[row][col]):
-            validMovements.append((newRow, newCol))
-
-        return validMovements
-    
-    def __getBishopValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # To check whether I already encountered a piece in this diagonal or not
-        # 0 -> Up-Left Diagonal
-        # 1 -> Up-Right Diagonal
-        # 2 -> Down-Left Diagonal
-        # 3 -> Down-Right Diagonal
-        diagEncounteredPiece = [False] * 4
-
-        # Describe the direction of the movement for the bishop in the same
-        # order as described above
-        movDirection = [[-1, -1],
-                     [-1, 1],
-                     [1, -1],
-                     [1, 1]]
-
-        # A bishop can move at most 3 squares
-        for i in range(1,4):
-            # Check 4 directions of movement
-            for j in range(4):
-                newCol = col + i * movDirection[j][0]
-                newRow = row + i * movDirection[j][1]
-
-                # If I haven't found a piece yet in this direction and its inside the board
-                if not diagEncounteredPiece[j] and self.__isInsideBoard(newRow, newCol):
-                    # If the proposed square its occupied
-                    if board[newRow][newCol] != 0:
-                        # If the piece that occupies the square its from the opponent, then its a valid movement
-                        if not self.__sameSign(board[row][col], board[newRow][newCol]):
-                            validMovements.append((newRow, newCol))
-                        diagEncounteredPiece[j] = True
-                    else: # If not, just append the movement
-                        validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getKnightValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-
-        # Describe the movements of the knight
-        movements = [[-2, 1],
-                     [-1, 2],
-                     [1, 2],
-                     [2, 1],
-                     [2, -1],
-                     [1, -2],
-                     [-1, -2],
-                     [-2, -1]]
-        
-        # Loop through all possible movements
-        for move in movements:
-            newRow = row + move[0]
-            newCol = col + move[1]
-
-            # For the knight we just need to check if the new square is valid and it is not occupied by a piece of the same color
-            if self.__isInsideBoard(newRow, newCol) and not self.__sameSign(board[row][col], board[newRow][newCol]):
-                validMovements.append((newRow, newCol))
-
-        return validMovements
-
-    def __getRookValidMovements(self, position, board):
-        validMovements = []
-
-        row = position[0]
-        col = position[1]
-
-        # Checks whether or not I have found a piece in this direction
-        # 0 - Up
-        # 1 - Right
-        # 2 - Down
-        # 3 - Left
-        dirPieceEncountered = [False] * 4
-
-        # Describe the direction of movement for the rook
-        # The order is the same as described above
-        movDirection = [[-1, 0],
-                        [0, 1],
-                        [1, 0],
-                        [0, -1]]
-        
-        # The rook can move maximum 3 squares
-        for i in range(1, 4):
-            # Loop through all possible movements
-            for j in range(4):
-                newRow = row + i * movDirection[j][0]
-                newCol = col + i * movDirection[j][1]
-
-                if not dirPieceEncountered[j] and self.__isInsideBoard(newRow, newCol):
-                    if board[newRow][newCol] != 0:
-                        if not self.__sameSign(board[newRow][newCol], board[row][col]):
-                            validMovements.append((newRow, newCol))
-                        dirPieceEncountered[j] = True
-                    else:
-                        validMovements.append((newRow, newCol))
-
-        return validMovements        
-
     def __getValidMovements(self, pieceCode, position, board):
-        if abs(pieceCode) == 1:
-            return self.__getPawnValidMovements(position, board, self.pawnDirection)
-        elif abs(pieceCode) == 2:
-            return self.__getBishopValidMovements(position, board)
-        elif abs(pieceCode) == 3:
-            return self.__getKnightValidMovements(position, board)
-        elif abs(pieceCode) == 4:
-            return self.__getRookValidMovements(position, board)
+        if abs(pieceCode) in PIECES:
+            return bitboard.getValidMovements(pieceCode, position, board, self.pawnDirection)
         else:
             print("Piece ", pieceCode, " not recognized")
             return []
@@ -312,10 +179,9 @@ class TTCPlayer:
                 break
         
         self.__updatePawnDirection(newBoard)
-        print("Time taken: ", time.time() - start)
+        event_log.emit('move_time', self.name, time.time() - start)
 
-        for row in reversed(newBoard):
-            print(row[::-1])
+        event_log.emit('player_board', self.name, newBoard)
 
         #print(newBoard, flush=True)
 
@@ -0,0 +1,59 @@
+"""
+Tic-Tac-Chec pondering
+Lets a bot keep searching while its opponent thinks.
+
+After its move the bot predicts the reply of the opponent, the best reply its
+own search found, and searches the position after that reply in a background
+thread, filling its transposition table. The next call to play() stops the
+thread first: if the opponent played the predicted move (a ponder hit) the
+table already holds that position searched to some depth and the bot keeps
+it, otherwise it searches as always.
+
+The thread uses the tables of the bot, so the bot must not touch them while
+it runs: play() and reset() call stop() before anything else.
+"""
+import threading
+
+from search import Deadline
+
+
+class Ponderer:
+    def __init__(self):
+        self.thread = None
+        self.deadline = None
+        # Board the bot expects to receive and what the thread found for it
+        self.board = None
+        self.result = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, board, search):
+        # search(deadline) runs in the thread until stop() cancels the deadline
+        self.stop()
+        self.board = board
+        self.result = None
+        self.deadline = Deadline(float('inf'))
+        self.thread = threading.Thread(target=self.__run, args=(search, self.deadline), daemon=True)
+        self.thread.start()
+
+    def __run(self, search, deadline):
+        self.result = search(deadline)
+
+    def stop(self, board=None):
+        # Stops the thread. Returns the result of the search if board is the
+        # one that was predicted, None otherwise
+        if self.thread is None:
+            return None
+
+        self.deadline.cancel()
+        self.thread.join()
+        self.thread = None
+
+        if board is None:
+            return None
+        if board == self.board:
+            self.hits += 1
+            return self.result
+        self.misses += 1
+        return None
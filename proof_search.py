@@ -0,0 +1,156 @@
+"""
+Tic-Tac-Chec proof-number search
+Proves or disproves that a player can force 4 aligned pieces within a number
+of plies, with a depth-first proof-number search (df-pn).
+
+Every node has a proof number (how many leaves at least must be proven to
+prove it) and a disproof number. The attacker needs one move that proves
+the node, the defender has to be answered in all its moves. The search
+always goes down to the most proving child, with thresholds that send it
+back up as soon as another child becomes better, and keeps the numbers of
+the nodes in a table keyed by (hash, plies left). The plies left are part of
+the key, so a position repeated by moving pieces back and forth is never
+its own ancestor.
+
+The search is deepened 2 plies at a time, so a proven win is always the
+shortest one. The nodes of every depth stay in the table for the next one.
+
+The search stops after maxNodes nodes, counted over all the depths, or at the
+deadline of the bot, the result is then UNKNOWN. A disproof only means that
+there is no forced win in maxPlies plies.
+"""
+from search import SearchTimeout
+
+PROVEN = 1
+DISPROVEN = -1
+UNKNOWN = 0
+
+INFINITY = 10 ** 9
+# A win in 5 moves of the attacker
+DEFAULT_PLIES = 9
+DEFAULT_NODES = 20000
+
+
+class _NodeLimit(Exception):
+    pass
+
+
+class ProofSearch:
+    def __init__(self, maxPlies=DEFAULT_PLIES, maxNodes=DEFAULT_NODES):
+        self.maxPlies = maxPlies
+        self.maxNodes = maxNodes
+        self.table = {}
+        self.nodes = 0
+        self.attacker = None
+        self.deadline = None
+
+    def prove(self, state, attacker, deadline=None):
+        # Returns (result, move). PROVEN when the attacker can force the
+        # win, the move is the attacker's winning move if it is to move.
+        # DISPROVEN when it can not, the move is a move of the defender that
+        # escapes if it is to move. The state is not changed
+        self.table = {}
+        self.nodes = 0
+        self.attacker = attacker
+        self.deadline = deadline
+
+        state = state.copy()
+        # The attacker only wins on its own plies, so the depths go 2 by 2
+        # up to maxPlies. The first one that proves has the shortest win, a
+        # longer one would not get any closer to the win on the next move
+        start = 1 if state.sideToMove == attacker else 2
+        for plies in list(range(start, self.maxPlies, 2)) + [self.maxPlies]:
+            try:
+                self.__search(state, plies, INFINITY, INFINITY)
+            except (SearchTimeout, _NodeLimit):
+                return UNKNOWN, None
+
+            proof, disproof = self.__entry(state, plies)
+            if proof == 0:
+                return PROVEN, self.__child(state, plies, 0) if state.sideToMove == attacker else None
+
+        if disproof == 0:
+            return DISPROVEN, self.__child(state, self.maxPlies, 1) if state.sideToMove != attacker else None
+        return UNKNOWN, None
+
+    def __child(self, state, plies, number):
+        # First move whose child has the proof (0) or disproof (1) number 0
+        for move in state.legalMoves():
+            undo = state.makeMove(move)
+            entry = self.__entry(state, plies - 1)
+            state.unmakeMove(undo)
+            if entry[number] == 0:
+                return move
+        return None
+
+    def __entry(self, state, plies):
+        entry = self.table.get((state.hash, plies))
+        if entry is not None:
+            return entry
+
+        # The player that just moved is the only one that can have won
+        if state.isWin(self.attacker):
+            return 0, INFINITY
+        if state.isWin(-self.attacker) or plies == 0:
+            return INFINITY, 0
+        return 1, 1
+
+    def __search(self, state, plies, proofThreshold, disproofThreshold):
+        self.nodes += 1
+        if self.nodes > self.maxNodes:
+            raise _NodeLimit()
+        if self.deadline is not None:
+            self.deadline.tick()
+
+        key = (state.hash, plies)
+        moves = state.legalMoves()
+        if not moves:
+            self.table[key] = (INFINITY, 0)
+            return
+
+        # The children are only played once, then their numbers come from the
+        # table, or from the first look at them while they are not there
+        childKeys = []
+        firstEntries = []
+        for move in moves:
+            undo = state.makeMove(move)
+            childKeys.append((state.hash, plies - 1))
+            firstEntries.append(self.__entry(state, plies - 1))
+            state.unmakeMove(undo)
+
+        table = self.table
+        isAttacker = state.sideToMove == self.attacker
+        while True:
+            # The numbers of the node from the ones of its children
+            children = [table.get(childKey, entry) for childKey, entry in zip(childKeys, firstEntries)]
+
+            # The attacker needs the child with the lowest proof number, the
+            # defender the one with the lowest disproof number
+            index = 0 if isAttacker else 1
+            ordered = sorted(range(len(moves)), key=lambda i: children[i][index])
+            best = ordered[0]
+            second = children[ordered[1]][index] if len(ordered) > 1 else INFINITY
+            if isAttacker:
+                proof = children[best][0]
+                disproof = min(INFINITY, sum(child[1] for child in children))
+            else:
+                proof = min(INFINITY, sum(child[0] for child in children))
+                disproof = children[best][1]
+
+            if proof >= proofThreshold or disproof >= disproofThreshold:
+                self.table[key] = (proof, disproof)
+                return
+
+            childProof, childDisproof = children[best]
+            if isAttacker:
+                childProofThreshold = min(proofThreshold, second + 1)
+                childDisproofThreshold = min(INFINITY, disproofThreshold - disproof + childDisproof)
+            else:
+                childProofThreshold = min(INFINITY, proofThreshold - proof + childProof)
+                childDisproofThreshold = min(disproofThreshold, second + 1)
+
+            undo = state.makeMove(moves[best])
+            try:
+                self.__search(state, plies - 1, childProofThreshold, childDisproofThreshold)
+            finally:
+                state.unmakeMove(undo)
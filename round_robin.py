@@ -1,18 +1,86 @@
+from concurrent.futures import ProcessPoolExecutor
 import functools
+import importlib
 import os
+import random
 import shutil
 
 from evaluator import TTCEvaluator
+from event_log import ConsoleSink, VERBOSE
+from game_record import GameRecordList, GameRecordWriter
+from latency import LatencyHistogram, PHASES
+
+# Counters of PlayerWrapper.statistics that are added up game by game
+GAME_COUNTERS = ('wins', 'loses', 'draws', 'raised_errors', 'invalid_moves', 'early_movements', 'exceed_max_captures', 'timeouts')
+# Histograms of PlayerWrapper.statistics that are merged game by game
+LATENCY_KEYS = tuple(phase + '_latency' for phase in PHASES)
+
+
+class PlayerSpec:
+    # Picklable recipe of a player, so every worker process can build its own.
+    # PlayerSpec('player3', 'Brandon', moveTime=0.5) builds player3.TTCPlayer('Brandon', moveTime=0.5)
+    def __init__(self, module, name, className='TTCPlayer', **kwargs):
+        self.module = module
+        self.name = name
+        self.className = className
+        self.kwargs = kwargs
+
+    def create(self):
+        playerClass = getattr(importlib.import_module(self.module), self.className)
+        return playerClass(self.name, **self.kwargs)
+
+
+def gameSeed(seed, name1, name2, game):
+    # The same tournament seed always gives every game the same seed
+    return '%d:%s:%s:%d' % (seed, name1, name2, game)
+
+
+def _playGame(task):
+    # Runs in a worker process: plays one game of a match between new players.
+    # The record of the game goes back to the main process, which writes it
+    spec1, spec2, game, maxCaptures, maxTurns, seed, verbosity, recordGames, timeControl, tablebasePath = task
+    currentSeed = gameSeed(seed, spec1.name, spec2.name, game)
+    random.seed(currentSeed)
+    player1 = spec1.create()
+    player2 = spec2.create()
+
+    recorder = GameRecordList() if recordGames else None
+    evaluator = TTCEvaluator(ConsoleSink(verbosity), recorder, timeControl, tablebasePath)
+    whiteStatistics, blackStatistics = evaluator.runAnalysis(player1, player2, 1, maxCaptures, maxTurns, firstGame=game, seed=currentSeed)
+    records = recorder.records if recorder is not None else []
+
+    return _inPlayerOrder(game, whiteStatistics, blackStatistics) + (records,)
+
+
+def _inPlayerOrder(game, whiteStatistics, blackStatistics):
+    # Statistics in the order of the players, player1 has white in the even games
+    if game % 2 == 0:
+        return whiteStatistics, blackStatistics
+    return blackStatistics, whiteStatistics
+
 
 class RoundRobin:
-    def __init__(self, players, gamesPerMatch, maxCapturesPerGame, maxTurnsPerGame):
+    # players can be player objects or PlayerSpec. With processes greater
+    # than 1 the games are played in a process pool, which needs PlayerSpec.
+    # verbosity is the level of event_log printed while the games are played.
+    # With recordPath every game is appended to that file of game records.
+    # timeControl is a time_control.TimeControl for every game.
+    # With tablebasePath the referee adjudicates the endgames of the tablebase
+    def __init__(self, players, gamesPerMatch, maxCapturesPerGame, maxTurnsPerGame, processes=1, seed=0, verbosity=VERBOSE,
+                 recordPath=None, timeControl=None, tablebasePath=None):
         self.players = players
 
         self.gamesPerMatch = gamesPerMatch
         self.maxCapturesPerGame = maxCapturesPerGame
         self.maxTurnsPerGame = maxTurnsPerGame
+        self.processes = processes
+        self.seed = seed
+        self.verbosity = verbosity
+        self.recordPath = recordPath
+        self.timeControl = timeControl
+        self.tablebasePath = tablebasePath
 
-        self.evaluator = TTCEvaluator()
+        self.evaluator = TTCEvaluator(ConsoleSink(verbosity), timeControl=timeControl, tablebasePath=tablebasePath)
         self.playerStatistics = {}
 
         self.resultsFolderName = 'results'
@@ -30,10 +98,13 @@ class RoundRobin:
                 "invalid_moves": 0,
                 "early_movements": 0,
                 "max_captures_exceeded": 0,
+                "timeouts": 0,
                 "best_against": "",
                 "best_won_games": 0,
                 "worst_against": "",
                 "worst_won_games": 10000000,
+                "placement_latency": LatencyHistogram(),
+                "movement_latency": LatencyHistogram(),
             }
     
     def __fillStatistics(self, stats1, stats2):
@@ -52,6 +123,9 @@ class RoundRobin:
         self.playerStatistics[stats1['name']]['invalid_moves'] += stats1['invalid_moves']
         self.playerStatistics[stats1['name']]['early_movements'] += stats1['early_movements']
         self.playerStatistics[stats1['name']]['max_captures_exceeded'] += stats1['exceed_max_captures']
+        self.playerStatistics[stats1['name']]['timeouts'] += stats1['timeouts']
+        for key in LATENCY_KEYS:
+            self.playerStatistics[stats1['name']][key].merge(stats1[key])
 
         if self.playerStatistics[stats1['name']]['best_won_games'] < stats1['wins']:
             self.playerStatistics[stats1['name']]['best_won_games'] = stats1['wins']
@@ -86,23 +160,108 @@ class RoundRobin:
             fp.write("Rank (name, won_matches, won_games, drew_matches, drew_games)\n")
             for i in range(len(leaderboard)):
                 fp.write(str(i + 1) +" "+ str(leaderboard[i]) + "\n")
+
+            fp.write("\nMove latency in ms (name, phase, moves, p50, p90, p99, max)\n")
+            for entry in leaderboard:
+                for key in LATENCY_KEYS:
+                    summary = self.playerStatistics[entry[0]][key].summary()
+                    fp.write(str((entry[0], key[:-len('_latency')]) + tuple(summary.values())) + "\n")
     
     def __createStatisticsPerPlayer(self):
         folderPath = os.path.join(os.path.join(os.getcwd(), self.resultsFolderName), 'players')
         self.__createOrEmptyFolder(folderPath, self.resultsFolderName)
 
         for name in self.playerStatistics:
+            # The histograms are written as their percentiles
+            statistics = dict(self.playerStatistics[name])
+            for key in LATENCY_KEYS:
+                statistics[key] = statistics[key].summary()
+
             with open(os.path.join(folderPath, name+'.txt'), 'w') as fp:
-                    fp.write(str(self.playerStatistics[name]))
+                    fp.write(str(statistics))
+
+    def __matches(self):
+        return [(i, j) for i in range(len(self.players)) for j in range(i + 1, len(self.players))]
+
+    def __runMatches(self):
+        players = [player.create() if isinstance(player, PlayerSpec) else player for player in self.players]
+        gameResults = []
+        if self.recordPath is not None:
+            self.evaluator.recorder = GameRecordWriter(self.recordPath)
+        try:
+            for i, j in self.__matches():
+                for game in range(self.gamesPerMatch):
+                    # Every game gets the seed it gets in a worker process, so
+                    # both modes play the same games
+                    currentSeed = gameSeed(self.seed, self.players[i].name, self.players[j].name, game)
+                    random.seed(currentSeed)
+                    whiteStatistics, blackStatistics = self.evaluator.runAnalysis(
+                        players[i], players[j], 1, self.maxCapturesPerGame, self.maxTurnsPerGame, firstGame=game, seed=currentSeed)
+                    gameResults.append(_inPlayerOrder(game, whiteStatistics, blackStatistics))
+        finally:
+            if self.evaluator.recorder is not None:
+                self.evaluator.recorder.close()
+                self.evaluator.recorder = None
+
+        return self.__mergeGames(gameResults)
+
+    def __runMatchesInParallel(self):
+        # Every game of every match is one task, the results come back in the
+        # order of the tasks so the merge is always the same
+        tasks = []
+        for i, j in self.__matches():
+            for game in range(self.gamesPerMatch):
+                tasks.append((self.players[i], self.players[j], game, self.maxCapturesPerGame, self.maxTurnsPerGame, self.seed, self.verbosity,
+                              self.recordPath is not None, self.timeControl, self.tablebasePath))
+
+        # The workers of an executor are not daemons, so with a time control
+        # they can start the processes of the bots
+        with ProcessPoolExecutor(self.processes) as pool:
+            gameResults = list(pool.map(_playGame, tasks))
+
+        if self.recordPath is not None:
+            with GameRecordWriter(self.recordPath) as writer:
+                for _, _, records in gameResults:
+                    for record in records:
+                        writer.writeEncoded(record)
+
+        return self.__mergeGames([(stats1, stats2) for stats1, stats2, _ in gameResults])
+
+    def __mergeGames(self, gameResults):
+        # Adds up the statistics of the games, in the order of the matches
+        results = []
+        for index, (i, j) in enumerate(self.__matches()):
+            stats1 = {'name': self.players[i].name}
+            stats2 = {'name': self.players[j].name}
+            for key in GAME_COUNTERS:
+                stats1[key] = 0
+                stats2[key] = 0
+            for key in LATENCY_KEYS:
+                stats1[key] = LatencyHistogram()
+                stats2[key] = LatencyHistogram()
+
+            for gameStats1, gameStats2 in gameResults[index * self.gamesPerMatch:(index + 1) * self.gamesPerMatch]:
+                for key in GAME_COUNTERS:
+                    stats1[key] += gameStats1[key]
+                    stats2[key] += gameStats2[key]
+                for key in LATENCY_KEYS:
+                    stats1[key].merge(gameStats1[key])
+                    stats2[key].merge(gameStats2[key])
+            results.append((stats1, stats2))
+
+        return results
 
     def start(self):
         self.__createOrEmptyFolder(os.getcwd(), self.resultsFolderName)
 
-        for i in range(len(self.players)):
-            for j in range(i + 1, len(self.players)):
-                stats1, stats2 = self.evaluator.runAnalysis(self.players[i], self.players[j], self.gamesPerMatch, self.maxCapturesPerGame, self.maxTurnsPerGame)
-                self.__fillStatistics(stats1, stats2)
-                self.__fillStatistics(stats2, stats1)
+        if self.processes > 1:
+            results = self.__runMatchesInParallel()
+        else:
+            results = self.__runMatches()
+
+        for stats1, stats2 in results:
+            self.__fillStatistics(stats1, stats2)
+            self.__fillStatistics(stats2, stats1)
 
         self.__createLeaderBoard()
         self.__createStatisticsPerPlayer()
@@ -0,0 +1,86 @@
+"""
+Tic-Tac-Chec search helpers
+Iterative deepening with a hard deadline, shared by the bots.
+
+The bot creates a Deadline at the start of play() with its time budget and
+calls deadline.tick() once per node of its search. The clock is only read
+every checkEvery nodes; when the time is over tick() raises SearchTimeout,
+which unwinds the search in the middle of the iteration. iterativeDeepening
+searches depth 1, 2, 3, ... and returns the result of the last depth that
+finished, so an aborted iteration is simply thrown away.
+
+Searches that play moves over a GameState must undo them when SearchTimeout
+goes through them (try/finally), or work on a copy of the state.
+"""
+import math
+import time
+
+DEFAULT_CHECK_EVERY = 256
+MAX_SEARCH_DEPTH = 64
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, budget, checkEvery=DEFAULT_CHECK_EVERY):
+        self.start = time.perf_counter()
+        self.end = self.start + budget
+        self.checkEvery = checkEvery
+        self.nodes = 0
+        self.__untilCheck = checkEvery
+
+    def tick(self):
+        # Called once per node of the search
+        self.nodes += 1
+        self.__untilCheck -= 1
+        if self.__untilCheck <= 0:
+            self.__untilCheck = self.checkEvery
+            if time.perf_counter() >= self.end:
+                raise SearchTimeout()
+
+    @classmethod
+    def until(cls, end, checkEvery=DEFAULT_CHECK_EVERY):
+        # Deadline at a time of time.perf_counter(), which is the same clock
+        # in every process of the machine
+        deadline = cls(0, checkEvery)
+        deadline.end = end
+        return deadline
+
+    def cancel(self):
+        # Ends the search at the next check of the clock
+        self.end = -math.inf
+
+    def expired(self):
+        return time.perf_counter() >= self.end
+
+    def remaining(self):
+        return max(0.0, self.end - time.perf_counter())
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def iterativeDeepening(searchDepth, deadline, maxDepth=MAX_SEARCH_DEPTH, isDecisive=None, shouldStop=None):
+    # searchDepth(depth) searches the root to the given depth and returns
+    # (move, score). Returns (move, score, depth) of the last completed depth,
+    # or (None, None, 0) if not even depth 1 finished in time.
+    # shouldStop(move, score, depth) can end the search after any iteration
+    bestMove, bestScore, completedDepth = None, None, 0
+    for depth in range(1, maxDepth + 1):
+        try:
+            move, score = searchDepth(depth)
+        except SearchTimeout:
+            break
+
+        bestMove, bestScore, completedDepth = move, score, depth
+        # There is nothing to choose or a deeper search cannot change the result
+        if move is None or (isDecisive is not None and isDecisive(score)):
+            break
+        if shouldStop is not None and shouldStop(move, score, depth):
+            break
+        if deadline.expired():
+            break
+
+    return bestMove, bestScore, completedDepth
@@ -0,0 +1,384 @@
+"""
+Tic-Tac-Chec endgame tablebase
+Result with perfect play of every position with the 8 pieces on the board
+and no captures left, solved by retrograde analysis.
+
+Without captures no piece can leave the board and no piece can be dropped,
+so these positions only lead to each other. Every position has one byte:
+
+    0      draw (or not solved yet, while the table is being built)
+    d + 1  the game ends after d more plies, the side to move wins if d is
+           odd and loses if d is even (0: the opponent already aligned 4)
+
+The positions are in the frame of the white player (white starts at the
+bottom). A position is indexed by the rank of the squares of the 8 pieces
+(white pawn, bishop, knight, rook, then black) among the 16P8 arrangements,
+the direction of both pawns and the side to move:
+
+    index = (rank * 4 + directions) * 2 + (1 if black moves)
+
+so a probe is a few multiplications and one read of the memory-mapped file.
+The directions of a pawn on the first or last row are fixed by the row, the
+other index is never used.
+
+The table is built backwards from the ends of the games. Pass 0 marks the
+positions where a player has just aligned its 4 pieces, and pass d goes
+through the positions marked by pass d - 1 and checks the positions that
+lead to them (the movements played backwards): with d odd one of them is
+enough for a win, with d even all the moves must lead to wins. The passes
+stop when one marks nothing, the positions left are draws. Every pass splits
+the file in chunks that the processes of a pool solve over the same memory
+map; two processes can only write the same result to a position.
+
+File layout:
+
+    16 bytes  HEADER: MAGIC, complete (1 when every pass ran), longest d, unused
+    u8        one result per index
+
+The full table has 16P8 * 8 = 4,151,347,200 positions (about 4 GB). Building
+it in Python is a very long job meant for a big machine:
+
+    python tablebase.py
+"""
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+
+from bitboard import BLACK, FULL_BOARD, LINE_MASKS, PAWN, PIECES, WHITE, WIN_MASKS, colorIndex, movementMask
+from game_state import PLACEMENT_PLIES
+
+MAGIC = b'TTCTB001'
+HEADER = struct.Struct('<8sBB6x')
+
+TABLEBASE_PATH = os.environ.get('TTC_TABLEBASE',
+                                os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'tablebase.bin'))
+
+PIECE_COUNT = 8
+SQUARES = 16
+
+
+def _arrangements(n, k):
+    result = 1
+    for value in range(n - k + 1, n + 1):
+        result *= value
+    return result
+
+
+RANKS = _arrangements(SQUARES, PIECE_COUNT)
+POSITIONS = RANKS * 8
+# Arrangements of the pieces after the i-th one, the weight of its choice in the rank
+RANK_WEIGHTS = tuple(_arrangements(SQUARES - 1 - i, PIECE_COUNT - 1 - i) for i in range(PIECE_COUNT))
+
+DRAW = -1
+MAX_DISTANCE = 254
+POSITIONS_PER_CHUNK = 1 << 26
+# Directions of the white and the black pawn
+DIRECTIONS = ((-1, 1), (1, 1), (-1, -1), (1, -1))
+
+
+def rankOf(squares):
+    # Rank of the squares of the 8 pieces among all the arrangements
+    rank = 0
+    used = 0
+    for weight, square in zip(RANK_WEIGHTS, squares):
+        # Free squares below this one
+        rank += (square - bin(used & ((1 << square) - 1)).count('1')) * weight
+        used |= 1 << square
+    return rank
+
+
+def rankSquares(rank):
+    free = list(range(SQUARES))
+    squares = []
+    for weight in RANK_WEIGHTS:
+        choice, rank = divmod(rank, weight)
+        squares.append(free.pop(choice))
+    return squares
+
+
+def positionIndex(squares, pawnDirections, sideToMove):
+    # squares in the order of PIECES, white then black. pawnDirections is
+    # indexed by colorIndex, in the frame of white
+    directions = (pawnDirections[0] > 0) | ((pawnDirections[1] > 0) << 1)
+    return (rankOf(squares) * 4 + directions) * 2 + (sideToMove == BLACK)
+
+
+def stateSquares(state):
+    # Squares and pawn directions of a state in the frame of white, None if
+    # the state is not in the tablebase
+    if state.ply < PLACEMENT_PLIES or state.capturesLeft[0] > 0 or state.capturesLeft[1] > 0:
+        return None
+
+    squares = []
+    for index in (0, 1):
+        for piece in PIECES:
+            mask = state.board.pieces[index][piece]
+            if not mask:
+                return None
+            squares.append(mask.bit_length() - 1)
+
+    directions = state.pawnDirections
+    if state.bottomColor == BLACK:
+        # Turned 180 degrees, the pawns that went up go down
+        squares = [15 - square for square in squares]
+        directions = [-direction for direction in directions]
+
+    return squares, directions
+
+
+def _isConsistent(squares, directions):
+    # A pawn on the first or last row always goes away from it
+    for square, direction in ((squares[0], directions[0]), (squares[4], directions[1])):
+        if (square < 4 and direction < 0) or (square >= 12 and direction > 0):
+            return False
+    return True
+
+
+def _successors(squares, directions, sideToMove):
+    # Indexes of the positions after every movement of the side to move
+    index = colorIndex(sideToMove)
+    offset = 4 * index
+    occupancy = [0, 0]
+    for i, square in enumerate(squares):
+        occupancy[i >= 4] |= 1 << square
+
+    successors = []
+    for i, piece in enumerate(PIECES):
+        origin = squares[offset + i]
+        targets = movementMask(piece, origin, directions[index], occupancy[index], occupancy[1 - index])
+        targets &= ~occupancy[1 - index]
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            target = bit.bit_length() - 1
+
+            newSquares = squares[:]
+            newSquares[offset + i] = target
+            newDirections = directions[:]
+            if piece == PAWN:
+                # The pawn reverses when it reaches a limit of the board
+                if target < 4:
+                    newDirections[index] = 1
+                elif target >= 12:
+                    newDirections[index] = -1
+            successors.append(positionIndex(newSquares, newDirections, -sideToMove))
+
+    return successors
+
+
+def _solvePosition(table, index, squares, directions, sideToMove, distance):
+    # Marks the position if it ends in distance plies, returns whether it did
+    if table[index]:
+        return False
+
+    whiteOccupancy = 0
+    blackOccupancy = 0
+    for i, square in enumerate(squares):
+        if i < 4:
+            whiteOccupancy |= 1 << square
+        else:
+            blackOccupancy |= 1 << square
+    ownOccupancy, enemyOccupancy = ((whiteOccupancy, blackOccupancy) if sideToMove == WHITE
+                                    else (blackOccupancy, whiteOccupancy))
+
+    if distance == 0:
+        if enemyOccupancy in WIN_MASKS:
+            table[index] = 1
+            return True
+        return False
+    if enemyOccupancy in WIN_MASKS or ownOccupancy in WIN_MASKS:
+        return False
+
+    values = [table[successor] for successor in _successors(squares, directions, sideToMove)]
+    if not values:
+        # Without moves the game can only be a draw
+        return False
+
+    if distance % 2 == 1:
+        # A win: one of the moves leaves the opponent lost in distance - 1
+        solved = distance in values
+    else:
+        # A loss: every move leaves the opponent a win, the longest one in distance - 1
+        solved = all(value and value % 2 == 0 for value in values) and max(values) == distance
+
+    if solved:
+        table[index] = distance + 1
+    return solved
+
+
+def positionOf(index):
+    # (squares, pawnDirections, sideToMove) of an index
+    rank, rest = divmod(index, 8)
+    directions = [1 if rest & 2 else -1, 1 if rest & 4 else -1]
+    return rankSquares(rank), directions, BLACK if rest & 1 else WHITE
+
+
+def _predecessors(squares, directions, sideToMove):
+    # Positions from which the opponent reached this one with a movement
+    # (squares, directions, side to move) of each of them
+    mover = -sideToMove
+    index = colorIndex(mover)
+    offset = 4 * index
+    occupancy = [0, 0]
+    for i, square in enumerate(squares):
+        occupancy[i >= 4] |= 1 << square
+
+    predecessors = []
+    for i, piece in enumerate(PIECES):
+        target = squares[offset + i]
+        ownOccupancy = occupancy[index] & ~(1 << target)
+        emptySquares = FULL_BOARD & ~(ownOccupancy | occupancy[1 - index])
+        previousDirections = directions[:]
+        if piece == PAWN:
+            direction = directions[index]
+            # A pawn on a limit of the board reversed when it got there
+            if target < 4:
+                direction = -1
+            elif target >= 12:
+                direction = 1
+            previousDirections[index] = direction
+            origin = target - 4 * direction
+            origins = (1 << origin) & emptySquares if 0 <= origin < SQUARES else 0
+        else:
+            # Bishops, knights and rooks can always go back the same way
+            origins = movementMask(piece, target, 0, ownOccupancy, occupancy[1 - index]) & emptySquares
+
+        while origins:
+            bit = origins & -origins
+            origins ^= bit
+            newSquares = squares[:]
+            newSquares[offset + i] = bit.bit_length() - 1
+            if _isConsistent(newSquares, previousDirections):
+                predecessors.append((newSquares, previousDirections, mover))
+
+    return predecessors
+
+
+def _openTable(path):
+    with open(path, 'r+b') as fp:
+        data = mmap.mmap(fp.fileno(), 0)
+    return data, memoryview(data)[HEADER.size:]
+
+
+def _solveEnds(task):
+    # Pass 0: the positions where the side that just moved has 4 aligned
+    path, line, winner = task
+    data, table = _openTable(path)
+    solved = 0
+    try:
+        lineSquares = [square for square in range(SQUARES) if line >> square & 1]
+        otherSquares = [square for square in range(SQUARES) if not line >> square & 1]
+        for winnerSquares in itertools.permutations(lineSquares):
+            for loserSquares in itertools.permutations(otherSquares, 4):
+                squares = list(winnerSquares + loserSquares) if winner == WHITE else list(loserSquares + winnerSquares)
+                for directions in DIRECTIONS:
+                    if _isConsistent(squares, directions):
+                        solved += _solvePosition(table, positionIndex(squares, directions, -winner),
+                                                 squares, list(directions), -winner, 0)
+    finally:
+        table.release()
+        data.close()
+
+    return solved
+
+
+def _solveChunk(task):
+    # Pass distance over the positions that end in distance - 1 plies
+    # between the indexes first and last: their predecessors are the only
+    # positions that can end in distance plies
+    path, first, last, distance = task
+    data, table = _openTable(path)
+    solved = 0
+    value = bytes((distance,))
+    try:
+        found = data.find(value, HEADER.size + first, HEADER.size + last)
+        while found >= 0:
+            for squares, directions, sideToMove in _predecessors(*positionOf(found - HEADER.size)):
+                index = positionIndex(squares, directions, sideToMove)
+                solved += _solvePosition(table, index, squares, directions, sideToMove, distance)
+            found = data.find(value, found + 1, HEADER.size + last)
+    finally:
+        table.release()
+        data.close()
+
+    return solved
+
+
+def _writeHeader(path, complete, longest):
+    with open(path, 'r+b') as fp:
+        fp.write(HEADER.pack(MAGIC, complete, longest))
+
+
+def buildTablebase(path=TABLEBASE_PATH, processes=None, chunkSize=POSITIONS_PER_CHUNK):
+    # Runs every pass and returns the longest distance
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # The results start as 0, the file is sparse until the passes write it
+    with open(path, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, 0, 0))
+        fp.truncate(HEADER.size + POSITIONS)
+
+    longest = 0
+    with multiprocessing.Pool(processes) as pool:
+        tasks = [(path, line, winner) for line in LINE_MASKS for winner in (WHITE, BLACK)]
+        sum(pool.imap_unordered(_solveEnds, tasks))
+
+        for distance in range(1, MAX_DISTANCE + 1):
+            tasks = [(path, first, min(first + chunkSize, POSITIONS), distance)
+                     for first in range(0, POSITIONS, chunkSize)]
+            if not sum(pool.imap_unordered(_solveChunk, tasks)):
+                break
+            longest = distance
+            _writeHeader(path, 0, longest)
+
+    _writeHeader(path, 1, longest)
+    return longest
+
+
+class Tablebase:
+    def __init__(self, path=TABLEBASE_PATH):
+        self.path = path
+        with open(path, 'rb') as fp:
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.complete, self.longest = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or len(self.data) != HEADER.size + POSITIONS:
+            self.data.close()
+            raise ValueError('%s is not a tablebase' % path)
+
+    def probe(self, state):
+        # Plies until the end with perfect play (odd: the side to move wins,
+        # even: it loses), DRAW, or None if the state is not in the tablebase
+        # or the table does not know it yet
+        position = stateSquares(state)
+        if position is None:
+            return None
+
+        # The side to move keeps its color when the board is turned
+        value = self.data[HEADER.size + positionIndex(position[0], position[1], state.sideToMove)]
+        if value:
+            return value - 1
+        return DRAW if self.complete else None
+
+    def close(self):
+        self.data.close()
+
+
+_tablebases = {}
+
+
+def loadTablebase(path=TABLEBASE_PATH):
+    # Tablebase of the path shared by the bots of the process, None if there
+    # is none there
+    if path not in _tablebases:
+        try:
+            _tablebases[path] = Tablebase(path)
+        except (OSError, ValueError):
+            _tablebases[path] = None
+
+    return _tablebases[path]
+
+
+if __name__ == '__main__':
+    print('Longest game: %d plies' % buildTablebase())
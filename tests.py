@@ -1,7 +1,36 @@
+import collections
+import contextlib
+import io
+import json
+import os
+import tempfile
 import unittest
 
+from analysis_cache import AnalysisCache, SLOT
 from evaluator import TTCEvaluator, PlayerWrapper
 from player3 import TTCPlayer
+import attack_tables
+from board_view import BoardView
+from bitboard import (Bitboard, CAPTURE, DROP, LINE_MASKS, LINE_PATTERNS, MOVEMENT, OFF_BOARD, alignment, decodeMove,
+                      encodeMove, isWinningPosition, lineCodes, squareOf)
+from event_log import BinarySink, ConsoleSink, INVALID_BOARD, NDJSONSink, NullSink, RESULTS, VERBOSE, readBinaryEvents
+import game_record
+import opening_book
+import proof_search
+import tablebase
+from game_state import GameState, encodeBoard
+from move_ordering import MoveOrdering
+from ponder import Ponderer
+import player2
+import playerNacho
+from player_random import TTCPlayer as RandomTTCPlayer
+from latency import LatencyHistogram
+from round_robin import LATENCY_KEYS, PlayerSpec, RoundRobin
+from search import Deadline, SearchTimeout, iterativeDeepening
+from time_control import Clock, TimeControl
+from time_manager import TimeManager
+import time
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, fromChild
 
 class MockTTCPlayer:
     def __init__(self, valuesCode):
@@ -13,6 +42,17 @@ class MockTTCPlayer:
 
     def play(self, world):
         return self.mockWorld
+
+
+class SlowTTCPlayer(RandomTTCPlayer):
+    def play(self, board):
+        time.sleep(5)
+        return RandomTTCPlayer.play(self, board)
+
+
+class BrokenTTCPlayer(RandomTTCPlayer):
+    def play(self, board):
+        return 1 / 0
     
 
 class TestEvaluator(unittest.TestCase):
@@ -651,7 +691,7 @@ class TestEvaluator(unittest.TestCase):
                    ]
         
         for i in range(len(results)):
-            ans = eval._TTCEvaluator__rotateBoard(boards[i])
+            ans = BoardView.fromRows(boards[i], 1).rows(-1)
             self.assertEqual(ans, results[i])
     
     # test validMove, capture, capture < 2, capture > max, winning position, 
@@ -768,7 +808,7 @@ class TestEvaluator(unittest.TestCase):
             eval = TTCEvaluator()
             eval.maxCaptures = maxCaptures[i]
             eval.currentTurn = turns[i]
-            eval.board = oldBoards[i]
+            eval.view = BoardView.fromRows(oldBoards[i], players[i].piecesColor)
 
             players[i].captures = playersCaptures[i]
             players[i].pawnDirection = playersPawnDirections[i]
@@ -778,7 +818,844 @@ class TestEvaluator(unittest.TestCase):
             self.assertEqual(ans, results[i])
 
 
-
+class TestBitboard(unittest.TestCase):
+    def test_boardRoundTrip(self):
+        board = [[-1, 0, 1, 0],
+                 [0, 0, -2, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 2, 0]]
+
+        bb = Bitboard.fromBoard(board)
+        self.assertEqual(bb.toBoard(), board)
+        self.assertEqual(bb.pieceAt(squareOf(2, 1)), 4)
+        self.assertEqual(bb.pieceSquare(-1, 2), squareOf(1, 2))
+        self.assertEqual(bb.pieceSquare(-1, 4), -1)
+
+    def test_isWin(self):
+        board = [[0, 0, 0, 1],
+                 [0, -1, 2, 0],
+                 [0, 3, -2, 0],
+                 [4, 0, 0, 0]]
+
+        bb = Bitboard.fromBoard(board)
+        self.assertTrue(bb.isWin(1))
+        self.assertFalse(bb.isWin(-1))
+        self.assertTrue(isWinningPosition(board, 1))
+
+    def test_generateAndApplyMoves(self):
+        board = [[0, 0, 0, 0],
+                 [0, 3, -4, -1],
+                 [0, 1, 0, 0],
+                 [0, 0, 0, 0]]
+
+        bb = Bitboard.fromBoard(board)
+
+        # Only drops are allowed in the first turns
+        moves = bb.generateMoves(1, -1, allowMovements=False)
+        self.assertEqual(len(moves), 2 * 12)
+
+        # Pawn at (2, 1) going up can capture the rook at (1, 2)
+        moves = bb.generateMoves(1, -1)
+        self.assertIn(encodeMove(1, squareOf(1, 2)), moves)
+        self.assertNotIn(encodeMove(1, squareOf(1, 1)), moves)
+
+        moves = bb.generateMoves(1, -1, allowCaptures=False)
+        self.assertNotIn(encodeMove(1, squareOf(1, 2)), moves)
+
+        captured = bb.applyMove(1, encodeMove(1, squareOf(1, 2)))
+        self.assertEqual(captured, -4)
+        self.assertEqual(bb.toBoard(), [[0, 0, 0, 0],
+                                        [0, 3, 1, -1],
+                                        [0, 0, 0, 0],
+                                        [0, 0, 0, 0]])
+
+
+    def test_decodeMove(self):
+        board = [[0, 2, -4, 0],
+                 [0, -1, 0, 0],
+                 [-2, 1, 4, 0],
+                 [0, 3, 0, 0]]
+        knightMove = [[0, 2, -4, 0],
+                      [0, -1, 3, 0],
+                      [-2, 1, 4, 0],
+                      [0, 0, 0, 0]]
+        rookCapture = [[0, 2, 4, 0],
+                       [0, -1, 0, 0],
+                       [-2, 1, 0, 0],
+                       [0, 3, 0, 0]]
+        blackDrop = [[0, 2, -4, 0],
+                     [0, -1, 0, 0],
+                     [-2, 1, 4, 0],
+                     [0, 3, 0, -3]]
+        rookJump = [[0, 2, -4, 0],
+                    [0, -1, 0, 0],
+                    [4, 1, 0, 0],
+                    [0, 3, 0, 0]]
+
+        self.assertEqual(decodeMove(board, knightMove, 1, -1), (MOVEMENT, 3, squareOf(3, 1), squareOf(1, 2)))
+        self.assertEqual(decodeMove(board, rookCapture, 1, -1), (CAPTURE, 4, squareOf(2, 2), squareOf(0, 2)))
+        self.assertEqual(decodeMove(board, blackDrop, -1, 1), (DROP, 3, -1, squareOf(3, 3)))
+        # The rook cannot capture through other pieces, a white piece cannot be dropped twice
+        self.assertIsNone(decodeMove(board, rookJump, 1, -1))
+        self.assertIsNone(decodeMove(board, blackDrop, 1, -1))
+        self.assertIsNone(decodeMove(board, knightMove, -1, 1))
+
+    def test_alignment(self):
+        board = [[0, 2, -4, 0],
+                 [0, -1, 0, 0],
+                 [-2, 1, 4, 0],
+                 [0, 3, 0, -3]]
+
+        # The first line with 3 white pieces is the second column
+        self.assertEqual(alignment(board, 1), (3, {1, 2, 3}, {4}, {(1, 1)}, {(0, 1), (2, 1), (3, 1)}))
+        self.assertEqual(alignment(board, -1)[0:3], (2, {-1, -3}, {-2, -4}))
+
+        # The last row holds the black knight and the white knight
+        code = lineCodes(board)[3]
+        self.assertEqual(LINE_PATTERNS[0][code], (1, 1, 0b1011, False, 0b0010))
+        self.assertEqual(LINE_PATTERNS[1][code], (1, 1, 0b1011, False, 0b1000))
+
+class TestAttackTables(unittest.TestCase):
+    def test_sliderAttacks(self):
+        # Rook in the corner of an empty board sees its row and column
+        self.assertEqual(attack_tables.ROOK_ATTACKS[squareOf(0, 0) << 16], 0x111E)
+
+        # Bishop in (1, 1) blocked by a piece in (2, 2)
+        occupancy = 1 << squareOf(2, 2)
+        expected = (1 << squareOf(0, 0)) | (1 << squareOf(0, 2)) | (1 << squareOf(2, 0)) | occupancy
+        self.assertEqual(attack_tables.BISHOP_ATTACKS[(squareOf(1, 1) << 16) | occupancy], expected)
+
+    def test_loadFromCache(self):
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+            path = os.path.join(folder, 'tables.bin')
+            built = attack_tables.loadSliderTables(path)
+            mapped = attack_tables.loadSliderTables(path)
+
+            self.assertTrue(os.path.exists(path))
+            for square in range(16):
+                index = (square << 16) | 0x0F0F
+                self.assertEqual(built[0][index], mapped[0][index])
+                self.assertEqual(built[1][index], mapped[1][index])
+                self.assertEqual(mapped[1][index], attack_tables.ROOK_ATTACKS[index])
+
+
+class TestGameState(unittest.TestCase):
+    def test_encodeDecode(self):
+        board = [[-1, 0, 1, 0],
+                 [0, 0, -2, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 2, 0]]
+
+        state = GameState.fromBoard(board, -1, ply=4, capturesLeft=(7, 3), pawnDirections=(1, -1))
+        decoded = GameState.decode(state.encode())
+
+        self.assertEqual(decoded.toBoard(), board)
+        self.assertEqual(decoded.sideToMove, -1)
+        self.assertEqual(decoded.capturesLeft, [7, 3])
+        self.assertEqual(decoded.pawnDirections, [1, -1])
+        self.assertEqual(decoded.ply, 4)
+        self.assertEqual(decoded, state)
+        self.assertEqual(decoded.hash, state.hash)
+
+    def test_incrementalHash(self):
+        state = GameState.fromBoard([[0] * 4 for _ in range(4)], 1, ply=0, capturesLeft=(7, 7))
+
+        state.setPiece(3, squareOf(3, 1))
+        state.setPawnDirection(1, 1)
+        state.setCapturesLeft(-1, 6)
+        state.setSideToMove(-1)
+        state.setPly(1)
+        self.assertEqual(state.hash, state.computeHash())
+
+        state.removePiece(3, squareOf(3, 1))
+        self.assertEqual(state.hash, state.computeHash())
+
+    def test_makeUnmakeMove(self):
+        board = [[-1, 0, 0, -3],
+                 [0, -2, 0, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 1, 0]]
+        state = GameState.fromBoard(board, 1, capturesLeft=(2, 2))
+        before = state.encode()
+
+        for move in state.legalMoves():
+            undo = state.makeMove(move)
+            self.assertEqual(state.hash, state.computeHash())
+            self.assertEqual(state.sideToMove, -1)
+            for reply in state.legalMoves():
+                replyUndo = state.makeMove(reply)
+                self.assertEqual(state.hash, state.computeHash())
+                state.unmakeMove(replyUndo)
+            state.unmakeMove(undo)
+
+            self.assertEqual(state.encode(), before)
+            self.assertEqual(state.hash, state.computeHash())
+
+        # The rook captures the black bishop
+        undo = state.makeMove(encodeMove(4, squareOf(1, 1)))
+        self.assertEqual(state.capturesLeft, [1, 2])
+        self.assertEqual(state.toBoard()[1][1], 4)
+        state.unmakeMove(undo)
+        self.assertEqual(state.toBoard(), board)
+
+    def test_lineCounts(self):
+        board = [[-1, 0, 0, -3],
+                 [0, -2, 0, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 1, 0]]
+        state = GameState.fromBoard(board, 1, capturesLeft=(2, 2))
+        self.assertEqual(state.bestLine(-1), (2, LINE_MASKS[0]))
+        self.assertEqual(state.maxAligned(1), 2)
+
+        # The rook captures the black bishop, the last row is still the best white line
+        undo = state.makeMove(encodeMove(4, squareOf(1, 1)))
+        self.assertEqual(state.bestLine(1), (2, LINE_MASKS[3]))
+        self.assertEqual(state.lineCount(1, 5), 1)
+        self.assertEqual(state.pieceSquare(1, 4), squareOf(1, 1))
+        self.assertEqual(state.pieceSquare(-1, 2), OFF_BOARD)
+        self.assertEqual(state.maxAligned(-1), 2)
+
+        state.unmakeMove(undo)
+        rebuilt = GameState.fromBoard(board, 1, capturesLeft=(2, 2))
+        self.assertEqual((state.lineCounts, state.pieceSquares), (rebuilt.lineCounts, rebuilt.pieceSquares))
+
+    def test_botPieceSquares(self):
+        board = [[-1, 0, 0, -3],
+                 [0, -2, 0, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 1, 2]]
+        for player in (TTCPlayer('player3'), player2.TTCPlayer('player2'), playerNacho.TTCPlayer('nacho')):
+            player.setColor(1)
+            player.reset()
+            player._TTCPlayer__updatePiecesOnBoard(GameState.fromBoard(board, 1))
+            self.assertEqual(player.pieceSquares, [OFF_BOARD, squareOf(3, 2), squareOf(3, 3), squareOf(3, 0), squareOf(2, 1)])
+            self.assertEqual(player.piecesOnBoard, [0, 1, 1, 1, 1])
+
+            # The random move starts from the square of the index
+            newBoard = player._TTCPlayer__moveRandomPiece([row[:] for row in board])
+            self.assertIsNotNone(decodeMove(board, newBoard, 1, -1))
+
+    def test_encodeBoard(self):
+        board = [[-1, 0, 1, 0],
+                 [0, 0, -2, 0],
+                 [0, 4, 0, 0],
+                 [3, 0, 2, 0]]
+
+        self.assertEqual(encodeBoard(board), encodeBoard([row[:] for row in board]))
+        board[0][0] = 1
+        board[0][2] = -1
+        self.assertEqual(encodeBoard(board), GameState.fromBoard(board, 1).encode() & ((1 << 64) - 1))
+
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_storeAndProbe(self):
+        table = TranspositionTable(sizeMB=0.001)
+
+        self.assertIsNone(table.probe(12345))
+        table.store(12345, 3, -7, UPPER_BOUND, encodeMove(4, 9))
+        self.assertEqual(table.probe(12345), (3, -7, UPPER_BOUND, encodeMove(4, 9)))
+        self.assertIsNone(table.probe(12345 + table.bucketCount))
+
+    def test_replacement(self):
+        table = TranspositionTable(sizeMB=0.001)
+        key = 77
+        other = key + table.bucketCount
+        third = key + 2 * table.bucketCount
+
+        # The deep entry keeps the depth-preferred slot
+        table.store(key, 4, 10, EXACT)
+        table.store(other, 1, 2, LOWER_BOUND)
+        table.store(third, 2, 3, LOWER_BOUND)
+        self.assertEqual(table.probe(key), (4, 10, EXACT, 0))
+        self.assertIsNone(table.probe(other))
+        self.assertEqual(table.probe(third), (2, 3, LOWER_BOUND, 0))
+
+        # A deeper search takes the depth-preferred slot
+        table.store(other, 5, 1, EXACT)
+        self.assertIsNone(table.probe(key))
+        self.assertEqual(table.probe(other), (5, 1, EXACT, 0))
+
+    def test_aging(self):
+        table = TranspositionTable(sizeMB=0.001)
+        key = 77
+        other = key + table.bucketCount
+        third = key + 2 * table.bucketCount
+
+        # The entries of an older search are used, but replaced first
+        table.store(key, 6, 10, EXACT)
+        table.newSearch()
+        self.assertEqual(table.probe(key), (6, 10, EXACT, 0))
+        table.store(other, 1, 2, EXACT)
+        self.assertEqual(table.probe(other), (1, 2, EXACT, 0))
+
+        # A stale entry that is found again is kept like a new one
+        table.newSearch()
+        self.assertEqual(table.probe(other), (1, 2, EXACT, 0))
+        table.store(third, 0, 3, EXACT)
+        self.assertEqual(table.probe(other), (1, 2, EXACT, 0))
+        self.assertEqual(table.probe(third), (0, 3, EXACT, 0))
+        self.assertIsNone(table.probe(key))
+
+
+class TestAnalysisCache(unittest.TestCase):
+    def test_sharedFile(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'cache.bin')
+            with AnalysisCache(path, 'player3', sizeMB=0.001) as writer, AnalysisCache(path, 'player3') as reader:
+                self.assertEqual(reader.bucketCount, writer.bucketCount)
+                writer.store(77, 4, -9, LOWER_BOUND, 0x21)
+                # Shallow searches are not written
+                writer.store(78, 1, 5, EXACT)
+                self.assertEqual(reader.probe(77), (4, -9, LOWER_BOUND, 0x21))
+                self.assertIsNone(reader.probe(78))
+
+                # Other bots do not see the scores
+                with AnalysisCache(path, 'playerNacho') as other:
+                    self.assertIsNone(other.probe(77))
+
+                # A slot that is half written is a miss
+                offset = writer._AnalysisCache__offset(77 ^ writer.salt)
+                check, entry = SLOT.unpack_from(writer.data, offset)
+                SLOT.pack_into(writer.data, offset, check, entry ^ (1 << 19))
+                self.assertIsNone(reader.probe(77))
+
+            # The entries are kept in the file
+            writer = AnalysisCache(path, 'player3')
+            writer.store(79, 3, 1, EXACT)
+            writer.close()
+            with AnalysisCache(path, 'player3', readOnly=True) as reader:
+                self.assertEqual(reader.probe(79), (3, 1, EXACT, 0))
+
+    def test_notACache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'cache.bin')
+            with open(path, 'wb') as fp:
+                fp.write(bytes(64))
+            self.assertRaises(ValueError, AnalysisCache, path)
+
+
+class TestSearch(unittest.TestCase):
+    def test_deadline(self):
+        deadline = Deadline(0, checkEvery=4)
+
+        for _ in range(3):
+            deadline.tick()
+        self.assertRaises(SearchTimeout, deadline.tick)
+        self.assertEqual(deadline.nodes, 4)
+        self.assertTrue(deadline.expired())
+
+    def test_iterativeDeepening(self):
+        deadline = Deadline(60)
+
+        def searchDepth(depth):
+            if depth == 3:
+                raise SearchTimeout()
+            return depth * 16, depth
+
+        # The aborted iteration is thrown away
+        self.assertEqual(iterativeDeepening(searchDepth, deadline), (32, 2, 2))
+        self.assertEqual(iterativeDeepening(searchDepth, deadline, isDecisive=lambda score: score >= 1), (16, 1, 1))
+
+    def test_evaluatePosition(self):
+        player = TTCPlayer('player3')
+        player.setColor(1)
+        player.reset()
+        player.currentTurn = 5
+        board = [[-1, -2, 0, 0],
+                 [0, 0, 0, 0],
+                 [0, 0, 4, 0],
+                 [1, 2, 3, 0]]
+
+        # The rook can only complete the line by capturing on the missing square
+        self.assertEqual(player.evaluatePosition(GameState.fromBoard(board, 1)), 4)
+        board[3][3] = -3
+        self.assertEqual(player.evaluatePosition(GameState.fromBoard(board, 1)), 8)
+        player.currentTurn = 0
+        self.assertEqual(player.evaluatePosition(GameState.fromBoard(board, 1)), 4)
+
+    def test_searchRoot(self):
+        # The root scores every move by the position with the opponent to move
+        player = TTCPlayer('player3')
+        player.setColor(1)
+        player.reset()
+        player.currentTurn = 5
+        state = GameState.fromBoard(TestTablebase.BOARD, 1, capturesLeft=(2, 2))
+        self.assertEqual(player._TTCPlayer__searchRoot(state, 1), (0x4F, fromChild(10)))
+
+        # Black aligns in the first row unless a white piece gets there first
+        board = [[-1, -2, -3, 0],
+                 [0, 0, 0, -4],
+                 [0, 2, 0, 0],
+                 [1, 0, 0, 4]]
+        state = GameState.fromBoard(board, 1, capturesLeft=(0, 0))
+        move, score = player._TTCPlayer__searchRoot(state, 2)
+        self.assertEqual(move & 15, squareOf(0, 3))
+        self.assertGreater(score, -8)
+
+    def test_ponderer(self):
+        def search(deadline):
+            # Searches until it is stopped, the last finished depth is the result
+            depth = 0
+            try:
+                while True:
+                    deadline.tick()
+                    depth += 1
+            except SearchTimeout:
+                return 'searched'
+
+        ponderer = Ponderer()
+        ponderer.start('predicted', search)
+        self.assertEqual(ponderer.stop('predicted'), 'searched')
+        ponderer.start('predicted', search)
+        self.assertIsNone(ponderer.stop('other'))
+        self.assertEqual((ponderer.hits, ponderer.misses), (1, 1))
+
+        # In the process of its opponent the bot does not ponder
+        player = TTCPlayer('ponder', moveTime=0.05, ponder=True)
+        TTCEvaluator(NullSink()).runAnalysis(player, RandomTTCPlayer('random'), 2, 3, 10)
+        self.assertIsNone(player.ponderer.thread)
+        self.assertEqual((player.ponderer.hits, player.ponderer.misses), (0, 0))
+
+        # In its own process it ponders and stops its thread before every move
+        evaluator = TTCEvaluator(NullSink(), timeControl=TimeControl(moveTime=1.0))
+        stats, randomStats = evaluator.runAnalysis(player, RandomTTCPlayer('random'), 2, 3, 10)
+        self.assertEqual((stats['raised_errors'], stats['timeouts'], stats['invalid_moves']), (0, 0, 0))
+
+    def test_timeManager(self):
+        manager = TimeManager(1.0)
+        self.assertEqual(manager.allocate(), 1.0)
+        # The clock is shared between the turns left, more time when it is critical
+        self.assertEqual(manager.allocate(clockLeft=10.0, turnsLeft=20), 0.5)
+        self.assertEqual(manager.allocate(clockLeft=10.0, turnsLeft=20, critical=True), 1.0)
+        # Without a clock there is no time to spare, critical or not
+        self.assertEqual(manager.allocate(critical=True), 1.0)
+        self.assertEqual(manager.allocate(timeLeft=2.0, critical=True), 1.0)
+        self.assertEqual(manager.allocate(timeLeft=0.5), 0.4)
+
+        # A best move that does not change stops the search early
+        manager.startMove(60, 1)
+        manager.deadline.start -= 13
+        stops = [manager.shouldStop(move, 0, depth) for depth, move in enumerate((1, 2, 2, 2), 1)]
+        self.assertEqual(stops, [False, False, False, True])
+
+
+class TestMoveOrdering(unittest.TestCase):
+    def test_orderMoves(self):
+        # The white rook can win on (3, 3) or capture the black rook,
+        # the white pawn can capture the black bishop
+        board = [[0, 0, 0, -4],
+                 [0, 0, 0, 4],
+                 [0, -2, 0, 0],
+                 [1, 2, 3, 0]]
+        state = GameState.fromBoard(board, 1, capturesLeft=(2, 2))
+        ordering = MoveOrdering()
+        win = encodeMove(4, squareOf(3, 3))
+        captures = {encodeMove(4, squareOf(0, 3)), encodeMove(1, squareOf(2, 1))}
+        hashMove = encodeMove(4, squareOf(1, 1))
+        quiet = encodeMove(4, squareOf(1, 0))
+
+        moves = ordering.orderMoves(state, state.legalMoves(), 1, hashMove)
+        self.assertEqual(moves[:2], [hashMove, win])
+        self.assertEqual(set(moves[2:4]), captures)
+
+        # A quiet move that caused a cutoff is a killer of its ply
+        ordering.recordCutoff(state, quiet, 1, 2, 3)
+        moves = ordering.orderMoves(state, state.legalMoves(), 1)
+        self.assertEqual(moves[0], win)
+        self.assertEqual(moves[3], quiet)
+        self.assertEqual(ordering.history[4][squareOf(1, 0)], 4)
+        self.assertEqual(ordering.firstMoveCutoffRate(), 0)
+
+        # Killers are kept per ply
+        self.assertEqual(ordering.killers[1][0], quiet)
+        self.assertEqual(ordering.killers[2], [0, 0])
+
+
+class TestParallelRootSearch(unittest.TestCase):
+    def tearDown(self):
+        playerNacho.closePools()
+
+    BOARD = [[-1, 0, -3, 0],
+             [0, -2, 0, 0],
+             [0, 0, 4, -4],
+             [3, 0, 1, 2]]
+
+    def test_sameMoveAsSerial(self):
+        board = self.BOARD
+        results = []
+        for workers in (1, 2):
+            player = playerNacho.TTCPlayer('nacho', workers=workers)
+            player.setColor(1)
+            player.reset()
+            player.deadline = Deadline(60)
+            state = GameState.fromPlayerView(board, 1, 5, -1, 1, 3, 3)
+            results.append(player._TTCPlayer__getBestRootMove(state, 3))
+
+        self.assertEqual(results[0], results[1])
+
+    def test_lateTask(self):
+        # A root move picked up after the end of the move is not searched
+        player = playerNacho.TTCPlayer('worker')
+        code = GameState.fromPlayerView(self.BOARD, 1, 5, -1, 1, 3, 3).encode()
+        self.assertEqual(player.searchRootMove(1, code, encodeMove(4, squareOf(2, 3)), 3, time.perf_counter() - 1),
+                         (False, None))
+        finished, _ = player.searchRootMove(1, code, encodeMove(4, squareOf(2, 3)), 1, time.perf_counter() + 60)
+        self.assertTrue(finished)
+
+
+class TestOpeningBook(unittest.TestCase):
+    def test_buildAndLookup(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'book.bin')
+            # The first drop of white and the 64 answers of black
+            self.assertEqual(opening_book.buildBook(path, depth=2, plies=2, processes=1), 65)
+
+            book = opening_book.OpeningBook(path)
+            try:
+                state = GameState(-1)
+                state.makeMove(0x13)
+                move = book.lookup(state)
+                self.assertIn(move, state.legalMoves())
+                # The captures left are not part of the key
+                state.setCapturesLeft(-1, 2)
+                self.assertEqual(book.lookup(state), move)
+
+                # The bot plays the book move on its first turn
+                player = playerNacho.TTCPlayer('nacho', bookPath=path)
+                player.setColor(-1)
+                player.reset()
+                board = state.toBoard()
+                state.makeMove(move)
+                self.assertEqual(player.play(board), state.toBoard())
+
+                # The position after the book move is not in a book of 2 plies
+                state.makeMove(state.legalMoves()[0])
+                self.assertIsNone(book.lookup(state))
+            finally:
+                book.close()
+
+    def test_searchMove(self):
+        board = [[0, -2, 0, -3],
+                 [0, 0, 0, 0],
+                 [0, -1, 0, 0],
+                 [1, 2, 3, 0]]
+        state = GameState.fromBoard(board, 1, capturesLeft=(3, 3))
+        self.assertEqual(opening_book.searchMove(state, 3), 0x4F)
+
+
+class TestTablebase(unittest.TestCase):
+    # White to move aligns the last row with the rook
+    BOARD = [[-1, -2, -3, 0],
+             [-4, 0, 0, 0],
+             [0, 0, 0, 4],
+             [1, 2, 3, 0]]
+    WIN = [[-1, -2, -3, 0],
+           [-4, 0, 0, 0],
+           [0, 0, 0, 0],
+           [1, 2, 3, 4]]
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'tablebase.bin')
+        # The file is sparse, only the positions of the test take space
+        with open(self.path, 'wb') as fp:
+            fp.write(tablebase.HEADER.pack(tablebase.MAGIC, 1, 1))
+            fp.truncate(tablebase.HEADER.size + tablebase.POSITIONS)
+            for board, sideToMove, value in ((self.BOARD, 1, 2), (self.WIN, -1, 1)):
+                squares, directions = tablebase.stateSquares(GameState.fromBoard(board, sideToMove, bottomColor=1))
+                fp.seek(tablebase.HEADER.size + tablebase.positionIndex(squares, directions, sideToMove))
+                fp.write(bytes((value,)))
+
+    def tearDown(self):
+        tablebase._tablebases.clear()
+        self.folder.cleanup()
+
+    def test_indexes(self):
+        state = GameState.fromBoard(self.BOARD, 1, bottomColor=1)
+        squares, directions = tablebase.stateSquares(state)
+        self.assertEqual(tablebase.positionOf(tablebase.positionIndex(squares, directions, 1)), (squares, directions, 1))
+
+        # The same position seen by black
+        rotated = [row[::-1] for row in reversed(self.BOARD)]
+        self.assertEqual(tablebase.stateSquares(GameState.fromPlayerView(rotated, -1, 5, -1, 1, 0, 0)),
+                         (squares, directions))
+
+        # Every move can be played backwards
+        for successor in tablebase._successors(squares, directions, 1):
+            predecessors = tablebase._predecessors(*tablebase.positionOf(successor))
+            self.assertIn((squares, directions, 1), predecessors)
+
+        self.assertIsNone(tablebase.stateSquares(GameState.fromBoard(self.BOARD, 1, capturesLeft=(1, 0))))
+
+    def test_solvePosition(self):
+        table = collections.defaultdict(int)
+        win = GameState.fromBoard(self.WIN, -1, bottomColor=1)
+        squares, directions = tablebase.stateSquares(win)
+        self.assertTrue(tablebase._solvePosition(table, tablebase.positionIndex(squares, directions, -1),
+                                                 squares, directions, -1, 0))
+
+        squares, directions = tablebase.stateSquares(GameState.fromBoard(self.BOARD, 1, bottomColor=1))
+        index = tablebase.positionIndex(squares, directions, 1)
+        self.assertFalse(tablebase._solvePosition(table, index, squares, directions, 1, 2))
+        self.assertTrue(tablebase._solvePosition(table, index, squares, directions, 1, 1))
+        self.assertEqual(table[index], 2)
+
+    def test_probe(self):
+        book = tablebase.Tablebase(self.path)
+        try:
+            self.assertEqual(book.probe(GameState.fromBoard(self.BOARD, 1, bottomColor=1)), 1)
+            self.assertEqual(book.probe(GameState.fromBoard(self.BOARD, -1, bottomColor=1)), tablebase.DRAW)
+            self.assertIsNone(book.probe(GameState.fromBoard(self.BOARD, 1, capturesLeft=(1, 0))))
+        finally:
+            book.close()
+
+        # Nacho plays the win of the tablebase
+        player = playerNacho.TTCPlayer('nacho', tablebasePath=self.path)
+        player.setColor(1)
+        player.reset()
+        player.currentTurn = 5
+        player.availableCaptures = 0
+        player.opponent.availableCaptures = 0
+        self.assertEqual(player.play([row[:] for row in self.BOARD]), self.WIN)
+
+    def test_adjudication(self):
+        # Black moves its rook and white wins in 1 ply
+        previous = [row[:] for row in self.BOARD]
+        previous[1][0], previous[1][1] = 0, -4
+        eval = TTCEvaluator(sink=NullSink(), tablebasePath=self.path)
+        eval.maxCaptures = 0
+        eval.maxTurns = 10
+        eval.currentTurn = 5
+        eval.view = BoardView.fromRows(previous, 1)
+        eval.whitePlayer = PlayerWrapper(MockTTCPlayer([1, 2, 3, 4]), 1)
+        eval.blackPlayer = PlayerWrapper(MockTTCPlayer([-1, -2, -3, -4]), -1)
+        eval.blackPlayer.player.setMockWorld([row[::-1] for row in reversed(self.BOARD)])
+
+        self.assertEqual(eval._TTCEvaluator__playTurn(eval.blackPlayer), eval.LOSE)
+        self.assertEqual(eval.endReason, game_record.END_ADJUDICATED)
+
+        # Too close to the last turn to be adjudicated
+        eval.currentTurn = 9
+        eval.view = BoardView.fromRows(previous, 1)
+        self.assertEqual(eval._TTCEvaluator__playTurn(eval.blackPlayer), eval.CONTINUE)
+
+
+class TestProofSearch(unittest.TestCase):
+    def setUp(self):
+        self.state = GameState.fromBoard(TestTablebase.BOARD, 1, capturesLeft=(2, 2))
+
+    def test_prove(self):
+        prover = proof_search.ProofSearch(maxPlies=3)
+        self.assertEqual(prover.prove(self.state, 1), (proof_search.PROVEN, 0x4F))
+
+        # White moves first and aligns before black can
+        result, move = prover.prove(self.state, -1)
+        self.assertEqual(result, proof_search.DISPROVEN)
+        self.assertIn(move, self.state.legalMoves())
+        self.assertEqual(self.state.hash, GameState.fromBoard(TestTablebase.BOARD, 1, capturesLeft=(2, 2)).hash)
+
+    def test_shortestWin(self):
+        # White wins at once with the bishop, the pawn move is a longer forced win
+        state = GameState.fromBoard([[-2, -4, -1, 0],
+                                     [0, 3, 4, 1],
+                                     [0, 0, 0, 0],
+                                     [0, 0, -3, 0]], 1, 28, (0, 0), (-1, 1))
+        self.assertEqual(proof_search.ProofSearch().prove(state, 1), (proof_search.PROVEN, 0x24))
+        undo = state.makeMove(0x13)
+        self.assertEqual(proof_search.ProofSearch(maxPlies=4).prove(state, 1)[0], proof_search.PROVEN)
+        state.unmakeMove(undo)
+
+        # The win in 7 plies is played, not the first one found in 9
+        state = GameState.fromBoard([[0, 0, 0, -1],
+                                     [0, -4, 0, 0],
+                                     [2, 0, 3, 0],
+                                     [0, -3, 1, -2]], 1, 20, (2, 0), (-1, 1))
+        result, move = proof_search.ProofSearch().prove(state, 1)
+        self.assertEqual(result, proof_search.PROVEN)
+        self.assertEqual(proof_search.ProofSearch(maxPlies=5).prove(state, 1)[0], proof_search.DISPROVEN)
+        state.makeMove(move)
+        self.assertEqual(proof_search.ProofSearch(maxPlies=6).prove(state, 1)[0], proof_search.PROVEN)
+
+    def test_bots(self):
+        # player3 and player2 play the proven win before their search
+        for player in (TTCPlayer('player3', moveTime=0.2), player2.TTCPlayer('player2', moveTime=0.2)):
+            player.reset()
+            player.setColor(1)
+            player.currentTurn = 10
+            results = []
+            prove = player.prover.prove
+            player.prover.prove = lambda *args: results.append(prove(*args)) or results[-1]
+            self.assertEqual(player.play([row[:] for row in TestTablebase.BOARD]), TestTablebase.WIN)
+            self.assertEqual(results, [(proof_search.PROVEN, 0x4F)])
+
+    def test_limits(self):
+        # Nothing is decided after the first drops
+        state = GameState(1)
+        unknown = (proof_search.UNKNOWN, None)
+        self.assertEqual(proof_search.ProofSearch(maxNodes=1).prove(state, 1), unknown)
+        self.assertEqual(proof_search.ProofSearch().prove(state, 1, Deadline(0, 1)), unknown)
+
+
+class TestRoundRobin(unittest.TestCase):
+    def test_parallelTournament(self):
+        players = [PlayerSpec('player_random', 'random1'),
+                   PlayerSpec('player_random', 'random2'),
+                   PlayerSpec('player_random', 'random3')]
+        cwd = os.getcwd()
+        statistics = []
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+            os.chdir(folder)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for processes in (2, 2, 1):
+                        tournament = RoundRobin(players, 4, 3, 20, processes=processes, seed=7, verbosity=0)
+                        tournament.start()
+                        statistics.append(tournament.playerStatistics)
+            finally:
+                os.chdir(cwd)
+
+        # Every game was merged and the seeds make every run equal, in a
+        # single process too, except for the times of the moves
+        for name, stats in statistics[0].items():
+            self.assertEqual(stats['won_games'] + stats['drew_games'] + stats['lost_games'], 8)
+            self.assertEqual(stats['won_match'] + stats['drew_match'] + stats['lost_match'], 2)
+            self.assertEqual(stats['placement_latency'].count, 8 * 3)
+            for key in LATENCY_KEYS:
+                for other in statistics[1:]:
+                    self.assertEqual(stats[key].count, other[name][key].count)
+                    del other[name][key]
+                del stats[key]
+        self.assertEqual(statistics[0], statistics[1])
+        self.assertEqual(statistics[0], statistics[2])
+
+
+class TestTimeControl(unittest.TestCase):
+    def test_clock(self):
+        clock = Clock(TimeControl(moveTime=2.0, totalTime=3.0, increment=0.5))
+        self.assertEqual(clock.timeLeft(1), 2.0)
+        clock.spend(1, 1.5)
+        self.assertEqual(clock.timeLeft(1), 2.0)
+        clock.spend(1, 1.5)
+        self.assertEqual(clock.timeLeft(1), 1.0)
+        self.assertEqual(clock.timeLeft(-1), 2.0)
+        self.assertEqual(Clock(TimeControl(moveTime=0.5)).timeLeft(-1), 0.5)
+
+    def test_timeout(self):
+        output = io.StringIO()
+        evaluator = TTCEvaluator(ConsoleSink(RESULTS, output), timeControl=TimeControl(moveTime=0.3))
+        slowStats, randomStats = evaluator.runAnalysis(SlowTTCPlayer('slow'), RandomTTCPlayer('random'), 1, 3, 10)
+
+        self.assertEqual((slowStats['name'], slowStats['timeouts'], slowStats['loses']), ('slow', 1, 1))
+        self.assertEqual(randomStats['wins'], 1)
+        self.assertIn('slow ran out of time', output.getvalue())
+
+    def test_remoteException(self):
+        output = io.StringIO()
+        evaluator = TTCEvaluator(ConsoleSink(RESULTS, output), timeControl=TimeControl(totalTime=10.0))
+        stats1, stats2 = evaluator.runAnalysis(BrokenTTCPlayer('broken'), RandomTTCPlayer('random'), 2, 3, 10)
+
+        self.assertEqual(stats1['raised_errors'] + stats2['raised_errors'], 2)
+        self.assertIn('ZeroDivisionError', output.getvalue())
+
+
+class TestLatency(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+        other = LatencyHistogram()
+        other.record(5 * 10 ** 9)
+        histogram.merge(other)
+
+        self.assertEqual(histogram.count, 1001)
+        self.assertEqual(histogram.max, 5 * 10 ** 9)
+        # The percentiles are the limit of their bucket, at most 12.5% above
+        for percent, value in ((50, 501000), (90, 901000), (99, 991000)):
+            self.assertGreaterEqual(histogram.percentile(percent), value)
+            self.assertLessEqual(histogram.percentile(percent), value * 1.125)
+        self.assertEqual(histogram.percentile(100), 5 * 10 ** 9)
+
+        # The last buckets take any value of 64 bits and more
+        for value in (2 ** 63, 2 ** 64 - 1, 2 ** 70):
+            histogram.record(value)
+        self.assertEqual(histogram.counts[-1], 2)
+        self.assertEqual(histogram.max, 2 ** 70)
+
+
+class TestEventLog(unittest.TestCase):
+    def test_quietRun(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            stats1, stats2 = TTCEvaluator(NullSink()).runAnalysis(RandomTTCPlayer('random1'), RandomTTCPlayer('random2'), 2, 3, 10)
+
+        self.assertEqual(output.getvalue(), '')
+        self.assertEqual(stats1['wins'] + stats1['loses'] + stats1['draws'], 2)
+
+    def test_fileSinks(self):
+        board = [[0, 0, 0, 0],
+                 [0, -2, 0, 0],
+                 [0, 0, 0, 0],
+                 [1, 2, 3, 4]]
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+            jsonPath = os.path.join(folder, 'events.ndjson')
+            binaryPath = os.path.join(folder, 'events.bin')
+            with NDJSONSink(jsonPath, RESULTS, batchSize=2) as jsonSink, BinarySink(binaryPath, VERBOSE) as binarySink:
+                for sink in (jsonSink, binarySink):
+                    sink.emit('turn', 'nacho', 1, 5)
+                    sink.emit('win', 'nacho', board)
+                    sink.emit('illegal_move', 'random', -1, board, None)
+
+            with open(jsonPath) as fp:
+                events = [json.loads(line) for line in fp]
+            binaryEvents = list(readBinaryEvents(binaryPath))
+
+        # The turn is only kept by the verbose sink
+        self.assertEqual([event['event'] for event in events], ['win', 'illegal_move'])
+        self.assertEqual(events[0]['board'], board)
+        self.assertEqual(binaryEvents[0], ('turn', ('nacho', 1, 5)))
+        self.assertEqual(binaryEvents[1], ('win', ('nacho', encodeBoard(board))))
+        self.assertEqual(binaryEvents[2][1][0:2], ('random', -1))
+
+    def test_binarySinkBadBoard(self):
+        # Piece codes out of range are written as an invalid board
+        for value in (100, 9):
+            board = [[0, 0, 0, 0],
+                     [0, -2, 0, 0],
+                     [0, 0, 0, 0],
+                     [1, 2, 3, value]]
+            with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+                path = os.path.join(folder, 'events.bin')
+                with BinarySink(path) as sink:
+                    sink.emit('illegal_move', 'broken', 1, board, None)
+                events = list(readBinaryEvents(path))
+
+            self.assertEqual(events[0][0], 'illegal_move')
+            self.assertEqual(events[0][1][2], INVALID_BOARD)
+
+class TestGameRecord(unittest.TestCase):
+    def test_recordAndReplay(self):
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+            path = os.path.join(folder, 'games.rec')
+            with game_record.GameRecordWriter(path) as writer:
+                evaluator = TTCEvaluator(NullSink(), writer)
+                evaluator.runAnalysis(RandomTTCPlayer('random1'), RandomTTCPlayer('random2'), 20, 3, 15, seed='test')
+
+            records = list(game_record.iterGames(path))
+            self.assertEqual(len(records), 20)
+            self.assertEqual(len(game_record.readIndex(path)), 20)
+            self.assertEqual(game_record.readGame(path, 7), records[7])
+            self.assertEqual(game_record.verifyFile(path), [])
+
+        # Games alternate colors and every move takes one byte
+        self.assertEqual((records[0].whiteName, records[1].whiteName), ('random1', 'random2'))
+        self.assertEqual(records[0].seed, 'test')
+        self.assertEqual(len(records[0].encode()), 4 + 8 + 8 + 5 + 7 + len(records[0].moves))
+
+        # The second drop of a piece is not a legal move
+        record = records[0]
+        record.moves = record.moves[:1] + record.moves[:1] + record.moves[2:]
+        self.assertFalse(game_record.verifyGame(record))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
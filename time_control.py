@@ -0,0 +1,208 @@
+"""
+Tic-Tac-Chec time controls
+Chess clock of the referee, and the worker processes that let it stop a bot
+that runs out of time.
+
+A time control is a fixed limit per move, a total budget per player plus an
+increment after every move, or both (the move is then limited by whichever
+is lower):
+
+    TimeControl(moveTime=1.0)
+    TimeControl(totalTime=60.0, increment=0.5)
+
+With a time control every bot plays in its own process (RemotePlayer). When a
+move takes longer than the time the player had, the process is stopped and
+the player loses the game on time. The next game starts a new process from
+the player as it was given to the evaluator.
+
+Before every move the referee sets three attributes of the bot:
+
+    - timeLeft: seconds the bot has for the move, None without time control
+    - clockLeft: seconds left on its clock, None without a total budget
+    - turnsLeft: turns left before the game is a draw, this one included
+
+moveBudget() turns timeLeft into the budget of a search, and ownProcess()
+tells the bot if it plays in its own process.
+"""
+import multiprocessing
+import time
+import traceback
+
+import event_log
+
+# Part of the time left that a search spends at most, the rest is for
+# sending the boards between the processes and stopping the search
+SAFETY_MARGIN = 0.8
+# Seconds a process has to end on its own when it is closed
+CLOSE_TIMEOUT = 1.0
+
+# True in the process of a RemotePlayer, where nothing else runs
+_ownProcess = False
+
+
+class MoveTimeout(Exception):
+    pass
+
+
+class RemoteError(Exception):
+    # Raised by a bot in its process, the message is the traceback there
+    pass
+
+
+class TimeControl:
+    def __init__(self, moveTime=None, totalTime=None, increment=0.0):
+        if moveTime is None and totalTime is None:
+            raise ValueError('A time control needs moveTime or totalTime')
+
+        self.moveTime = moveTime
+        self.totalTime = totalTime
+        self.increment = increment
+
+
+class Clock:
+    # Time left of both players during one game
+    def __init__(self, timeControl):
+        self.timeControl = timeControl
+        self.remaining = {1: timeControl.totalTime, -1: timeControl.totalTime}
+
+    def timeLeft(self, color):
+        # Time the player of the color has for its next move
+        moveTime = self.timeControl.moveTime
+        remaining = self.remaining[color]
+        if remaining is None:
+            return moveTime
+        if moveTime is None:
+            return max(0.0, remaining)
+        return max(0.0, min(moveTime, remaining))
+
+    def clockLeft(self, color):
+        # Time left of the total budget, None if there is none
+        remaining = self.remaining[color]
+        return None if remaining is None else max(0.0, remaining)
+
+    def spend(self, color, seconds):
+        if self.remaining[color] is not None:
+            self.remaining[color] += self.timeControl.increment - seconds
+
+
+def moveBudget(moveTime, timeLeft):
+    # Search budget of a bot that wants moveTime per move
+    if timeLeft is None:
+        return moveTime
+    return min(moveTime, timeLeft * SAFETY_MARGIN)
+
+
+class _PipeSink(event_log.NullSink):
+    # Sends the events of the bot to the evaluator, which reports them
+    def __init__(self, connection):
+        self.connection = connection
+
+    def emit(self, kind, *fields):
+        self.connection.send(('event', kind, fields))
+
+
+def ownProcess():
+    # A bot can only use the time of its opponent when it is alone in its
+    # process, otherwise its threads take the GIL from the opponent
+    return _ownProcess
+
+
+def _runPlayer(player, connection):
+    # Main loop of the process of a player
+    global _ownProcess
+    _ownProcess = True
+    event_log.setActiveSink(_PipeSink(connection))
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+
+        command = request[0]
+        if command == 'close':
+            return
+
+        try:
+            if command == 'play':
+                board, player.timeLeft, player.clockLeft, player.turnsLeft = request[1:]
+                result = player.play(board)
+            elif command == 'reset':
+                result = player.reset()
+            else:
+                result = player.setColor(*request[1:])
+            connection.send(('result', result))
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+
+
+class RemotePlayer:
+    # Has the methods of a player the evaluator uses, the moves are played in
+    # a worker process that is killed if it does not answer in time
+    def __init__(self, player):
+        self.player = player
+        self.name = player.name
+        # Set by the referee before every move and sent with it
+        self.timeLeft = None
+        self.clockLeft = None
+        self.turnsLeft = None
+        self.process = None
+        self.connection = None
+
+    def __start(self):
+        self.connection, childConnection = multiprocessing.Pipe()
+        # Not a daemon, the bot can start its own processes
+        self.process = multiprocessing.Process(target=_runPlayer, args=(self.player, childConnection))
+        self.process.start()
+        childConnection.close()
+
+    def __call(self, timeout, *request):
+        if self.process is None:
+            self.__start()
+
+        end = None if timeout is None else time.perf_counter() + timeout
+        try:
+            self.connection.send(request)
+            while True:
+                wait = None if end is None else max(0.0, end - time.perf_counter())
+                if not self.connection.poll(wait):
+                    self.__kill()
+                    raise MoveTimeout()
+
+                message = self.connection.recv()
+                if message[0] == 'event':
+                    event_log.emit(message[1], *message[2])
+                elif message[0] == 'error':
+                    raise RemoteError(message[1])
+                else:
+                    return message[1]
+        except (EOFError, OSError):
+            self.__kill()
+            raise RemoteError('The process of %s stopped\n' % self.name)
+
+    def reset(self):
+        return self.__call(None, 'reset')
+
+    def setColor(self, color):
+        return self.__call(None, 'setColor', color)
+
+    def play(self, board):
+        return self.__call(self.timeLeft, 'play', board, self.timeLeft, self.clockLeft, self.turnsLeft)
+
+    def close(self):
+        if self.process is None:
+            return
+
+        try:
+            self.connection.send(('close',))
+        except OSError:
+            pass
+        self.process.join(CLOSE_TIMEOUT)
+        self.__kill()
+
+    def __kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
@@ -0,0 +1,77 @@
+"""
+Tic-Tac-Chec time management
+Decides how long a bot thinks about every move and when its iterative
+deepening can stop before the budget is over.
+
+The budget of a move is moveTime, unless there is a clock:
+
+    - with a total budget, the time left on the clock is shared between the
+      turns left before the draw (at most MAX_MOVES_TO_GO of them, it is
+      never worth saving time for moves that far away)
+    - critical positions, when one of the players has 3 pieces aligned, get
+      CRITICAL_FACTOR times the share of the clock
+    - the budget never goes over SAFETY_MARGIN of the time the referee gives
+      for the move
+
+Between iterations the search stops once SOFT_LIMIT of the budget is spent,
+the next iteration would take longer than what is left. When the best move
+has not changed for STABLE_ITERATIONS iterations the soft limit is cut to
+STABLE_SOFT_LIMIT of the budget.
+"""
+from search import Deadline
+from time_control import SAFETY_MARGIN
+
+# Turns left that are assumed when the bot does not know them
+EXPECTED_TURNS_LEFT = 20
+MAX_MOVES_TO_GO = 30
+CRITICAL_FACTOR = 2.0
+
+SOFT_LIMIT = 0.5
+STABLE_ITERATIONS = 3
+STABLE_SOFT_LIMIT = 0.2
+
+
+class TimeManager:
+    def __init__(self, moveTime):
+        self.moveTime = moveTime
+        self.deadline = Deadline(float('inf'))
+        self.budget = moveTime
+        self.bestMove = None
+        self.stableIterations = 0
+
+    def allocate(self, timeLeft=None, clockLeft=None, turnsLeft=None, critical=False):
+        # Seconds for the next move. timeLeft is the time for the move,
+        # clockLeft the total time left on the clock, turnsLeft the turns
+        # before the draw (None when not known)
+        budget = self.moveTime
+        if clockLeft is not None:
+            movesToGo = EXPECTED_TURNS_LEFT if turnsLeft is None else turnsLeft
+            movesToGo = max(1, min(movesToGo, MAX_MOVES_TO_GO))
+            budget = min(budget, clockLeft / movesToGo)
+            # Only a clock has time to spare for the critical moves, without
+            # one every move gets moveTime
+            if critical:
+                budget *= CRITICAL_FACTOR
+        if timeLeft is not None:
+            budget = min(budget, timeLeft * SAFETY_MARGIN)
+
+        return max(0.0, budget)
+
+    def startMove(self, budget, checkEvery):
+        # Returns the deadline of the search of the move
+        self.budget = budget
+        self.deadline = Deadline(budget, checkEvery)
+        self.bestMove = None
+        self.stableIterations = 0
+        return self.deadline
+
+    def shouldStop(self, move, score, depth):
+        # Called by iterativeDeepening after every iteration that finished
+        if move == self.bestMove:
+            self.stableIterations += 1
+        else:
+            self.bestMove = move
+            self.stableIterations = 1
+
+        softLimit = STABLE_SOFT_LIMIT if self.stableIterations >= STABLE_ITERATIONS else SOFT_LIMIT
+        return self.deadline.elapsed() >= softLimit * self.budget
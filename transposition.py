@@ -0,0 +1,129 @@
+"""
+Tic-Tac-Chec transposition table
+Bounded table keyed by the Zobrist hash of a GameState that remembers the
+result of the positions already searched.
+
+Each entry stores the remaining depth of the search, the score, the bound
+type of the score and the best move. The table is a fixed number of buckets
+with two slots each:
+
+    - slot 0 is depth-preferred: it is only replaced by a search of the same
+      position, by a search at least as deep or when its entry is stale
+    - slot 1 is always-replace: it keeps the last entry that did not fit in slot 0
+
+The table can be kept between moves and games. Every entry has the age of
+the search that stored it, newSearch() starts a new age, and the entries of
+older searches are still used but are the first to be replaced. An entry
+that is found again takes the current age.
+
+Keys and entries are kept in two flat arrays of 64-bit integers, so the
+memory used is fixed when the table is created (16 bytes per slot).
+
+Entry layout:
+
+    bit   0      the slot is used
+    bits  1..2   bound type
+    bits  3..10  remaining depth (0..255)
+    bits 11..18  best move, 0 if there is none
+    bits 19..34  score + 32768
+    bits 35..40  age of the search that stored it
+"""
+from array import array
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+SLOT_SIZE = 16
+SLOTS_PER_BUCKET = 2
+DEFAULT_SIZE_MB = 8
+
+MAX_DEPTH = 255
+SCORE_OFFSET = 1 << 15
+AGE_SHIFT = 35
+AGE_MASK = 0x3F
+
+
+def fromChild(score):
+    # Scores are relative to the node that returns them. A parent moves the
+    # score of a child one point towards 0, so faster wins and slower losses
+    # are preferred, and a stored score is valid at any distance from the root.
+    if score > 0:
+        return score - 1
+    if score < 0:
+        return score + 1
+    return 0
+
+
+def childWindow(alpha, beta):
+    # Alpha-beta window for the search of a child, so that the score of the
+    # child after fromChild gives the same cutoffs as the window of the parent
+    return (alpha + 1 if alpha > 0 else alpha - 1 if alpha < 0 else 1,
+            beta + 1 if beta > 0 else beta - 1 if beta < 0 else -1)
+
+
+def boundOf(score, alpha, beta):
+    # Bound type of a score returned by an alpha-beta search with the window (alpha, beta)
+    if score <= alpha:
+        return UPPER_BOUND
+    if score >= beta:
+        return LOWER_BOUND
+    return EXACT
+
+
+class TranspositionTable:
+    def __init__(self, sizeMB=DEFAULT_SIZE_MB):
+        self.bucketCount = max(1, int(sizeMB * (1 << 20)) // (SLOT_SIZE * SLOTS_PER_BUCKET))
+        self.keys = array('Q', bytes(8 * SLOTS_PER_BUCKET * self.bucketCount))
+        self.entries = array('Q', bytes(8 * SLOTS_PER_BUCKET * self.bucketCount))
+
+        self.age = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * SLOTS_PER_BUCKET * self.bucketCount))
+        self.entries = array('Q', bytes(8 * SLOTS_PER_BUCKET * self.bucketCount))
+        self.age = 0
+
+    def newSearch(self):
+        # Called before the search of every move, the entries kept so far become stale
+        self.age = (self.age + 1) & AGE_MASK
+
+    def probe(self, key):
+        # Returns (depth, score, bound, move) of the position or None
+        self.probes += 1
+        slot = (key % self.bucketCount) * SLOTS_PER_BUCKET
+        for index in (slot, slot + 1):
+            entry = self.entries[index]
+            if entry and self.keys[index] == key:
+                self.hits += 1
+                if (entry >> AGE_SHIFT) != self.age:
+                    entry = (entry & ~(AGE_MASK << AGE_SHIFT)) | (self.age << AGE_SHIFT)
+                    self.entries[index] = entry
+                return ((entry >> 3) & 0xFF, ((entry >> 19) & 0xFFFF) - SCORE_OFFSET,
+                        (entry >> 1) & 3, (entry >> 11) & 0xFF)
+
+        return None
+
+    def store(self, key, depth, score, bound, move=0):
+        self.stores += 1
+        entry = (1 | (bound << 1) | (min(depth, MAX_DEPTH) << 3) | ((move or 0) << 11)
+                 | ((score + SCORE_OFFSET) << 19) | (self.age << AGE_SHIFT))
+
+        slot = (key % self.bucketCount) * SLOTS_PER_BUCKET
+        stored = self.entries[slot]
+        if (not stored or self.keys[slot] == key or (stored >> AGE_SHIFT) != self.age
+                or depth >= (stored >> 3) & 0xFF):
+            index = slot
+        else:
+            index = slot + 1
+
+        self.keys[index] = key
+        self.entries[index] = entry
+
+    def usage(self):
+        # Fraction of the slots in use
+        return sum(1 for entry in self.entries if entry) / len(self.entries)